@@ -0,0 +1,642 @@
+"""
+Medical QA System - Micro-benchmarks
+Run from the repository root, e.g.:
+
+    python src/medical_qa_benchmarks.py moe
+    python src/medical_qa_benchmarks.py router --checkpoint medical_qa_v1.0
+    python src/medical_qa_benchmarks.py importtime --budget-ms 300
+    python src/medical_qa_benchmarks.py hybrid --queries 200
+    python src/medical_qa_benchmarks.py duplicates --queries 200 --k 5
+    python src/medical_qa_benchmarks.py search --fanouts 2 3 5 --workers 4
+    python src/medical_qa_benchmarks.py rerank --cross-encoder models/ms-marco-MiniLM-L-6-v2
+    python src/medical_qa_benchmarks.py keywords --query-log queries.txt
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def time_call(fn, repeats=5, warmup=1):
+    """Return the best wall-clock time (seconds) of `fn()` over `repeats` runs"""
+    for _ in range(warmup):
+        fn()
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# ============================================================================
+# BENCHMARK: MoE EXPERT MIXING (loop vs vectorized)
+# ============================================================================
+
+def benchmark_moe(batch_sizes=(1, 64, 4096), num_experts=5, repeats=5):
+    """Compare the per-row loop and vectorized MedicalMoE mixing paths"""
+    import torch
+    from medical_qa_models import MedicalMoE
+
+    print("="*70)
+    print("⏱️ MedicalMoE.forward: loop vs vectorized")
+    print("="*70)
+
+    torch.manual_seed(0)
+    model = MedicalMoE(num_experts=num_experts, top_k=2)
+    model.eval()
+
+    results = []
+    for batch_size in batch_sizes:
+        x = torch.randn(batch_size, 384)
+
+        with torch.no_grad():
+            model.vectorized = False
+            loop_out, loop_idx = model(x)
+            loop_time = time_call(lambda: model(x), repeats=repeats)
+
+            model.vectorized = True
+            vec_out, vec_idx = model(x)
+            vec_time = time_call(lambda: model(x), repeats=repeats)
+
+        same_indices = torch.equal(loop_idx, vec_idx)
+        max_diff = (loop_out - vec_out).abs().max().item()
+        if not same_indices or not torch.allclose(loop_out, vec_out, rtol=1e-5, atol=1e-6):
+            raise AssertionError(f"Vectorized output diverged at batch {batch_size} (max diff {max_diff:.2e})")
+
+        print(f"  batch={batch_size:<6} loop={loop_time * 1000:9.2f} ms   "
+              f"vectorized={vec_time * 1000:8.2f} ms   "
+              f"speedup={loop_time / vec_time:7.1f}x   max|diff|={max_diff:.1e}")
+        results.append({
+            "batch_size": batch_size,
+            "loop_s": loop_time,
+            "vectorized_s": vec_time,
+            "max_abs_diff": max_diff,
+        })
+
+    return results
+
+
+# ============================================================================
+# BENCHMARK: ROUTER (torch module vs NumPy gating)
+# ============================================================================
+
+def benchmark_router(batch_sizes=(1, 32, 1024), num_experts=5, repeats=200):
+    """route_queries through the MoE module vs the exported NumPy gating network"""
+    import numpy as np
+    import torch
+    from medical_qa_inference import route_queries
+    from medical_qa_models import MedicalMoE
+    from medical_qa_router import GatingRouter
+
+    print("="*70)
+    print("⏱️ route_queries: torch MoE module vs NumPy gating")
+    print("="*70)
+
+    torch.manual_seed(0)
+    model = MedicalMoE(num_experts=num_experts, top_k=2)
+    model.eval()
+    label_to_domain = {i: f"domain{i}" for i in range(num_experts)}
+    torch_system = {'moe_model': model, 'label_to_domain': label_to_domain}
+    numpy_system = {'router': GatingRouter.from_moe(model), 'label_to_domain': label_to_domain}
+
+    rng = np.random.RandomState(0)
+    results = []
+    for batch_size in batch_sizes:
+        x = rng.randn(batch_size, 384).astype(np.float32)
+        x /= np.linalg.norm(x, axis=1, keepdims=True)
+        torch_routes = route_queries(x, torch_system)
+        numpy_routes = route_queries(x, numpy_system)
+        agreement = np.mean([a[0] == b[0] for a, b in zip(torch_routes, numpy_routes)])
+        max_diff = max(abs(p - q) for a, b in zip(torch_routes, numpy_routes) for p, q in zip(a[1], b[1]))
+
+        n = max(1, repeats // batch_size)
+        torch_time = time_call(lambda: route_queries(x, torch_system), repeats=n)
+        numpy_time = time_call(lambda: route_queries(x, numpy_system), repeats=n)
+        print(f"  batch={batch_size:<5} torch={torch_time * 1e6:9.1f} µs   numpy={numpy_time * 1e6:9.1f} µs   "
+              f"speedup={torch_time / numpy_time:5.1f}x   same domains={agreement:.1%}   max|Δp|={max_diff:.1e}")
+        results.append({"batch_size": batch_size, "torch_s": torch_time, "numpy_s": numpy_time,
+                        "agreement": float(agreement), "max_prob_diff": max_diff})
+    return results
+
+
+def benchmark_fanout(system, masses=(None, 0.6, 0.7, 0.8, 0.9), num_queries=500, max_fanout=2):
+    """
+    Searches saved vs routing recall as fanout_mass varies
+
+    Queries are questions from the checkpoint's own documents; "recall" is
+    the share routed to (at least) the domain the question came from.
+    Searches saved are counted against always searching the top 2 domains.
+    """
+    import numpy as np
+    from medical_qa_inference import route_queries
+    from medical_qa_router import FanoutStats
+
+    samples = sample_domain_questions(system, num_queries)
+    query_embs = system['embedder'].encode([q for q, _, _ in samples], convert_to_numpy=True).astype(np.float32)
+
+    print("="*70)
+    print(f"🧭 fanout_mass sweep ({len(samples)} queries, max_fanout={max_fanout})")
+    print("="*70)
+
+    keys = ('fanout_mass', 'min_fanout', 'max_fanout', 'fanout_stats')
+    original = {key: system.get(key) for key in keys}
+    results = []
+    try:
+        system['min_fanout'], system['max_fanout'] = 1, max_fanout
+        for mass in masses:
+            system['fanout_mass'] = mass
+            system['fanout_stats'] = FanoutStats(baseline=min(2, len(system['label_to_domain'])))
+            routes = route_queries(query_embs, system)
+            stats = system['fanout_stats'].stats()
+            recall = np.mean([domain in domains for (domains, _), (_, domain, _) in zip(routes, samples)])
+            single = np.mean([len(domains) == 1 for domains, _ in routes])
+            label = "off" if mass is None else f"{mass:.2f}"
+            print(f"  mass={label:<5} single-domain={single:6.1%}   FAISS searches/query={stats['mean_fanout']:.2f}   "
+                  f"saved={stats['saved_fraction']:+6.1%}   routing recall={recall:.1%}")
+            results.append({"fanout_mass": mass, "single_domain": float(single), "recall": float(recall), **stats})
+    finally:
+        system.update(original)
+    return results
+
+
+# ============================================================================
+# BENCHMARK: IMPORT TIME
+# ============================================================================
+
+# Modules that must stay importable without loading any model library
+LIGHT_MODULES = ("medical_qa_scoring", "medical_qa_text", "medical_qa_inference")
+HEAVY_PACKAGES = ("torch", "faiss", "sentence_transformers", "transformers")
+
+
+def measure_import(module, repeats=3):
+    """
+    Import `module` in fresh interpreters under `python -X importtime`
+
+    Returns (best cumulative seconds, sorted list of top-level packages it
+    pulled in). The first run also warms the bytecode cache.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")])))
+
+    best = float('inf')
+    packages = set()
+    for _ in range(repeats + 1):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+        cumulative = None
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cum_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+            if not cum_us.isdigit():
+                continue        # header row
+            packages.add(name.split(".")[0])
+            if name == module:
+                cumulative = int(cum_us) / 1e6
+        if cumulative is not None:
+            best = min(best, cumulative)
+
+    return best, sorted(packages)
+
+
+def benchmark_importtime(modules=LIGHT_MODULES, budget_ms=None, repeats=3):
+    """Fail if a light module imports a model library or exceeds budget_ms"""
+
+    print("="*70)
+    print("⏱️ Import time (python -X importtime, best of fresh interpreters)")
+    print("="*70)
+
+    failures = []
+    results = []
+    for module in modules:
+        seconds, packages = measure_import(module, repeats=repeats)
+        heavy = [p for p in HEAVY_PACKAGES if p in packages]
+        over_budget = budget_ms is not None and seconds * 1000 > budget_ms
+
+        status = "✅"
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)}")
+            status = "❌"
+        if over_budget:
+            failures.append(f"{module} took {seconds * 1000:.1f} ms (budget {budget_ms} ms)")
+            status = "❌"
+        print(f"  {status} {module:<28} {seconds * 1000:8.1f} ms   heavy={heavy or '-'}")
+        results.append({"module": module, "seconds": seconds, "heavy_imports": heavy})
+
+    if failures:
+        raise AssertionError("Import-time budget violated: " + "; ".join(failures))
+    return results
+
+
+# ============================================================================
+# BENCHMARK: DENSE vs HYBRID RETRIEVAL
+# ============================================================================
+
+def sample_domain_questions(system, num_queries, seed=0):
+    """(question, domain, answer) triples drawn evenly from the loaded domains"""
+    import random
+
+    rng = random.Random(seed)
+    vector_dbs = system['vector_dbs']
+    domains = sorted(vector_dbs)
+    samples = []
+    for i in range(num_queries):
+        domain = domains[i % len(domains)]
+        _, docs = vector_dbs[domain]
+        doc = docs[rng.randrange(len(docs))]
+        samples.append((doc["question"], domain, doc["answer"]))
+    return samples
+
+
+def benchmark_hybrid(system, num_queries=200, k=5):
+    """
+    Per-query search latency of dense-only vs hybrid (dense + BM25, RRF)
+
+    Queries are questions sampled from the checkpoint's own documents, so
+    "self-recall@k" (the source answer is among the candidates) doubles as
+    a quick quality check.
+    """
+    import numpy as np
+    from medical_qa_inference import route_queries, search_candidates, select_best_answer
+
+    if not system.get('sparse_indexes'):
+        raise ValueError("No BM25 indexes loaded (build them with medical_qa_bm25.py, load with retrieval_mode='hybrid')")
+
+    samples = sample_domain_questions(system, num_queries)
+    queries = [q for q, _, _ in samples]
+    query_embs = system['embedder'].encode(queries, convert_to_numpy=True).astype(np.float32)
+    routes = route_queries(query_embs, system)
+
+    print("="*70)
+    print(f"⏱️ Retrieval: dense vs hybrid ({len(queries)} queries, k={k})")
+    print("="*70)
+
+    original_mode = system.get('retrieval_mode')
+    results = {}
+    try:
+        for mode in ("dense", "hybrid"):
+            system['retrieval_mode'] = mode
+            search_times = []
+            total_times = []
+            recalled = 0
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                candidates = search_candidates(query_embs[i:i + 1], routes[i:i + 1], system, k, [query])[0]
+                searched = time.perf_counter()
+                select_best_answer(query, candidates, routes[i][0])
+                done = time.perf_counter()
+
+                search_times.append(searched - start)
+                total_times.append(done - start)
+                recalled += any(c["answer"] == samples[i][2] for c in candidates)
+
+            search_times.sort()
+            total_times.sort()
+            results[mode] = {
+                "search_p50_ms": percentile(search_times, 50) * 1000,
+                "search_p95_ms": percentile(search_times, 95) * 1000,
+                "total_p50_ms": percentile(total_times, 50) * 1000,
+                "total_p95_ms": percentile(total_times, 95) * 1000,
+                "self_recall": recalled / len(queries),
+            }
+            r = results[mode]
+            print(f"  {mode:<7} search p50={r['search_p50_ms']:6.2f} ms p95={r['search_p95_ms']:6.2f} ms   "
+                  f"search+rerank p50={r['total_p50_ms']:6.2f} ms p95={r['total_p95_ms']:6.2f} ms   "
+                  f"self-recall@{k}={r['self_recall']:.1%}")
+    finally:
+        system['retrieval_mode'] = original_mode
+
+    return results
+
+
+def benchmark_duplicates(system, num_queries=200, k=5):
+    """
+    Candidate diversity and latency with and without near-duplicate collapsing
+
+    "distinct" counts candidates per query after grouping them the way
+    collapse_candidates does (same cluster, or identical answer words).
+    """
+    import numpy as np
+    from medical_qa_inference import collapse_candidates, route_queries, search_candidates, select_best_answer
+
+    samples = sample_domain_questions(system, num_queries)
+    queries = [q for q, _, _ in samples]
+    query_embs = system['embedder'].encode(queries, convert_to_numpy=True).astype(np.float32)
+    routes = route_queries(query_embs, system)
+
+    print("="*70)
+    print(f"⏱️ Near-duplicate collapsing ({len(queries)} queries, k={k}, "
+          f"{system.get('retrieval_mode', 'dense')} retrieval)")
+    print("="*70)
+
+    original = system.get('collapse_duplicates', False)
+    results = {}
+    try:
+        for collapse in (False, True):
+            system['collapse_duplicates'] = collapse
+            total_times = []
+            num_candidates = 0
+            num_distinct = 0
+            with_duplicates = 0
+            recalled = 0
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                candidates = search_candidates(query_embs[i:i + 1], routes[i:i + 1], system, k, [query])[0]
+                select_best_answer(query, candidates, routes[i][0])
+                total_times.append(time.perf_counter() - start)
+
+                distinct = len(collapse_candidates(candidates))
+                num_candidates += len(candidates)
+                num_distinct += distinct
+                with_duplicates += distinct < len(candidates)
+                recalled += any(c["answer"] == samples[i][2] for c in candidates)
+
+            total_times.sort()
+            label = "collapsed" if collapse else "baseline"
+            results[label] = {
+                "candidates": num_candidates / len(queries),
+                "distinct": num_distinct / len(queries),
+                "queries_with_duplicates": with_duplicates / len(queries),
+                "total_p50_ms": percentile(total_times, 50) * 1000,
+                "total_p95_ms": percentile(total_times, 95) * 1000,
+                "self_recall": recalled / len(queries),
+            }
+            r = results[label]
+            print(f"  {label:<9} candidates={r['candidates']:5.2f} distinct={r['distinct']:5.2f} "
+                  f"with duplicates={r['queries_with_duplicates']:6.1%}   "
+                  f"search+rerank p50={r['total_p50_ms']:6.2f} ms p95={r['total_p95_ms']:6.2f} ms   "
+                  f"self-recall@{k}={r['self_recall']:.1%}")
+    finally:
+        system['collapse_duplicates'] = original
+
+    return results
+
+
+# ============================================================================
+# BENCHMARK: CROSS-ENCODER RERANKING
+# ============================================================================
+
+def benchmark_rerank(system, reranker, candidate_counts=(5, 10, 20, 40), num_queries=50):
+    """
+    Latency llm_rerank vs cross-encoder reranking adds per query, by
+    number of candidates scored (cold pair cache, then warm)
+    """
+    import numpy as np
+    from medical_qa_inference import candidate_similarity, route_queries, search_candidates
+    from medical_qa_scoring import llm_rerank
+
+    samples = sample_domain_questions(system, num_queries)
+    queries = [q for q, _, _ in samples]
+    query_embs = system['embedder'].encode(queries, convert_to_numpy=True).astype(np.float32)
+    routes = route_queries(query_embs, system)
+
+    print("="*70)
+    print(f"⚖️ Reranking latency per query ({len(queries)} queries, {os.cpu_count()} cores)")
+    print("="*70)
+
+    results = []
+    for count in candidate_counts:
+        candidates = [c[:count] for c in search_candidates(query_embs, routes, system, count, queries)]
+        num_candidates = np.mean([len(c) for c in candidates])
+
+        def heuristic():
+            for query, cands in zip(queries, candidates):
+                llm_rerank(query, [c["answer"] for c in cands], [candidate_similarity(c) for c in cands],
+                           top_n=None, candidate_terms=[c.get("terms") for c in cands])
+
+        def cross_encoder():
+            for query, cands in zip(queries, candidates):
+                reranker.rerank(query, cands, budget_ms=0)
+
+        heuristic_time = time_call(heuristic, repeats=3) / len(queries)
+        reranker.cache.clear()
+        start = time.perf_counter()
+        cross_encoder()
+        cold_time = (time.perf_counter() - start) / len(queries)
+        warm_time = time_call(cross_encoder, repeats=3, warmup=0) / len(queries)
+        print(f"  candidates={num_candidates:5.1f}   heuristic={heuristic_time * 1e3:7.2f} ms   "
+              f"cross-encoder cold={cold_time * 1e3:8.2f} ms ({(cold_time - heuristic_time) * 1e3 / num_candidates:6.2f} ms/candidate added)   "
+              f"warm={warm_time * 1e3:6.2f} ms")
+        results.append({"candidates": float(num_candidates), "heuristic_s": heuristic_time,
+                        "cold_s": cold_time, "warm_s": warm_time})
+    return results
+
+
+# ============================================================================
+# BENCHMARK: SEQUENTIAL vs PARALLEL PER-DOMAIN SEARCH
+# ============================================================================
+
+def benchmark_parallel_search(fanouts=(2, 3, 5), workers=4, num_docs=50000, dim=384, batch_sizes=(1, 32),
+                              k=5, repeats=20):
+    """
+    search_candidates latency with the domains searched one after another
+    vs on a SearchPool, for queries routed to `fanout` domains
+
+    Uses synthetic flat indexes of num_docs random vectors per domain, so
+    it runs without a checkpoint.
+    """
+    import faiss
+    import numpy as np
+    from medical_qa_inference import SearchPool, search_candidates
+
+    print("="*70)
+    print(f"🔀 Per-domain search: sequential vs SearchPool({workers}) "
+          f"({num_docs} x {dim}d docs per domain, {os.cpu_count()} cores)")
+    print("="*70)
+
+    rng = np.random.RandomState(0)
+    vector_dbs = {}
+    for i in range(max(fanouts)):
+        index = faiss.IndexFlatL2(dim)
+        index.add(rng.rand(num_docs, dim).astype(np.float32))
+        vector_dbs[f"Domain{i}"] = (index, [{"answer": ""}] * num_docs)
+    domains = list(vector_dbs)
+
+    omp_threads = faiss.omp_get_max_threads()
+    pool = SearchPool(workers)
+    # the cap must reach the threads that search, not only this one
+    worker_threads = pool.worker_omp_threads()
+    if worker_threads != pool.omp_threads:
+        pool.shutdown()
+        raise AssertionError(f"search pool workers run {worker_threads} OpenMP threads, "
+                             f"expected {pool.omp_threads}")
+    print(f"  OpenMP threads per search: {worker_threads} in the pool, {omp_threads} sequential")
+    results = []
+    try:
+        for batch_size in batch_sizes:
+            query_embs = rng.rand(batch_size, dim).astype(np.float32)
+            for fanout in fanouts:
+                routes = [(domains[:fanout], [1.0 / fanout] * fanout)] * batch_size
+                sequential = {'vector_dbs': vector_dbs}
+                parallel = {'vector_dbs': vector_dbs, 'search_pool': pool}
+                # sequential searches run here, with the full team; the pool's workers are capped
+                faiss.omp_set_num_threads(omp_threads)
+                sequential_time = time_call(lambda: search_candidates(query_embs, routes, sequential, k), repeats)
+                parallel_time = time_call(lambda: search_candidates(query_embs, routes, parallel, k), repeats)
+                print(f"  batch={batch_size:<4} domains={fanout}   sequential={sequential_time * 1e3:8.2f} ms   "
+                      f"parallel={parallel_time * 1e3:8.2f} ms   speedup={sequential_time / parallel_time:4.2f}x")
+                results.append({"batch_size": batch_size, "fanout": fanout,
+                                "sequential_s": sequential_time, "parallel_s": parallel_time})
+    finally:
+        pool.shutdown()
+        faiss.omp_set_num_threads(omp_threads)
+    return results
+
+
+# ============================================================================
+# BENCHMARK: KEYWORD MATCHING (substring loops vs compiled matchers)
+# ============================================================================
+
+def load_query_log(path=None, datasets="DataSets"):
+    """Questions from a text/JSONL query log, or every question in the dataset CSVs"""
+    if path:
+        from medical_qa_loadtest import load_queries
+        return load_queries(path)
+    import glob
+    from medical_qa_build import iter_csv_rows
+    from medical_qa_loadtest import SAMPLE_QUERIES
+    return [row["question"] for row in iter_csv_rows(sorted(glob.glob(os.path.join(datasets, "*.csv"))))] \
+        + SAMPLE_QUERIES
+
+
+def benchmark_keywords(queries, repeats=3):
+    """
+    Per-query cost of the conversation keyword checks: one `in` test per
+    keyword (scan_categories, the old loops) vs the compiled KeywordMatchers
+
+    Every query's category hits are checked to be identical first.
+    """
+    from medical_qa_conversation import DOMAIN_KEYWORDS, DOMAIN_MATCHER, QUERY_MATCHER
+    from medical_qa_keywords import scan_categories
+
+    lowered = [q.lower() for q in queries]
+    print("="*70)
+    print(f"🔤 Keyword matching over {len(lowered)} queries "
+          f"({sum(len(k) for k in QUERY_MATCHER.categories.values())} medical/non-medical keywords, "
+          f"{sum(len(k) for k in DOMAIN_KEYWORDS.values())} domain keywords)")
+    print("="*70)
+
+    for matcher in (QUERY_MATCHER, DOMAIN_MATCHER):
+        mismatches = [q for q in lowered if matcher.category_hits(q) != scan_categories(matcher.categories, q)]
+        if mismatches:
+            raise AssertionError(f"{len(mismatches)} queries differ, e.g. {mismatches[0]!r}")
+
+    results = []
+    for name, matcher in (("is_medical_query", QUERY_MATCHER), ("domain detection", DOMAIN_MATCHER)):
+        loop_time = time_call(lambda: [scan_categories(matcher.categories, q) for q in lowered], repeats)
+        compiled_time = time_call(lambda: [matcher.category_hits(q) for q in lowered], repeats)
+        print(f"  {name:<18} loops={loop_time / len(lowered) * 1e6:7.2f} us/query   "
+              f"compiled={compiled_time / len(lowered) * 1e6:7.2f} us/query   "
+              f"speedup={loop_time / compiled_time:5.2f}x")
+        results.append({"check": name, "loop_s": loop_time, "compiled_s": compiled_time})
+    print(f"  ✅ identical category hits for all {len(lowered)} queries")
+    return results
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Medical QA micro-benchmarks")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    moe = sub.add_parser("moe", help="MoE loop vs vectorized expert mixing")
+    moe.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 4096])
+    moe.add_argument("--repeats", type=int, default=5)
+
+    router = sub.add_parser("router", help="torch vs NumPy routing, and adaptive fan-out")
+    router.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 1024])
+    router.add_argument("--checkpoint", help="also sweep fanout_mass on this checkpoint")
+    router.add_argument("--masses", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9])
+    router.add_argument("--max-fanout", type=int, default=2)
+    router.add_argument("--queries", type=int, default=500)
+
+    importtime = sub.add_parser("importtime", help="import cost of the model-free modules")
+    importtime.add_argument("--modules", nargs="+", default=list(LIGHT_MODULES))
+    importtime.add_argument("--budget-ms", type=float, default=500.0,
+                            help="max cumulative import time per module")
+    importtime.add_argument("--repeats", type=int, default=3)
+
+    hybrid = sub.add_parser("hybrid", help="dense-only vs hybrid BM25+dense retrieval latency")
+    hybrid.add_argument("--checkpoint", default="medical_qa_v1.0")
+    hybrid.add_argument("--queries", type=int, default=200)
+    hybrid.add_argument("--k", type=int, default=5)
+
+    duplicates = sub.add_parser("duplicates", help="candidate diversity with near-duplicate collapsing")
+    duplicates.add_argument("--checkpoint", default="medical_qa_v1.0")
+    duplicates.add_argument("--retrieval-mode", choices=["dense", "hybrid"], default="dense")
+    duplicates.add_argument("--queries", type=int, default=200)
+    duplicates.add_argument("--k", type=int, default=5)
+
+    search = sub.add_parser("search", help="sequential vs parallel per-domain FAISS search")
+    search.add_argument("--fanouts", type=int, nargs="+", default=[2, 3, 5])
+    search.add_argument("--workers", type=int, default=4)
+    search.add_argument("--docs", type=int, default=50000, help="synthetic documents per domain")
+    search.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32])
+
+    rerank = sub.add_parser("rerank", help="latency added by cross-encoder reranking per candidate count")
+    rerank.add_argument("--checkpoint", default="medical_qa_v1.0")
+    rerank.add_argument("--cross-encoder", required=True, help="local cross-encoder directory")
+    rerank.add_argument("--counts", type=int, nargs="+", default=[5, 10, 20, 40])
+    rerank.add_argument("--queries", type=int, default=50)
+
+    keywords = sub.add_parser("keywords", help="substring loops vs compiled keyword matchers")
+    keywords.add_argument("--query-log", help="text or JSONL file of queries (default: dataset questions)")
+    keywords.add_argument("--repeats", type=int, default=3)
+
+    args = parser.parse_args()
+
+    if args.benchmark == "moe":
+        benchmark_moe(tuple(args.batch_sizes), repeats=args.repeats)
+    elif args.benchmark == "router":
+        benchmark_router(tuple(args.batch_sizes))
+        if args.checkpoint:
+            from medical_qa_inference import load_complete_system
+            system = load_complete_system(args.checkpoint, verbose=False)
+            benchmark_fanout(system, [None] + args.masses, args.queries, args.max_fanout)
+    elif args.benchmark == "hybrid":
+        from medical_qa_inference import load_complete_system
+        system = load_complete_system(args.checkpoint, retrieval_mode="hybrid", verbose=False)
+        benchmark_hybrid(system, args.queries, args.k)
+    elif args.benchmark == "duplicates":
+        from medical_qa_inference import load_complete_system
+        system = load_complete_system(args.checkpoint, retrieval_mode=args.retrieval_mode, verbose=False)
+        benchmark_duplicates(system, args.queries, args.k)
+    elif args.benchmark == "rerank":
+        from medical_qa_inference import load_complete_system
+        system = load_complete_system(args.checkpoint, cross_encoder=args.cross_encoder, verbose=False)
+        benchmark_rerank(system, system['reranker'], tuple(args.counts), args.queries)
+    elif args.benchmark == "search":
+        benchmark_parallel_search(tuple(args.fanouts), args.workers, args.docs, batch_sizes=tuple(args.batch_sizes))
+    elif args.benchmark == "keywords":
+        benchmark_keywords(load_query_log(args.query_log), args.repeats)
+    elif args.benchmark == "importtime":
+        try:
+            benchmark_importtime(args.modules, args.budget_ms, args.repeats)
+        except AssertionError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Medical QA System - Sparse (BM25) retrieval
+Per-domain inverted index over the same documents as the FAISS indexes,
+fused with the dense hits by reciprocal rank (hybrid retrieval mode)
+
+Files per domain (next to {domain}_index.faiss):
+    {domain}_bm25.json           header: k1, b, num_docs, avgdl, format version
+    {domain}_bm25.terms.npy      int64 sorted term ids (medical_qa_scoring.term_id)
+    {domain}_bm25.offsets.npy    int64 postings offsets, (num_terms + 1,)
+    {domain}_bm25.postings.npy   int32 doc ids, grouped by term
+    {domain}_bm25.weights.npy    float32 BM25 weight of each posting
+
+Postings store the full BM25 term weight (idf * saturated tf with length
+normalization) computed at build time, so a query is a few memory-mapped
+slices plus one bincount. Changing k1/b means rebuilding. The header
+records the DocStore id_epoch it was built from; a BM25 index from an
+older epoch (before a compaction renumbered the documents) is ignored.
+
+Usage (build for every domain of a checkpoint):
+    python src/medical_qa_bm25.py medical_qa_checkpoints/medical_qa_v1.0
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from medical_qa_scoring import term_id
+
+
+BM25_FORMAT_VERSION = 1
+BM25_FIELDS = ("question", "answer")
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+RRF_K = 60
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+
+
+def tokenize(text):
+    """Lowercased alphanumeric tokens (keeps names like 'beta-blocker' or 'alzheimer's' whole)"""
+    return _TOKEN.findall(text.lower())
+
+
+def bm25_paths(faiss_dir, domain):
+    """Return (header, terms, offsets, postings, weights) paths for a domain"""
+    base = os.path.join(faiss_dir, f"{domain}_bm25")
+    return (f"{base}.json", f"{base}.terms.npy", f"{base}.offsets.npy",
+            f"{base}.postings.npy", f"{base}.weights.npy")
+
+
+def bm25_exists(faiss_dir, domain):
+    return all(os.path.exists(p) for p in bm25_paths(faiss_dir, domain))
+
+
+# ============================================================================
+# READER
+# ============================================================================
+
+class BM25Index:
+    """Memory-mapped BM25 postings for one domain"""
+
+    def __init__(self, faiss_dir, domain):
+        header_path, terms_path, offsets_path, postings_path, weights_path = bm25_paths(faiss_dir, domain)
+
+        with open(header_path) as f:
+            header = json.load(f)
+        if header.get("format_version") != BM25_FORMAT_VERSION:
+            raise ValueError(f"Unsupported BM25 index version in {header_path}: {header.get('format_version')}")
+
+        self.domain = domain
+        self.header = header
+        self.num_docs = int(header["num_docs"])
+        self.id_epoch = int(header.get("id_epoch", 0))
+
+        self.terms = np.load(terms_path, mmap_mode='r', allow_pickle=False)
+        self.offsets = np.load(offsets_path, mmap_mode='r', allow_pickle=False)
+        self.postings = np.load(postings_path, mmap_mode='r', allow_pickle=False)
+        self.weights = np.load(weights_path, mmap_mode='r', allow_pickle=False)
+        if self.offsets.shape != (len(self.terms) + 1,) or self.postings.shape != self.weights.shape:
+            raise ValueError(f"Corrupt BM25 index for {domain} in {faiss_dir}")
+
+    def scores(self, query):
+        """Dense (num_docs,) array of BM25 scores for a query"""
+        query_ids = np.unique(np.fromiter((term_id(t) for t in set(tokenize(query))), dtype=np.int64))
+        pos = np.searchsorted(self.terms, query_ids)
+        found = pos < len(self.terms)
+        found[found] = self.terms[pos[found]] == query_ids[found]
+
+        doc_ids = []
+        weights = []
+        for p in pos[found]:
+            start, end = int(self.offsets[p]), int(self.offsets[p + 1])
+            doc_ids.append(self.postings[start:end])
+            weights.append(self.weights[start:end])
+        if not doc_ids:
+            return np.zeros(self.num_docs, dtype=np.float64)
+        return np.bincount(np.concatenate(doc_ids), weights=np.concatenate(weights), minlength=self.num_docs)
+
+    def search(self, query, k, exclude=None):
+        """
+        Return (scores, doc_ids) of the top-k documents with a non-zero score, best first
+
+        exclude: doc ids never to return (tombstoned documents)
+        """
+        scores = self.scores(query)
+        if exclude is not None and len(exclude):
+            # documents appended after this index was built have no score anyway
+            scores[exclude[exclude < len(scores)]] = 0.0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        # score descending, doc id ascending on ties
+        order = np.lexsort((candidates, -scores[candidates]))
+        candidates = candidates[order]
+        return scores[candidates], candidates
+
+    def __len__(self):
+        return self.num_docs
+
+    def __repr__(self):
+        return f"BM25Index(domain={self.domain!r}, num_docs={self.num_docs}, num_terms={len(self.terms)})"
+
+
+def load_sparse_indexes(faiss_dir, domains):
+    """domain -> BM25Index for every domain that has one on disk"""
+    return {domain: BM25Index(faiss_dir, domain) for domain in domains if bm25_exists(faiss_dir, domain)}
+
+
+# ============================================================================
+# FUSION
+# ============================================================================
+
+def reciprocal_rank_fusion(ranked_lists, k, rrf_k=RRF_K):
+    """
+    Fuse ranked doc-id lists (best first) with RRF: score(d) = sum 1 / (rrf_k + rank)
+
+    Returns up to k (doc_id, fused_score) pairs, best first. Ties keep the
+    order in which documents were first seen (dense list first).
+    """
+    fused = {}
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, start=1):
+            doc_id = int(doc_id)
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+# ============================================================================
+# WRITER
+# ============================================================================
+
+def build_bm25(faiss_dir, domain, docs, k1=DEFAULT_K1, b=DEFAULT_B, fields=BM25_FIELDS):
+    """
+    Write the BM25 index for `docs` (sequence of dicts, FAISS id order)
+
+    Files go to temporaries and are renamed into place, header last.
+    """
+    header_path, terms_path, offsets_path, postings_path, weights_path = bm25_paths(faiss_dir, domain)
+
+    token_ids = {}
+    term_postings = defaultdict(list)      # term id -> [(doc, tf), ...]
+    doc_lengths = []
+    for doc_idx, doc in enumerate(docs):
+        tokens = tokenize(" ".join(str(doc.get(field, "") or "") for field in fields))
+        doc_lengths.append(len(tokens))
+        for token, tf in Counter(tokens).items():
+            tid = token_ids.get(token)
+            if tid is None:
+                tid = token_ids[token] = term_id(token)
+            term_postings[tid].append((doc_idx, tf))
+
+    num_docs = len(doc_lengths)
+    doc_lengths = np.asarray(doc_lengths, dtype=np.float64)
+    avgdl = float(doc_lengths.mean()) if num_docs else 0.0
+    length_norm = k1 * (1.0 - b + b * doc_lengths / avgdl) if avgdl > 0 else np.full(num_docs, k1)
+
+    terms = np.array(sorted(term_postings), dtype=np.int64)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    postings = []
+    weights = []
+    for i, tid in enumerate(terms):
+        entries = term_postings[int(tid)]
+        doc_ids = np.array([d for d, _ in entries], dtype=np.int32)
+        tfs = np.array([tf for _, tf in entries], dtype=np.float64)
+        idf = math.log(1.0 + (num_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+        postings.append(doc_ids)
+        weights.append((idf * tfs * (k1 + 1.0) / (tfs + length_norm[doc_ids])).astype(np.float32))
+        offsets[i + 1] = offsets[i] + len(entries)
+
+    arrays = (
+        (terms_path, terms),
+        (offsets_path, offsets),
+        (postings_path, np.concatenate(postings) if postings else np.empty(0, dtype=np.int32)),
+        (weights_path, np.concatenate(weights) if weights else np.empty(0, dtype=np.float32)),
+    )
+    for path, array in arrays:
+        with open(path + ".tmp", 'wb') as f:
+            np.save(f, array, allow_pickle=False)
+
+    with open(header_path + ".tmp", 'w') as f:
+        json.dump({
+            "format_version": BM25_FORMAT_VERSION,
+            "domain": domain,
+            "fields": list(fields),
+            "num_docs": num_docs,
+            "num_terms": len(terms),
+            "avgdl": avgdl,
+            "k1": k1,
+            "b": b,
+            "id_epoch": getattr(docs, "id_epoch", 0),
+        }, f, indent=2)
+
+    # Header last: its presence marks the index as complete
+    for path, _ in arrays:
+        os.replace(path + ".tmp", path)
+    os.replace(header_path + ".tmp", header_path)
+
+    return num_docs, len(terms)
+
+
+def build_checkpoint_bm25(checkpoint_path, k1=DEFAULT_K1, b=DEFAULT_B):
+    """Build BM25 indexes for every domain of a checkpoint that has documents"""
+    from medical_qa_docstore import docstore_exists, load_docs
+
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+        metadata = json.load(f)
+
+    built = {}
+    for domain in metadata['domain_list']:
+        if not docstore_exists(faiss_dir, domain) and not os.path.exists(os.path.join(faiss_dir, f"{domain}_docs.pkl")):
+            print(f"  ❌ {domain}: no documents, skipping")
+            continue
+        num_docs, num_terms = build_bm25(faiss_dir, domain, load_docs(faiss_dir, domain), k1=k1, b=b)
+        built[domain] = num_docs
+        print(f"  ✓ {domain}: {num_docs} documents, {num_terms} terms")
+    return built
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build per-domain BM25 indexes for hybrid retrieval")
+    parser.add_argument("checkpoint_path", help="e.g. medical_qa_checkpoints/medical_qa_v1.0")
+    parser.add_argument("--k1", type=float, default=DEFAULT_K1)
+    parser.add_argument("--b", type=float, default=DEFAULT_B)
+    args = parser.parse_args()
+
+    print(f"🔨 Building BM25 indexes in {args.checkpoint_path}")
+    build_checkpoint_bm25(args.checkpoint_path, k1=args.k1, b=args.b)
+    print("✅ Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""
+Medical QA System - Offline checkpoint build
+Streams DataSets/*.csv (Question, Answer, topic, split) into a new
+checkpoint version: per-domain FAISS indexes, DocStores, BM25 indexes and
+metadata.json
+
+Usage (from the repository root):
+    python src/medical_qa_build.py --version medical_qa_v1.1 --base medical_qa_v1.0 \\
+        --datasets DataSets --workers 4 --batch-size 256
+
+Rows are read with the csv module one at a time and handed to the
+embedding workers in batches, with at most a few batches in flight, so
+memory does not grow with CSV size: text goes straight into each
+domain's DocStore and embeddings are spilled to a float32 file per domain
+until the index is built. (The flat FAISS index and the BM25 postings
+themselves are, of course, proportional to the number of documents.)
+
+Topics are mapped to the router's domains with DEFAULT_TOPIC_MAP, which
+--topic-map (JSON object, topic -> domain) extends or overrides; rows of
+unmapped topics are skipped and counted. With --base, the new version
+keeps the base checkpoint's domain list and router, and domains with no
+CSV rows are carried over from it unchanged.
+
+Everything is written to a temporary directory next to the target and
+renamed into place at the end, so a checkpoint version either exists
+complete or not at all.
+
+Near-duplicate answers are clustered per domain at build time (see
+medical_qa_dedup; --dedup-threshold 0 skips it). With --drop-duplicates,
+a row whose answer nearly duplicates one already written to its domain
+is not indexed at all.
+
+With --sentence-index, every domain also gets a sentence-window index
+(see medical_qa_sentences), embedded by the same worker pool after the
+passage indexes are written.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+import numpy as np
+
+from medical_qa_bm25 import build_bm25, bm25_paths
+from medical_qa_dedup import DEFAULT_THRESHOLD, NearDuplicateIndex, build_clusters, minhash
+from medical_qa_docstore import (
+    DocStoreWriter,
+    docstore_clusters_path,
+    docstore_paths,
+    docstore_terms_paths,
+    docstore_tombstones_path,
+    load_docs,
+)
+from medical_qa_embedder import EMBEDDER_CONFIG_NAME
+from medical_qa_router import ROUTER_CHECKPOINT_NAME, ROUTER_EXPORT_NAME
+from medical_qa_sentences import build_sentence_index, sentence_index_paths
+
+
+CHECKPOINT_DIR = "medical_qa_checkpoints"
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_FIELDS = ("question", "answer")
+
+DEFAULT_TOPIC_MAP = {
+    "cancer": "Cancer",
+    "heart_lung_blood": "Cardiology",
+    "diabetes_digestive_kidney": "Diabetes-Digestive-Kidney",
+    "neurological_disorders_stroke": "Neurology",
+}
+
+
+# ============================================================================
+# CSV STREAMING
+# ============================================================================
+
+def iter_csv_rows(paths, splits=None):
+    """Yield {"question", "answer", "topic", "split", "source"} dicts, one CSV row at a time"""
+    csv.field_size_limit(min(sys.maxsize, 2**31 - 1))
+    for path in paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if splits and row.get("split") not in splits:
+                    continue
+                question = (row.get("Question") or "").strip()
+                answer = (row.get("Answer") or "").strip()
+                if not question or not answer:
+                    continue
+                yield {
+                    "question": question,
+                    "answer": answer,
+                    "topic": row.get("topic", ""),
+                    "split": row.get("split", ""),
+                    "source": os.path.basename(path),
+                }
+
+
+def embed_text(doc, fields=EMBED_FIELDS):
+    return " ".join(doc[field] for field in fields if doc.get(field))
+
+
+# ============================================================================
+# EMBEDDING WORKERS
+# ============================================================================
+
+_worker_model = None
+
+
+def _init_worker(model_name, threads):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device='cpu')
+
+
+def _embed_batch(texts, batch_size):
+    return _worker_model.encode(
+        texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True
+    ).astype(np.float32)
+
+
+class EmbeddingPool:
+    """
+    Ordered, bounded-backlog batch embedding on worker processes
+
+    submit() queues a batch and returns the results of batches that have
+    come back, oldest first; it blocks once max_pending batches are in
+    flight. workers=0 embeds in this process.
+    """
+
+    def __init__(self, model_name=EMBED_MODEL, workers=2, batch_size=256, max_pending=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_pending = max_pending or max(2, 2 * workers)
+        self._pending = deque()     # (tag, AsyncResult)
+        threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+        if workers > 0:
+            import multiprocessing
+            self._pool = multiprocessing.get_context("spawn").Pool(
+                workers, initializer=_init_worker, initargs=(model_name, threads)
+            )
+        else:
+            self._pool = None
+            _init_worker(model_name, threads)
+
+    def submit(self, tag, texts):
+        """Queue `texts`; returns [(tag, embeddings), ...] for batches that finished"""
+        if self._pool is None:
+            return [(tag, _embed_batch(texts, self.batch_size))]
+        self._pending.append((tag, self._pool.apply_async(_embed_batch, (texts, self.batch_size))))
+        done = []
+        while len(self._pending) >= self.max_pending or (self._pending and self._pending[0][1].ready()):
+            pending_tag, result = self._pending.popleft()
+            done.append((pending_tag, result.get()))
+        return done
+
+    def drain(self):
+        done = []
+        while self._pending:
+            tag, result = self._pending.popleft()
+            done.append((tag, result.get()))
+        return done
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._pool is not None:
+            self._pool.terminate()
+        self.close()
+
+
+# ============================================================================
+# PER-DOMAIN OUTPUT
+# ============================================================================
+
+class DomainBuild:
+    """DocStore writer plus an on-disk float32 spill of the domain's embeddings"""
+
+    def __init__(self, faiss_dir, domain, dedup_threshold=DEFAULT_THRESHOLD, drop_duplicates=False):
+        self.faiss_dir = faiss_dir
+        self.domain = domain
+        self.docs = DocStoreWriter(faiss_dir, domain)
+        self.dedup_threshold = dedup_threshold
+        self.duplicates = NearDuplicateIndex(dedup_threshold) if drop_duplicates else None
+        self.num_dropped = 0
+        self.spill_path = os.path.join(faiss_dir, f"{domain}.embeddings.f32.tmp")
+        self._spill = open(self.spill_path, 'wb')
+        self.num_vectors = 0
+        self.dim = None
+
+    def add(self, doc):
+        """Write doc to the DocStore; False (and nothing written) if it is a dropped near-duplicate"""
+        if self.duplicates is not None:
+            sig = minhash(doc["answer"])
+            if self.duplicates.find(sig) is not None:
+                self.num_dropped += 1
+                return False
+            self.duplicates.add(self.docs.num_docs, sig)
+        self.docs.add(doc)
+        return True
+
+    def add_embeddings(self, vectors):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._spill.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self.num_vectors += len(vectors)
+
+    def finish(self, chunk_rows=65536):
+        """Close the DocStore, build the flat index from the spill file, then BM25 and clusters"""
+        import faiss
+
+        num_docs = self.docs.close()
+        self._spill.close()
+        if num_docs != self.num_vectors:
+            raise RuntimeError(f"{self.domain}: {num_docs} documents but {self.num_vectors} embeddings")
+
+        index = faiss.IndexFlatL2(self.dim)
+        vectors = np.memmap(self.spill_path, dtype=np.float32, mode='r', shape=(self.num_vectors, self.dim))
+        for start in range(0, self.num_vectors, chunk_rows):
+            index.add(np.ascontiguousarray(vectors[start:start + chunk_rows]))
+        del vectors
+        os.remove(self.spill_path)
+        faiss.write_index(index, os.path.join(self.faiss_dir, f"{self.domain}_index.faiss"))
+
+        docs = load_docs(self.faiss_dir, self.domain)
+        build_bm25(self.faiss_dir, self.domain, docs)
+        stats = {"num_docs": num_docs, "index_type": "IndexFlatL2"}
+        if self.dedup_threshold:
+            stats["dedup"] = {
+                "threshold": self.dedup_threshold,
+                "num_clusters": build_clusters(self.faiss_dir, self.domain, docs, self.dedup_threshold),
+                "dropped": self.num_dropped,
+            }
+        docs.close()
+        return stats
+
+    def abort(self):
+        self.docs.abort()
+        self._spill.close()
+        if os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+
+
+def domain_files(faiss_dir, domain, domain_stats):
+    """Every file that belongs to a domain in a checkpoint's faiss_indexes directory"""
+    names = {f"{domain}_index.faiss", f"{domain}_docs.pkl"}
+    if domain_stats.get("index_file"):
+        names.add(domain_stats["index_file"])
+    paths = [os.path.join(faiss_dir, name) for name in names]
+    paths += list(docstore_paths(faiss_dir, domain)) + list(docstore_terms_paths(faiss_dir, domain))
+    paths += [docstore_tombstones_path(faiss_dir, domain), docstore_clusters_path(faiss_dir, domain)]
+    paths += list(bm25_paths(faiss_dir, domain)) + list(sentence_index_paths(faiss_dir, domain))
+    return [p for p in paths if os.path.exists(p)]
+
+
+# ============================================================================
+# BUILD
+# ============================================================================
+
+def load_topic_map(path=None):
+    topic_map = dict(DEFAULT_TOPIC_MAP)
+    if path:
+        with open(path) as f:
+            topic_map.update(json.load(f))
+    return {topic.lower(): domain for topic, domain in topic_map.items()}
+
+
+def build_checkpoint(version, datasets="DataSets", base=None, topic_map=None, splits=None,
+                     workers=2, batch_size=256, model_name=EMBED_MODEL, checkpoint_dir=CHECKPOINT_DIR,
+                     carry_over=True, dedup_threshold=DEFAULT_THRESHOLD, drop_duplicates=False,
+                     sentence_index=False):
+    """
+    Build checkpoint `version` from the CSVs in `datasets`
+
+    Returns the new metadata dict. Fails if the version already exists.
+    """
+    topic_map = {t.lower(): d for t, d in (topic_map or DEFAULT_TOPIC_MAP).items()}
+    if drop_duplicates and not dedup_threshold:
+        raise ValueError("❌ drop_duplicates needs a dedup_threshold")
+    csv_paths = sorted(glob.glob(os.path.join(datasets, "*.csv")))
+    if not csv_paths:
+        raise FileNotFoundError(f"❌ No CSV files in {datasets}")
+
+    target = os.path.join(checkpoint_dir, version)
+    if os.path.exists(target):
+        raise FileExistsError(f"❌ Checkpoint already exists: {target}")
+
+    base_path = os.path.join(checkpoint_dir, base) if base else None
+    base_metadata = None
+    if base_path:
+        with open(os.path.join(base_path, "metadata.json")) as f:
+            base_metadata = json.load(f)
+        unknown = sorted(set(topic_map.values()) - set(base_metadata['domain_list']))
+        if unknown:
+            raise ValueError(f"❌ Topic map targets domains the base router does not know: {unknown}")
+
+    tmp_dir = f"{target}.tmp-{os.getpid()}"
+    faiss_dir = os.path.join(tmp_dir, "faiss_indexes")
+    os.makedirs(faiss_dir)
+
+    started = time.perf_counter()
+    builds = {}
+    skipped_topics = Counter()
+    rows_read = 0
+    try:
+        with EmbeddingPool(model_name, workers=workers, batch_size=batch_size) as pool:
+            def spill(finished):
+                for domains, vectors in finished:
+                    # a batch can mix domains: rows keep their order within each domain
+                    domains = np.asarray(domains)
+                    for domain in dict.fromkeys(domains.tolist()):
+                        builds[domain].add_embeddings(vectors[domains == domain])
+
+            batch_domains, batch_texts = [], []
+            for doc in iter_csv_rows(csv_paths, splits):
+                rows_read += 1
+                domain = topic_map.get(doc["topic"].lower())
+                if domain is None:
+                    skipped_topics[doc["topic"]] += 1
+                    continue
+                if domain not in builds:
+                    builds[domain] = DomainBuild(faiss_dir, domain, dedup_threshold, drop_duplicates)
+                if not builds[domain].add(doc):
+                    continue
+                batch_domains.append(domain)
+                batch_texts.append(embed_text(doc))
+                if len(batch_texts) == batch_size:
+                    spill(pool.submit(batch_domains, batch_texts))
+                    batch_domains, batch_texts = [], []
+                    print(f"\r  📥 {rows_read} rows read", end="", flush=True)
+            if batch_texts:
+                spill(pool.submit(batch_domains, batch_texts))
+            spill(pool.drain())
+            print(f"\r  📥 {rows_read} rows read from {len(csv_paths)} files")
+
+            vector_db_stats = {}
+            for domain, build in sorted(builds.items()):
+                vector_db_stats[domain] = build.finish()
+                dropped = f" ({build.num_dropped} near-duplicates dropped)" if build.num_dropped else ""
+                print(f"  ✓ {domain}: {vector_db_stats[domain]['num_docs']} documents{dropped}")
+
+            if sentence_index:
+                for domain, build in sorted(builds.items()):
+                    docs = load_docs(faiss_dir, domain)
+                    stats = build_sentence_index(faiss_dir, domain, docs, pool, build.dim, batch_size)
+                    docs.close()
+                    vector_db_stats[domain]["sentences"] = stats
+                    print(f"  ✂️ {domain}: {stats['num_sentences']} sentences")
+    except BaseException:
+        for build in builds.values():
+            build.abort()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    try:
+        if base_metadata is not None:
+            domain_list = list(base_metadata['domain_list'])
+            base_faiss_dir = os.path.join(base_path, "faiss_indexes")
+            for domain in domain_list:
+                if domain in builds or not carry_over:
+                    continue
+                domain_stats = base_metadata.get('vector_db_stats', {}).get(domain, {})
+                files = domain_files(base_faiss_dir, domain, domain_stats)
+                if not files:
+                    continue
+                for path in files:
+                    shutil.copy2(path, faiss_dir)
+                vector_db_stats[domain] = dict(domain_stats)
+                print(f"  ↪ {domain}: carried over from {base}")
+            router_path = os.path.join(base_path, ROUTER_CHECKPOINT_NAME)
+            if os.path.exists(router_path):
+                shutil.copy2(router_path, tmp_dir)
+                if os.path.exists(os.path.join(base_path, ROUTER_EXPORT_NAME)):
+                    shutil.copy2(os.path.join(base_path, ROUTER_EXPORT_NAME), tmp_dir)
+            else:
+                print(f"  ⚠️ {base} has no moe_router.pt; copy or train one before loading {version}")
+        else:
+            domain_list = sorted(builds)
+            print(f"  ⚠️ No --base: train a router for {domain_list} before loading {version}")
+
+        metadata = {
+            "domain_list": domain_list,
+            "domain_to_label": {domain: i for i, domain in enumerate(domain_list)},
+            "num_domains": len(domain_list),
+            "embedder_model": model_name,
+            "timestamp": datetime.now().strftime("%Y%m%d_%H%M%S"),
+            "vector_db_stats": vector_db_stats,
+            "build": {
+                "base": base,
+                "datasets": [os.path.basename(p) for p in csv_paths],
+                "splits": list(splits) if splits else None,
+                "topic_map": topic_map,
+                "embed_fields": list(EMBED_FIELDS),
+                "rows_read": rows_read,
+                "skipped_topics": dict(skipped_topics),
+                "dedup_threshold": dedup_threshold,
+                "drop_duplicates": drop_duplicates,
+                "sentence_index": sentence_index,
+                "seconds": round(time.perf_counter() - started, 1),
+            },
+        }
+        with open(os.path.join(tmp_dir, "metadata.json"), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        # Query encoder: the float32 reference (a faster backend is opted into
+        # per checkpoint after medical_qa_embedder.py validate)
+        with open(os.path.join(tmp_dir, EMBEDDER_CONFIG_NAME), 'w') as f:
+            json.dump({
+                "model_name": model_name,
+                "embedding_dim": next((b.dim for b in builds.values() if b.dim), None),
+            }, f, indent=2)
+
+        # The whole version appears at once
+        os.rename(tmp_dir, target)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a checkpoint version from DataSets/*.csv")
+    parser.add_argument("--version", required=True, help="new checkpoint name, e.g. medical_qa_v1.1")
+    parser.add_argument("--base", help="checkpoint to take the router / domain list / uncovered domains from")
+    parser.add_argument("--datasets", default="DataSets")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    parser.add_argument("--topic-map", help="JSON file mapping CSV topics to domains (extends the default)")
+    parser.add_argument("--splits", nargs="+", help="only these splits (default: all rows)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="embedding processes (0 = embed in this process)")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--no-carry-over", action="store_true",
+                        help="do not copy base domains that have no CSV rows")
+    parser.add_argument("--dedup-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="near-duplicate answer similarity (0 = no clustering)")
+    parser.add_argument("--drop-duplicates", action="store_true",
+                        help="index only the first of each group of near-duplicate answers")
+    parser.add_argument("--sentence-index", action="store_true",
+                        help="also build sentence-window indexes (medical_qa_sentences)")
+    args = parser.parse_args()
+
+    print("="*70)
+    print(f"🏗️ BUILDING CHECKPOINT {args.version} from {args.datasets}")
+    print("="*70)
+
+    metadata = build_checkpoint(
+        args.version,
+        datasets=args.datasets,
+        base=args.base,
+        topic_map=load_topic_map(args.topic_map),
+        splits=args.splits,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        model_name=args.model,
+        checkpoint_dir=args.checkpoint_dir,
+        carry_over=not args.no_carry_over,
+        dedup_threshold=args.dedup_threshold or None,
+        drop_duplicates=args.drop_duplicates,
+        sentence_index=args.sentence_index,
+    )
+
+    skipped = metadata["build"]["skipped_topics"]
+    if skipped:
+        print(f"  ⏭️ Skipped unmapped topics: {', '.join(f'{t} ({n})' for t, n in skipped.items())}")
+    print(f"✅ Wrote {os.path.join(args.checkpoint_dir, args.version)} in {metadata['build']['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
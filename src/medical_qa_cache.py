@@ -0,0 +1,426 @@
+"""
+Medical QA System - Caches
+Bounded LRU embedding cache in front of embedder.encode, an
+answer-level cache for the whole retrieve_answer_full pipeline, and a
+(query, document) score cache for the cross-encoder reranker
+
+Usage:
+    cache = EmbeddingCache(max_bytes=64 * 2**20, path="cache/query_embeddings")
+    answers = AnswerCache(max_entries=10000, ttl_seconds=3600)
+    system = load_complete_system("medical_qa_v1.0", embedding_cache=cache, answer_cache=answers)
+    ...
+    print(cache.stats(), answers.stats())
+"""
+
+import atexit
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from medical_qa_text import normalize_query
+
+
+# ============================================================================
+# EMBEDDING CACHE
+# ============================================================================
+
+class EmbeddingCache:
+    """
+    LRU cache of query embeddings with a max-bytes limit
+
+    Vectors live in fixed-size slots of one float32 matrix. With `path`
+    set, that matrix is a memory-mapped .npy file and the key -> slot table
+    is written to a JSON sidecar on flush() (and at exit), so the cache
+    survives restarts. Only one process should write a given path.
+
+    A slot reused after the last flush no longer holds the vector the
+    saved table points to, so each slot also records a hash of its key
+    ({path}.slots.npy, cleared while the vector is rewritten); on load,
+    table entries whose slot hash doesn't match are dropped.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, dim=384, path=None, model_name=None, spell_correct=True):
+        self.dim = dim
+        self.row_bytes = dim * np.dtype(np.float32).itemsize
+        self.max_bytes = max_bytes
+        self.capacity = max(1, max_bytes // self.row_bytes)
+        self.path = path
+        self.model_name = model_name
+        self.spell_correct = spell_correct
+
+        self._lock = threading.Lock()
+        self._slots = OrderedDict()     # key -> slot, least recently used first
+        self._free = []
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path is None:
+            self._vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+            self._slot_keys = np.zeros(self.capacity, dtype=np.uint64)
+            self._free = list(range(self.capacity - 1, -1, -1))
+        else:
+            self._open_persistent()
+            atexit.register(self.flush)
+
+    # ------------------------------------------------------------------
+    # persistence
+    # ------------------------------------------------------------------
+
+    def _header(self):
+        return {
+            "model_name": self.model_name,
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "spell_correct": self.spell_correct,
+        }
+
+    @staticmethod
+    def _key_hash(key):
+        # 0 marks a slot being written (or empty)
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return digest or 1
+
+    def _open_persistent(self):
+        vectors_path = f"{self.path}.npy"
+        keys_path = f"{self.path}.json"
+        slots_path = f"{self.path}.slots.npy"
+        directory = os.path.dirname(vectors_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        saved = None
+        if all(os.path.exists(p) for p in (vectors_path, keys_path, slots_path)):
+            with open(keys_path) as f:
+                saved = json.load(f)
+            if saved.get("header") != self._header():
+                # different model / size / normalization: start over
+                saved = None
+
+        if saved is not None:
+            self._vectors = np.load(vectors_path, mmap_mode='r+', allow_pickle=False)
+            self._slot_keys = np.load(slots_path, mmap_mode='r+', allow_pickle=False)
+            used = set()
+            for key, slot in saved["keys"]:
+                if int(self._slot_keys[slot]) != self._key_hash(key):
+                    continue        # slot reused (or torn) after the table was saved
+                self._slots[key] = slot
+                self._bytes += self._entry_bytes(key)
+                used.add(slot)
+            self._free = [s for s in range(self.capacity - 1, -1, -1) if s not in used]
+        else:
+            self._vectors = np.lib.format.open_memmap(
+                vectors_path, mode='w+', dtype=np.float32, shape=(self.capacity, self.dim)
+            )
+            self._slot_keys = np.lib.format.open_memmap(
+                slots_path, mode='w+', dtype=np.uint64, shape=(self.capacity,)
+            )
+            self._free = list(range(self.capacity - 1, -1, -1))
+            self.flush()
+
+    def flush(self):
+        """Persist the key table (no-op for in-memory caches)"""
+        if self.path is None:
+            return
+        with self._lock:
+            self._vectors.flush()
+            self._slot_keys.flush()
+            keys_path = f"{self.path}.json"
+            with open(keys_path + ".tmp", 'w') as f:
+                json.dump({"header": self._header(), "keys": list(self._slots.items())}, f)
+            os.replace(keys_path + ".tmp", keys_path)
+
+    # ------------------------------------------------------------------
+    # lookups
+    # ------------------------------------------------------------------
+
+    def _entry_bytes(self, key):
+        return self.row_bytes + len(key.encode('utf-8'))
+
+    def key_for(self, text):
+        return normalize_query(text, spell_correct=self.spell_correct)
+
+    def get(self, key):
+        """Return a copy of the cached vector for a normalized key, or None"""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(key)
+            self.hits += 1
+            return np.array(self._vectors[slot])
+
+    def count_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def put(self, key, vector):
+        with self._lock:
+            if key in self._slots:
+                slot = self._slots[key]
+                self._slots.move_to_end(key)
+            else:
+                needed = self._entry_bytes(key)
+                while self._slots and (not self._free or self._bytes + needed > self.max_bytes):
+                    old_key, old_slot = self._slots.popitem(last=False)
+                    self._bytes -= self._entry_bytes(old_key)
+                    self._free.append(old_slot)
+                    self.evictions += 1
+                slot = self._free.pop()
+                self._slots[key] = slot
+                self._bytes += needed
+            self._slot_keys[slot] = 0
+            self._vectors[slot] = vector
+            self._slot_keys[slot] = self._key_hash(key)
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+            self._free = list(range(self.capacity - 1, -1, -1))
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._slots),
+            "capacity": self.capacity,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class CachedEmbedder:
+    """
+    Drop-in wrapper for SentenceTransformer.encode backed by an EmbeddingCache
+
+    Texts are normalized with the cache's key function and the normalized
+    text is what gets embedded on a miss, so a cached vector always matches
+    its key. Misses in one call are encoded together in a single batch.
+    """
+
+    def __init__(self, embedder, cache):
+        self.embedder = embedder
+        self.cache = cache
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size=batch_size, **kwargs)[0]
+
+        keys = [self.cache.key_for(t) for t in texts]
+        out = np.empty((len(keys), self.cache.dim), dtype=np.float32)
+
+        missing = OrderedDict()     # key -> rows, encoded once per call
+        for row, key in enumerate(keys):
+            if key in missing:
+                # repeated within this call: served by the pending encode
+                missing[key].append(row)
+                self.cache.count_hit()
+                continue
+            vector = self.cache.get(key)
+            if vector is None:
+                missing[key] = [row]
+            else:
+                out[row] = vector
+
+        if missing:
+            embeddings = self.embedder.encode(
+                list(missing), batch_size=batch_size, convert_to_numpy=True, **kwargs
+            ).astype(np.float32)
+            for (key, rows), vector in zip(missing.items(), embeddings):
+                self.cache.put(key, vector)
+                out[rows] = vector
+
+        return out
+
+    def __getattr__(self, name):
+        # everything else (get_sentence_embedding_dimension, ...) goes to the model
+        return getattr(self.embedder, name)
+
+
+# ============================================================================
+# ANSWER CACHE
+# ============================================================================
+
+class AnswerCache:
+    """
+    LRU + TTL cache of retrieve_answer_full results
+
+    Keyed by (checkpoint id, normalized query, k), where the checkpoint id
+    is "<checkpoint name>@<metadata timestamp>". The cache is bound to one
+    checkpoint at a time: binding a different one (load_complete_system
+    does this) drops every entry.
+
+    Queries are only lowercased and whitespace-collapsed for the key, not
+    spell-corrected: the pipeline's keyword scoring sees the raw words, so
+    a corrected query could get a different answer.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.checkpoint_id = None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, result)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def bind(self, checkpoint_id):
+        """Attach to a checkpoint, clearing all entries if it changed"""
+        with self._lock:
+            if checkpoint_id != self.checkpoint_id:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.checkpoint_id = checkpoint_id
+
+    def _key(self, query, k):
+        return (self.checkpoint_id, normalize_query(query, spell_correct=False), k)
+
+    def get(self, checkpoint_id, query, k):
+        """Return a copy of the cached result (with this caller's `query`), or None"""
+        self.bind(checkpoint_id)
+        key = self._key(query, k)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result = copy.deepcopy(entry[1])
+        result["query"] = query
+        return result
+
+    def put(self, checkpoint_id, query, k, result):
+        self.bind(checkpoint_id)
+        key = self._key(query, k)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "checkpoint_id": self.checkpoint_id,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# ============================================================================
+# PAIR SCORE CACHE
+# ============================================================================
+
+class PairScoreCache:
+    """
+    LRU cache of cross-encoder scores keyed by (query hash, doc id)
+
+    The query hash covers the lowercased, whitespace-collapsed query (the
+    MiniLM cross-encoders are uncased); a doc id is (domain, document id),
+    plus the sentence for sentence-window candidates. Document ids and
+    passages are only stable within one checkpoint, index mode and sentence
+    window, so like AnswerCache the cache is bound to one of those at a
+    time and binding another drops every entry.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.bound_to = None
+
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()    # (query hash, doc id) -> score
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def query_hash(query):
+        return hashlib.blake2b(normalize_query(query, spell_correct=False).encode('utf-8'), digest_size=8).digest()
+
+    def bind(self, key):
+        with self._lock:
+            if key != self.bound_to:
+                self._scores.clear()
+                self.bound_to = key
+
+    def get_many(self, query_hash, doc_ids):
+        """{doc id: score} for the doc ids that have a cached score"""
+        found = {}
+        with self._lock:
+            for doc_id in doc_ids:
+                score = self._scores.get((query_hash, doc_id))
+                if score is not None:
+                    self._scores.move_to_end((query_hash, doc_id))
+                    found[doc_id] = score
+            self.hits += len(found)
+            self.misses += len(doc_ids) - len(found)
+        return found
+
+    def put_many(self, query_hash, scores):
+        with self._lock:
+            for doc_id, score in scores.items():
+                self._scores[(query_hash, doc_id)] = score
+                self._scores.move_to_end((query_hash, doc_id))
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._scores),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+        }
@@ -3,8 +3,6 @@ Medical QA System with Multi-Turn Conversation
 Imports from medical_qa_inference.py to reuse existing code
 """
 
-import torch
-import torch.nn.functional as F
 import numpy as np
 from datetime import datetime
 
@@ -17,10 +15,19 @@ from medical_qa_inference import (
     llm_rerank,                    # ADD THIS
     validate_medical_answer,        # ADD THIS
     keyword_score,
-    MedicalMoE, MedicalExpert,
-    GatingNetwork,
-    device
+    route_queries,
+    search_candidates,
+    candidate_similarity,
 )
+from medical_qa_keywords import KeywordMatcher
+from medical_qa_stream import (
+    DEFAULT_CHUNK_CHARS,
+    StreamTimer,
+    answer_events,
+    candidate_event,
+    final_result,
+)
+from medical_qa_text import correct_spelling
 
 
 # ============================================================================
@@ -86,6 +93,326 @@ class ConversationMemory:
         }
 
 
+# ============================================================================
+# KEYWORD LISTS (compiled into KeywordMatchers once, at import)
+# ============================================================================
+
+# Domain a query explicitly mentions (first match wins, in this order)
+DOMAIN_KEYWORDS = {
+    'Cardiology': ['heart', 'blood', 'pressure', 'stroke', 'cholesterol', 'artery', 'cardiac'],
+    'Dermatology': ['skin', 'acne', 'rash', 'eczema', 'mole', 'cancer', 'dermatology'],
+    'Diabetes-Digestive-Kidney': ['diabetes', 'blood sugar', 'kidney', 'digestive', 'stomach', 'ibs'],
+    'Neurology': ['brain', 'nerve', 'alzheimer', 'parkinson', 'migraine', 'seizure', 'neurological'],
+    'Cancer': ['cancer', 'tumor', 'chemotherapy', 'oncology', 'breast', 'lung']
+}
+
+# ================================================================
+# MEDICAL KEYWORDS (Grouped by category)
+# ================================================================
+
+MEDICAL_KEYWORDS = {
+    # SYMPTOMS & COMPLAINTS
+    'symptoms': [
+        'symptom', 'pain', 'ache', 'hurt', 'burning', 'itching', 'itch',
+        'fever', 'cough', 'sneeze', 'rash', 'swelling', 'bleeding',
+        'nausea', 'vomit', 'diarrhea', 'constipation', 'discharge',
+        'dizziness', 'fatigue', 'weakness', 'tired', 'headache',
+        'sore', 'bruise', 'blister', 'scab', 'wound', 'cut',
+        'fracture', 'sprain', 'strain', 'cramp', 'spasm',
+        'tremor', 'shaking', 'sweating', 'chills', 'hot flashes',
+        'shortness of breath', 'breathless', 'palpitation',
+        'anxiety', 'depression', 'insomnia', 'sleep disorder'
+    ],
+
+    # DISEASES & CONDITIONS
+    'diseases': [
+        'disease', 'disorder', 'syndrome', 'condition', 'illness',
+        'cancer', 'tumor', 'malignancy', 'carcinoma', 'lymphoma',
+        'diabetes', 'prediabetes', 'hyperglycemia', 'hypoglycemia',
+        'hypertension', 'high blood pressure', 'hypotension',
+        'heart', 'cardiac', 'cardiology', 'myocardial', 'coronary',
+        'stroke', 'ischemic', 'hemorrhagic', 'cerebrovascular',
+        'arthritis', 'rheumatoid', 'osteoarthritis', 'gout',
+        'asthma', 'copd', 'emphysema', 'bronchitis',
+        'allergy', 'allergies', 'allergic', 'histamine',
+        'alzheimer', 'dementia', 'parkinson', 'parkinsonism',
+        'epilepsy', 'seizure', 'convulsion', 'tremor',
+        'autism', 'adhd', 'schizophrenia', 'bipolar',
+        'depression', 'anxiety', 'ptsd', 'ocd',
+        'dermatitis', 'eczema', 'psoriasis', 'acne', 'rosacea',
+        'melanoma', 'carcinoma', 'lymphoma', 'myeloma',
+        'leukemia', 'lymphoma', 'hodgkin',
+        'hiv', 'aids', 'covid', 'coronavirus', 'pandemic',
+        'flu', 'influenza', 'pneumonia', 'tuberculosis', 'tb',
+        'hepatitis', 'cirrhosis', 'liver disease',
+        'kidney disease', 'renal', 'nephritis', 'nephrotic',
+        'ibs', 'crohn', 'colitis', 'ulcerative',
+        'gerd', 'acid reflux', 'heartburn', 'gastritis',
+        'fibromyalgia', 'lupus', 'sle', 'autoimmune',
+        'thyroid', 'hyperthyroid', 'hypothyroid', 'grave',
+        'osteoporosis', 'bone disease', 'fracture',
+        'migraine', 'headache', 'tension headache',
+        'infection', 'bacterial', 'viral', 'fungal',
+        'inflammation', 'inflammatory', 'autoimmune',
+        'pregnancy', 'gestational', 'preeclampsia',
+        'menopause', 'pms', 'menstrual'
+    ],
+
+    # TREATMENTS & MEDICAL PROCEDURES
+    'treatments': [
+        'treatment', 'therapy', 'therapist', 'therapeutic',
+        'medicine', 'medication', 'drug', 'pharmaceutical',
+        'surgery', 'surgical', 'operate', 'operation',
+        'vaccine', 'vaccination', 'immunize', 'immunization',
+        'cure', 'heal', 'healing', 'recovery', 'recover',
+        'physical therapy', 'physiotherapy', 'pt',
+        'radiation', 'radiotherapy', 'chemotherapy', 'chemo',
+        'dialysis', 'transplant', 'organ donation',
+        'antibiotics', 'antibiotic', 'steroid', 'corticosteroid',
+        'painkiller', 'analgesic', 'anesthetic', 'sedative',
+        'antihistamine', 'decongestant', 'cough syrup',
+        'supplement', 'vitamin', 'mineral', 'probiotic',
+        'injection', 'iv', 'infusion', 'transfusion',
+        'biopsy', 'ultrasound', 'ct scan', 'mri', 'xray',
+        'endoscopy', 'colonoscopy', 'bronchoscopy',
+        'therapy', 'psychotherapy', 'counseling', 'psychiatrist',
+        'rehabilitation', 'rehab', 'physiotherapy',
+        'preventive', 'prevention', 'preventative',
+        'screening', 'test', 'diagnosis', 'diagnose'
+    ],
+
+    # MEDICAL BODY PARTS
+    'body_parts': [
+        'heart', 'lung', 'brain', 'liver', 'kidney', 'pancreas',
+        'stomach', 'intestine', 'colon', 'rectum', 'bladder',
+        'prostate', 'thyroid', 'adrenal', 'pituitary',
+        'bone', 'muscle', 'nerve', 'blood vessel', 'artery',
+        'vein', 'capillary', 'lymph', 'lymph node',
+        'skin', 'hair', 'nail', 'tooth', 'teeth',
+        'eye', 'ear', 'nose', 'throat', 'mouth',
+        'spine', 'vertebra', 'disc', 'cervical', 'lumbar',
+        'joint', 'cartilage', 'ligament', 'tendon',
+        'breast', 'prostate', 'testicle', 'ovary', 'uterus'
+    ],
+
+    # MEDICAL MEASUREMENTS & VALUES
+    'measurements': [
+        'blood pressure', 'bp', 'systolic', 'diastolic',
+        'cholesterol', 'ldl', 'hdl', 'triglyceride',
+        'glucose', 'blood sugar', 'hemoglobin', 'a1c',
+        'bmi', 'body mass index', 'height', 'weight',
+        'heartbeat', 'pulse', 'heart rate', 'rhythm',
+        'temperature', 'fever', 'celsius', 'fahrenheit',
+        'blood count', 'white blood cell', 'red blood cell',
+        'platelet', 'hemoglobin', 'hematocrit',
+        'creatinine', 'bun', 'urea', 'sodium', 'potassium',
+        'ph', 'oxygen saturation', 'o2', 'spo2'
+    ],
+
+    # MEDICAL PROFESSIONALS & SETTINGS
+    'professionals': [
+        'doctor', 'physician', 'md', 'do',
+        'nurse', 'rn', 'lpn', 'cna',
+        'surgeon', 'cardiologist', 'neurologist', 'dermatologist',
+        'psychiatrist', 'therapist', 'psychologist',
+        'dentist', 'orthodontist', 'pediatrician',
+        'ophthalmologist', 'optometrist', 'audiologist',
+        'pharmacist', 'dietitian', 'nutritionist',
+        'chiropractor', 'acupuncturist', 'homeopath',
+        'patient', 'client', 'healthcare provider'
+    ],
+
+    'settings': [
+        'hospital', 'clinic', 'health center', 'medical center',
+        'emergency room', 'er', 'urgent care', 'emergency',
+        'pharmacy', 'drugstore', 'apothecary',
+        'laboratory', 'lab', 'diagnostic center',
+        'doctor\'s office', 'medical office', 'practice',
+        'nursing home', 'assisted living', 'rehab center',
+        'mental health', 'psychiatric', 'sanitarium'
+    ],
+
+    # MEDICAL SPECIALTIES & DOMAINS
+    'specialties': [
+        'cardiology', 'neurology', 'dermatology', 'oncology',
+        'pediatrics', 'geriatrics', 'psychiatry', 'psychology',
+        'orthopedics', 'rheumatology', 'endocrinology',
+        'gastroenterology', 'urology', 'nephrology',
+        'pulmonology', 'rheumatology', 'immunology',
+        'hematology', 'pathology', 'radiology',
+        'obstetrics', 'gynecology', 'ophthalmology',
+        'otolaryngology', 'dentistry', 'anesthesiology',
+        'surgery', 'internal medicine', 'family medicine'
+    ],
+
+    # HEALTH & WELLNESS
+    'health_concepts': [
+        'health', 'wellness', 'wellbeing', 'healthy',
+        'disease prevention', 'health education',
+        'lifestyle', 'diet', 'nutrition', 'exercise',
+        'fitness', 'weight loss', 'weight management',
+        'stress management', 'sleep hygiene',
+        'mental health', 'physical health', 'emotional health',
+        'side effect', 'adverse reaction', 'allergy',
+        'contraindication', 'drug interaction'
+    ]
+}
+
+# ================================================================
+# NON-MEDICAL KEYWORDS (Things to exclude)
+# ================================================================
+
+NON_MEDICAL_KEYWORDS = {
+    # FOOD & COOKING
+    'food': [
+        'recipe', 'cook', 'cooking', 'food', 'cuisine', 'dish',
+        'ingredient', 'flavor', 'taste', 'spice', 'salt', 'sugar',
+        'butter', 'oil', 'cheese', 'chocolate', 'dessert',
+        'breakfast', 'lunch', 'dinner', 'snack', 'beverage',
+        'gulab jamum', 'biryani', 'pizza', 'burger', 'cake',
+        'bake', 'fry', 'grill', 'boil', 'steam'
+    ],
+
+    # SPORTS & GAMES
+    'sports': [
+        'cricket', 'football', 'soccer', 'basketball', 'tennis',
+        'game', 'sport', 'player', 'team', 'match', 'tournament',
+        'score', 'goal', 'win', 'lose', 'victory', 'defeat',
+        'coach', 'referee', 'umpire', 'batting', 'bowling',
+        'dhoni', 'ronaldo', 'messi', 'virat', 'kohli',
+        'olympic', 'championship', 'league', 'playoff'
+    ],
+
+    # ENTERTAINMENT & MEDIA
+    'entertainment': [
+        'movie', 'film', 'cinema', 'bollywood', 'hollywood',
+        'actor', 'actress', 'director', 'producer', 'script',
+        'music', 'song', 'singer', 'musician', 'concert',
+        'tv', 'television', 'series', 'episode', 'show',
+        'book', 'author', 'novel', 'story', 'plot',
+        'anime', 'cartoon', 'comic', 'manga',
+        'netflix', 'youtube', 'streaming'
+    ],
+
+    # TECHNOLOGY & PROGRAMMING
+    'technology': [
+        'python', 'java', 'javascript', 'programming', 'coding',
+        'software', 'hardware', 'computer', 'laptop', 'phone',
+        'app', 'application', 'website', 'web', 'internet',
+        'database', 'server', 'cloud', 'ai', 'machine learning',
+        'algorithm', 'code', 'debug', 'error', 'bug',
+        'technology', 'gadget', 'device', 'robot'
+    ],
+
+    # VEHICLES & TRANSPORTATION
+    'vehicles': [
+        'car', 'bike', 'motorcycle', 'bicycle', 'truck',
+        'bus', 'train', 'airplane', 'flight', 'airline',
+        'vehicle', 'engine', 'fuel', 'petrol', 'diesel',
+        'driving', 'drive', 'ride', 'ride-sharing',
+        'traffic', 'road', 'highway', 'parking',
+        'tesla', 'bmw', 'audi', 'ferrari'
+    ],
+
+    # TRAVEL & TOURISM
+    'travel': [
+        'travel', 'tourism', 'hotel', 'resort', 'vacation',
+        'holiday', 'tour', 'trip', 'destination', 'sightseeing',
+        'flight', 'flight booking', 'airline', 'airport',
+        'passport', 'visa', 'map', 'route', 'navigation',
+        'beach', 'mountain', 'park', 'museum', 'monument'
+    ],
+
+    # POLITICS & CURRENT AFFAIRS
+    'politics': [
+        'politics', 'political', 'election', 'election 2024',
+        'candidate', 'vote', 'voting', 'parliament', 'congress',
+        'minister', 'president', 'prime minister', 'mayor',
+        'government', 'policy', 'law', 'bill', 'act',
+        'news', 'news today', 'breaking news', 'headline'
+    ],
+
+    # FINANCE & BUSINESS
+    'finance': [
+        'business', 'company', 'startup', 'entrepreneur',
+        'finance', 'money', 'investment', 'stock', 'crypto',
+        'bitcoin', 'ethereum', 'nft', 'trading',
+        'profit', 'loss', 'salary', 'income', 'expense',
+        'bank', 'loan', 'credit card', 'mortgage',
+        'marketing', 'sales', 'customer', 'product'
+    ],
+
+    # EDUCATION (non-medical)
+    'education': [
+        'school', 'college', 'university', 'education',
+        'student', 'teacher', 'professor', 'lecture',
+        'class', 'exam', 'test', 'homework', 'assignment',
+        'mathematics', 'physics', 'chemistry', 'biology',
+        'history', 'geography', 'english', 'subject',
+        'academic', 'curriculum', 'degree', 'certification'
+    ],
+
+    # RELATIONSHIPS & PERSONAL LIFE
+    'personal': [
+        'relationship', 'dating', 'love', 'marriage', 'divorce',
+        'boyfriend', 'girlfriend', 'husband', 'wife', 'crush',
+        'family', 'parents', 'children', 'siblings', 'friends',
+        'friend', 'best friend', 'social', 'party', 'wedding',
+        'breakup', 'separation', 'affair', 'cheating'
+    ],
+
+    # MISCELLANEOUS IRRELEVANT
+    'misc': [
+        'joke', 'funny', 'meme', 'laugh', 'comedy',
+        'astrology', 'horoscope', 'zodiac', 'tarot',
+        'astral', 'paranormal', 'ghost', 'supernatural',
+        'weather', 'rain', 'snow', 'climate', 'temperature',
+        'pet', 'dog', 'cat', 'animal', 'wildlife',
+        'hobby', 'game', 'puzzle', 'trivia', 'riddle',
+        'how to', 'diy', 'tutorial', 'guide',
+        'review', 'rating', 'best', 'worst'
+    ]
+}
+
+# Specialist and urgency terms per domain
+SPECIALIST_REFERRALS = {
+    'Cardiology': {
+        'doctor': 'Cardiologist',
+        'clinic_type': 'Cardiac Clinic / Heart Center',
+        'urgent': ['chest pain', 'shortness of breath', 'palpitation', 'cardiac arrest'],
+        'routine': ['high blood pressure', 'cholesterol', 'heart disease prevention']
+    },
+    'Neurology': {
+        'doctor': 'Neurologist',
+        'clinic_type': 'Neurology Clinic / Neuro Center',
+        'urgent': ['stroke symptoms', 'seizure', 'severe headache', 'loss of consciousness'],
+        'routine': ['migraine', 'nerve pain', 'memory issues', 'neurological check']
+    },
+    'Dermatology': {
+        'doctor': 'Dermatologist',
+        'clinic_type': 'Dermatology Clinic / Skin Clinic',
+        'urgent': ['severe skin infection', 'spreading rash', 'skin cancer concern'],
+        'routine': ['acne', 'eczema', 'psoriasis', 'skin check']
+    },
+    'Diabetes-Digestive-Kidney': {
+        'doctor': 'Endocrinologist / Gastroenterologist / Nephrologist',
+        'clinic_type': 'Metabolic / Digestive / Nephrology Clinic',
+        'urgent': ['severe abdominal pain', 'uncontrolled diabetes', 'kidney failure'],
+        'routine': ['diabetes management', 'digestive issues', 'kidney health check']
+    },
+    'Cancer': {
+        'doctor': 'Oncologist',
+        'clinic_type': 'Oncology Center / Cancer Hospital',
+        'urgent': ['cancer diagnosis', 'tumor growth', 'symptoms worsening'],
+        'routine': ['cancer screening', 'preventive check', 'cancer risk assessment']
+    }
+}
+
+DOMAIN_MATCHER = KeywordMatcher(DOMAIN_KEYWORDS)
+QUERY_MATCHER = KeywordMatcher({**MEDICAL_KEYWORDS, **NON_MEDICAL_KEYWORDS})
+URGENT_MATCHERS = {domain: KeywordMatcher({domain: rec['urgent']}) for domain, rec in SPECIALIST_REFERRALS.items()}
+
+
 # ============================================================================
 # NEW: CONTEXT-AWARE FUNCTIONS
 # ============================================================================
@@ -115,22 +442,9 @@ def enhance_query_with_context(current_query, memory, selected_domains):
     # ================================================================
     
     # Check if query explicitly mentions a different domain
-    domain_keywords = {
-        'Cardiology': ['heart', 'blood', 'pressure', 'stroke', 'cholesterol', 'artery', 'cardiac'],
-        'Dermatology': ['skin', 'acne', 'rash', 'eczema', 'mole', 'cancer', 'dermatology'],
-        'Diabetes-Digestive-Kidney': ['diabetes', 'blood sugar', 'kidney', 'digestive', 'stomach', 'ibs'],
-        'Neurology': ['brain', 'nerve', 'alzheimer', 'parkinson', 'migraine', 'seizure', 'neurological'],
-        'Cancer': ['cancer', 'tumor', 'chemotherapy', 'oncology', 'breast', 'lung']
-    }
-    
-    # Check if query mentions keywords from DIFFERENT domain
+    # (first domain in DOMAIN_KEYWORDS order with a keyword in the query)
     query_lower = current_query.lower()
-    explicit_domain = None
-    
-    for domain, keywords in domain_keywords.items():
-        if any(keyword in query_lower for keyword in keywords):
-            explicit_domain = domain
-            break
+    explicit_domain = DOMAIN_MATCHER.first_category(query_lower)
     
     # ================================================================
     # DECISION LOGIC
@@ -163,291 +477,18 @@ def is_medical_query(query):
     
     query_lower = query.lower()
     
-    # ================================================================
-    # MEDICAL KEYWORDS (Grouped by category)
-    # ================================================================
-    
-    medical_keywords = {
-        # SYMPTOMS & COMPLAINTS
-        'symptoms': [
-            'symptom', 'pain', 'ache', 'hurt', 'burning', 'itching', 'itch',
-            'fever', 'cough', 'sneeze', 'rash', 'swelling', 'bleeding',
-            'nausea', 'vomit', 'diarrhea', 'constipation', 'discharge',
-            'dizziness', 'fatigue', 'weakness', 'tired', 'headache',
-            'sore', 'bruise', 'blister', 'scab', 'wound', 'cut',
-            'fracture', 'sprain', 'strain', 'cramp', 'spasm',
-            'tremor', 'shaking', 'sweating', 'chills', 'hot flashes',
-            'shortness of breath', 'breathless', 'palpitation',
-            'anxiety', 'depression', 'insomnia', 'sleep disorder'
-        ],
-        
-        # DISEASES & CONDITIONS
-        'diseases': [
-            'disease', 'disorder', 'syndrome', 'condition', 'illness',
-            'cancer', 'tumor', 'malignancy', 'carcinoma', 'lymphoma',
-            'diabetes', 'prediabetes', 'hyperglycemia', 'hypoglycemia',
-            'hypertension', 'high blood pressure', 'hypotension',
-            'heart', 'cardiac', 'cardiology', 'myocardial', 'coronary',
-            'stroke', 'ischemic', 'hemorrhagic', 'cerebrovascular',
-            'arthritis', 'rheumatoid', 'osteoarthritis', 'gout',
-            'asthma', 'copd', 'emphysema', 'bronchitis',
-            'allergy', 'allergies', 'allergic', 'histamine',
-            'alzheimer', 'dementia', 'parkinson', 'parkinsonism',
-            'epilepsy', 'seizure', 'convulsion', 'tremor',
-            'autism', 'adhd', 'schizophrenia', 'bipolar',
-            'depression', 'anxiety', 'ptsd', 'ocd',
-            'dermatitis', 'eczema', 'psoriasis', 'acne', 'rosacea',
-            'melanoma', 'carcinoma', 'lymphoma', 'myeloma',
-            'leukemia', 'lymphoma', 'hodgkin',
-            'hiv', 'aids', 'covid', 'coronavirus', 'pandemic',
-            'flu', 'influenza', 'pneumonia', 'tuberculosis', 'tb',
-            'hepatitis', 'cirrhosis', 'liver disease',
-            'kidney disease', 'renal', 'nephritis', 'nephrotic',
-            'ibs', 'crohn', 'colitis', 'ulcerative',
-            'gerd', 'acid reflux', 'heartburn', 'gastritis',
-            'fibromyalgia', 'lupus', 'sle', 'autoimmune',
-            'thyroid', 'hyperthyroid', 'hypothyroid', 'grave',
-            'osteoporosis', 'bone disease', 'fracture',
-            'migraine', 'headache', 'tension headache',
-            'infection', 'bacterial', 'viral', 'fungal',
-            'inflammation', 'inflammatory', 'autoimmune',
-            'pregnancy', 'gestational', 'preeclampsia',
-            'menopause', 'pms', 'menstrual'
-        ],
-        
-        # TREATMENTS & MEDICAL PROCEDURES
-        'treatments': [
-            'treatment', 'therapy', 'therapist', 'therapeutic',
-            'medicine', 'medication', 'drug', 'pharmaceutical',
-            'surgery', 'surgical', 'operate', 'operation',
-            'vaccine', 'vaccination', 'immunize', 'immunization',
-            'cure', 'heal', 'healing', 'recovery', 'recover',
-            'physical therapy', 'physiotherapy', 'pt',
-            'radiation', 'radiotherapy', 'chemotherapy', 'chemo',
-            'dialysis', 'transplant', 'organ donation',
-            'antibiotics', 'antibiotic', 'steroid', 'corticosteroid',
-            'painkiller', 'analgesic', 'anesthetic', 'sedative',
-            'antihistamine', 'decongestant', 'cough syrup',
-            'supplement', 'vitamin', 'mineral', 'probiotic',
-            'injection', 'iv', 'infusion', 'transfusion',
-            'biopsy', 'ultrasound', 'ct scan', 'mri', 'xray',
-            'endoscopy', 'colonoscopy', 'bronchoscopy',
-            'therapy', 'psychotherapy', 'counseling', 'psychiatrist',
-            'rehabilitation', 'rehab', 'physiotherapy',
-            'preventive', 'prevention', 'preventative',
-            'screening', 'test', 'diagnosis', 'diagnose'
-        ],
-        
-        # MEDICAL BODY PARTS
-        'body_parts': [
-            'heart', 'lung', 'brain', 'liver', 'kidney', 'pancreas',
-            'stomach', 'intestine', 'colon', 'rectum', 'bladder',
-            'prostate', 'thyroid', 'adrenal', 'pituitary',
-            'bone', 'muscle', 'nerve', 'blood vessel', 'artery',
-            'vein', 'capillary', 'lymph', 'lymph node',
-            'skin', 'hair', 'nail', 'tooth', 'teeth',
-            'eye', 'ear', 'nose', 'throat', 'mouth',
-            'spine', 'vertebra', 'disc', 'cervical', 'lumbar',
-            'joint', 'cartilage', 'ligament', 'tendon',
-            'breast', 'prostate', 'testicle', 'ovary', 'uterus'
-        ],
-        
-        # MEDICAL MEASUREMENTS & VALUES
-        'measurements': [
-            'blood pressure', 'bp', 'systolic', 'diastolic',
-            'cholesterol', 'ldl', 'hdl', 'triglyceride',
-            'glucose', 'blood sugar', 'hemoglobin', 'a1c',
-            'bmi', 'body mass index', 'height', 'weight',
-            'heartbeat', 'pulse', 'heart rate', 'rhythm',
-            'temperature', 'fever', 'celsius', 'fahrenheit',
-            'blood count', 'white blood cell', 'red blood cell',
-            'platelet', 'hemoglobin', 'hematocrit',
-            'creatinine', 'bun', 'urea', 'sodium', 'potassium',
-            'ph', 'oxygen saturation', 'o2', 'spo2'
-        ],
-        
-        # MEDICAL PROFESSIONALS & SETTINGS
-        'professionals': [
-            'doctor', 'physician', 'md', 'do',
-            'nurse', 'rn', 'lpn', 'cna',
-            'surgeon', 'cardiologist', 'neurologist', 'dermatologist',
-            'psychiatrist', 'therapist', 'psychologist',
-            'dentist', 'orthodontist', 'pediatrician',
-            'ophthalmologist', 'optometrist', 'audiologist',
-            'pharmacist', 'dietitian', 'nutritionist',
-            'chiropractor', 'acupuncturist', 'homeopath',
-            'patient', 'client', 'healthcare provider'
-        ],
-        
-        'settings': [
-            'hospital', 'clinic', 'health center', 'medical center',
-            'emergency room', 'er', 'urgent care', 'emergency',
-            'pharmacy', 'drugstore', 'apothecary',
-            'laboratory', 'lab', 'diagnostic center',
-            'doctor\'s office', 'medical office', 'practice',
-            'nursing home', 'assisted living', 'rehab center',
-            'mental health', 'psychiatric', 'sanitarium'
-        ],
-        
-        # MEDICAL SPECIALTIES & DOMAINS
-        'specialties': [
-            'cardiology', 'neurology', 'dermatology', 'oncology',
-            'pediatrics', 'geriatrics', 'psychiatry', 'psychology',
-            'orthopedics', 'rheumatology', 'endocrinology',
-            'gastroenterology', 'urology', 'nephrology',
-            'pulmonology', 'rheumatology', 'immunology',
-            'hematology', 'pathology', 'radiology',
-            'obstetrics', 'gynecology', 'ophthalmology',
-            'otolaryngology', 'dentistry', 'anesthesiology',
-            'surgery', 'internal medicine', 'family medicine'
-        ],
-        
-        # HEALTH & WELLNESS
-        'health_concepts': [
-            'health', 'wellness', 'wellbeing', 'healthy',
-            'disease prevention', 'health education',
-            'lifestyle', 'diet', 'nutrition', 'exercise',
-            'fitness', 'weight loss', 'weight management',
-            'stress management', 'sleep hygiene',
-            'mental health', 'physical health', 'emotional health',
-            'side effect', 'adverse reaction', 'allergy',
-            'contraindication', 'drug interaction'
-        ]
-    }
-    
-    # ================================================================
-    # NON-MEDICAL KEYWORDS (Things to exclude)
-    # ================================================================
-    
-    non_medical_keywords = {
-        # FOOD & COOKING
-        'food': [
-            'recipe', 'cook', 'cooking', 'food', 'cuisine', 'dish',
-            'ingredient', 'flavor', 'taste', 'spice', 'salt', 'sugar',
-            'butter', 'oil', 'cheese', 'chocolate', 'dessert',
-            'breakfast', 'lunch', 'dinner', 'snack', 'beverage',
-            'gulab jamum', 'biryani', 'pizza', 'burger', 'cake',
-            'bake', 'fry', 'grill', 'boil', 'steam'
-        ],
-        
-        # SPORTS & GAMES
-        'sports': [
-            'cricket', 'football', 'soccer', 'basketball', 'tennis',
-            'game', 'sport', 'player', 'team', 'match', 'tournament',
-            'score', 'goal', 'win', 'lose', 'victory', 'defeat',
-            'coach', 'referee', 'umpire', 'batting', 'bowling',
-            'dhoni', 'ronaldo', 'messi', 'virat', 'kohli',
-            'olympic', 'championship', 'league', 'playoff'
-        ],
-        
-        # ENTERTAINMENT & MEDIA
-        'entertainment': [
-            'movie', 'film', 'cinema', 'bollywood', 'hollywood',
-            'actor', 'actress', 'director', 'producer', 'script',
-            'music', 'song', 'singer', 'musician', 'concert',
-            'tv', 'television', 'series', 'episode', 'show',
-            'book', 'author', 'novel', 'story', 'plot',
-            'anime', 'cartoon', 'comic', 'manga',
-            'netflix', 'youtube', 'streaming'
-        ],
-        
-        # TECHNOLOGY & PROGRAMMING
-        'technology': [
-            'python', 'java', 'javascript', 'programming', 'coding',
-            'software', 'hardware', 'computer', 'laptop', 'phone',
-            'app', 'application', 'website', 'web', 'internet',
-            'database', 'server', 'cloud', 'ai', 'machine learning',
-            'algorithm', 'code', 'debug', 'error', 'bug',
-            'technology', 'gadget', 'device', 'robot'
-        ],
-        
-        # VEHICLES & TRANSPORTATION
-        'vehicles': [
-            'car', 'bike', 'motorcycle', 'bicycle', 'truck',
-            'bus', 'train', 'airplane', 'flight', 'airline',
-            'vehicle', 'engine', 'fuel', 'petrol', 'diesel',
-            'driving', 'drive', 'ride', 'ride-sharing',
-            'traffic', 'road', 'highway', 'parking',
-            'tesla', 'bmw', 'audi', 'ferrari'
-        ],
-        
-        # TRAVEL & TOURISM
-        'travel': [
-            'travel', 'tourism', 'hotel', 'resort', 'vacation',
-            'holiday', 'tour', 'trip', 'destination', 'sightseeing',
-            'flight', 'flight booking', 'airline', 'airport',
-            'passport', 'visa', 'map', 'route', 'navigation',
-            'beach', 'mountain', 'park', 'museum', 'monument'
-        ],
-        
-        # POLITICS & CURRENT AFFAIRS
-        'politics': [
-            'politics', 'political', 'election', 'election 2024',
-            'candidate', 'vote', 'voting', 'parliament', 'congress',
-            'minister', 'president', 'prime minister', 'mayor',
-            'government', 'policy', 'law', 'bill', 'act',
-            'news', 'news today', 'breaking news', 'headline'
-        ],
-        
-        # FINANCE & BUSINESS
-        'finance': [
-            'business', 'company', 'startup', 'entrepreneur',
-            'finance', 'money', 'investment', 'stock', 'crypto',
-            'bitcoin', 'ethereum', 'nft', 'trading',
-            'profit', 'loss', 'salary', 'income', 'expense',
-            'bank', 'loan', 'credit card', 'mortgage',
-            'marketing', 'sales', 'customer', 'product'
-        ],
-        
-        # EDUCATION (non-medical)
-        'education': [
-            'school', 'college', 'university', 'education',
-            'student', 'teacher', 'professor', 'lecture',
-            'class', 'exam', 'test', 'homework', 'assignment',
-            'mathematics', 'physics', 'chemistry', 'biology',
-            'history', 'geography', 'english', 'subject',
-            'academic', 'curriculum', 'degree', 'certification'
-        ],
-        
-        # RELATIONSHIPS & PERSONAL LIFE
-        'personal': [
-            'relationship', 'dating', 'love', 'marriage', 'divorce',
-            'boyfriend', 'girlfriend', 'husband', 'wife', 'crush',
-            'family', 'parents', 'children', 'siblings', 'friends',
-            'friend', 'best friend', 'social', 'party', 'wedding',
-            'breakup', 'separation', 'affair', 'cheating'
-        ],
-        
-        # MISCELLANEOUS IRRELEVANT
-        'misc': [
-            'joke', 'funny', 'meme', 'laugh', 'comedy',
-            'astrology', 'horoscope', 'zodiac', 'tarot',
-            'astral', 'paranormal', 'ghost', 'supernatural',
-            'weather', 'rain', 'snow', 'climate', 'temperature',
-            'pet', 'dog', 'cat', 'animal', 'wildlife',
-            'hobby', 'game', 'puzzle', 'trivia', 'riddle',
-            'how to', 'diy', 'tutorial', 'guide',
-            'review', 'rating', 'best', 'worst'
-        ]
-    }
-    
     # ================================================================
     # SCORING LOGIC
     # ================================================================
     
+    # Keyword matches per category, medical and non-medical, in one pass
+    hits = QUERY_MATCHER.category_hits(query_lower)
+    
     # Count medical keyword matches
-    medical_score = 0
-    for category, keywords in medical_keywords.items():
-        for keyword in keywords:
-            if keyword in query_lower:
-                medical_score += 1
+    medical_score = sum(hits.get(category, 0) for category in MEDICAL_KEYWORDS)
     
     # Count non-medical keyword matches
-    non_medical_score = 0
-    for category, keywords in non_medical_keywords.items():
-        for keyword in keywords:
-            if keyword in query_lower:
-                non_medical_score += 2  # Non-medical gets higher weight
+    non_medical_score = 2 * sum(hits.get(category, 0) for category in NON_MEDICAL_KEYWORDS)  # Non-medical gets higher weight
     
     # ================================================================
     # DECISION
@@ -517,43 +558,13 @@ def get_advanced_doctor_recommendation(domains, confidence, answer_text):
     Advanced recommendation based on urgency detection
     PLACE: AFTER get_doctor_recommendation()
     """
-    recommendations = {
-        'Cardiology': {
-            'doctor': 'Cardiologist',
-            'clinic_type': 'Cardiac Clinic / Heart Center',
-            'urgent': ['chest pain', 'shortness of breath', 'palpitation', 'cardiac arrest'],
-            'routine': ['high blood pressure', 'cholesterol', 'heart disease prevention']
-        },
-        'Neurology': {
-            'doctor': 'Neurologist',
-            'clinic_type': 'Neurology Clinic / Neuro Center',
-            'urgent': ['stroke symptoms', 'seizure', 'severe headache', 'loss of consciousness'],
-            'routine': ['migraine', 'nerve pain', 'memory issues', 'neurological check']
-        },
-        'Dermatology': {
-            'doctor': 'Dermatologist',
-            'clinic_type': 'Dermatology Clinic / Skin Clinic',
-            'urgent': ['severe skin infection', 'spreading rash', 'skin cancer concern'],
-            'routine': ['acne', 'eczema', 'psoriasis', 'skin check']
-        },
-        'Diabetes-Digestive-Kidney': {
-            'doctor': 'Endocrinologist / Gastroenterologist / Nephrologist',
-            'clinic_type': 'Metabolic / Digestive / Nephrology Clinic',
-            'urgent': ['severe abdominal pain', 'uncontrolled diabetes', 'kidney failure'],
-            'routine': ['diabetes management', 'digestive issues', 'kidney health check']
-        },
-        'Cancer': {
-            'doctor': 'Oncologist',
-            'clinic_type': 'Oncology Center / Cancer Hospital',
-            'urgent': ['cancer diagnosis', 'tumor growth', 'symptoms worsening'],
-            'routine': ['cancer screening', 'preventive check', 'cancer risk assessment']
-        }
-    }
     
     primary_domain = domains[0] if domains else 'Cardiology'
-    rec = recommendations.get(primary_domain, recommendations['Cardiology'])
+    if primary_domain not in SPECIALIST_REFERRALS:
+        primary_domain = 'Cardiology'
+    rec = SPECIALIST_REFERRALS[primary_domain]
     
-    is_urgent = any(urgent_term in answer_text.lower() for urgent_term in rec['urgent'])
+    is_urgent = URGENT_MATCHERS[primary_domain].matches(answer_text.lower())
     
     urgency_message = (
         "⚠️ **URGENT**: Please consult a specialist as soon as possible." 
@@ -592,44 +603,43 @@ def retrieve_answer_with_context(query, system, memory, k=5):
     Retrieve answer - WITHOUT forcing previous domain context
     Let MoE router decide the best domain
     """
+    return final_result(stream_answer_with_context(query, system, memory, k))["result"]
+
+
+def recommendation_event(result):
+    doctor_info = get_advanced_doctor_recommendation(
+        result['selected_experts'],
+        result['confidence_score'],
+        result['best_answer']
+    )
+    return {"event": "recommendation", **doctor_info}
+
+
+def _finish_stream(result, timer, chunk_chars):
+    yield from answer_events(result['best_answer'], timer, chunk_chars)
+    timer.mark("answer")
+    yield recommendation_event(result)
+    yield {"event": "done", "result": result, "timings": timer.timings()}
+
+
+def stream_answer_with_context(query, system, memory, k=5, chunk_chars=DEFAULT_CHUNK_CHARS):
+    """
+    retrieve_answer_with_context as a stream of events (see medical_qa_stream)
     
-    from difflib import get_close_matches
-    from medical_qa_inference import llm_rerank, validate_medical_answer
+    Yields the routing decision, the candidates found, the answer in
+    chunks and the doctor recommendation, then "done" with the result
+    and its timings (time to first answer chunk, total).
+    """
     
-    trained_moe_model = system['moe_model']
-    vector_dbs = system['vector_dbs']
+    timer = StreamTimer()
     embedder = system['embedder']
-    domain_list = system['domain_list']
-    label_to_domain = system['label_to_domain']
     
     # ================================================================
     # STEP 1: Fix spelling mistakes
     # ================================================================
     print(f"  1️⃣ Correcting spelling...")
     
-    medical_vocabulary = [
-        'cure', 'cancer', 'disease', 'treatment', 'symptoms', 
-        'diagnosis', 'improve', 'heart', 'diabetes', 'cardiology',
-        'neurology', 'dermatology', 'query', 'consult', 'patient',
-        'infection', 'therapy', 'medication', 'hospital', 'blood',
-        'pressure', 'stroke', 'attack', 'skin', 'pain', 'risk',
-        'factor', 'prevent', 'cause', 'effect', 'health'
-    ]
-    
-    query_words = query.lower().split()
-    corrected_words = []
-    corrections = []
-    
-    for word in query_words:
-        matches = get_close_matches(word, medical_vocabulary, n=1, cutoff=0.85)
-        
-        if matches and matches[0] != word:
-            corrected_words.append(matches[0])
-            corrections.append(f"{word}→{matches[0]}")
-        else:
-            corrected_words.append(word)
-    
-    corrected_query = ' '.join(corrected_words)
+    corrected_query, corrections = correct_spelling(query)
     
     if corrections:
         print(f"     Corrections: {', '.join(corrections)}")
@@ -641,21 +651,17 @@ def retrieve_answer_with_context(query, system, memory, k=5):
     # ================================================================
     print(f"  2️⃣ Embedding query...")
     query_emb = embedder.encode([corrected_query], convert_to_numpy=True).astype(np.float32)
+    timer.mark("embed")
     
     # ================================================================
     # STEP 3: Route through MoE
     # ================================================================
     print(f"  3️⃣ Routing through MoE...")
-    with torch.no_grad():
-        q_tensor = torch.from_numpy(query_emb).to(device)
-        logits = trained_moe_model(q_tensor, return_router_logits=True)
-        probs = F.softmax(logits, dim=-1).cpu().numpy().squeeze(0)
-        
-        topk = min(2, len(domain_list))
-        top_indices = probs.argsort()[::-1][:topk]
-        selected_domains = [label_to_domain[int(i)] for i in top_indices]
+    selected_domains, selected_probs = route_queries(query_emb, system)[0]
+    timer.mark("route")
     
     print(f"     Selected: {', '.join(selected_domains)}")
+    yield {"event": "routing", "domains": selected_domains, "probabilities": list(selected_probs)}
     
     # ================================================================
     # STEP 4: Get previous conversation for DISPLAY, not retrieval
@@ -668,28 +674,20 @@ def retrieve_answer_with_context(query, system, memory, k=5):
     # STEP 5: Retrieve from FAISS
     # ================================================================
     print(f"  5️⃣ Searching FAISS indexes...")
-    candidates = []
-    for domain in selected_domains:
-        if domain not in vector_dbs:
-            continue
-        idx, docs = vector_dbs[domain]
-        D, I = idx.search(query_emb, k)
-        for dist, doc_idx in zip(D[0], I[0]):
-            if doc_idx < len(docs):
-                candidates.append({
-                    "answer": docs[doc_idx]["answer"],
-                    "domain": domain,
-                    "dist": float(dist)
-                })
+    candidates = search_candidates(query_emb, [(selected_domains, None)], system, k, [corrected_query])[0]
+    timer.mark("search")
+    yield candidate_event(candidates, k)
     
     if not candidates:
-        return {
+        result = {
             "query": query,
             "best_answer": "⚠️ No information found.",
             "confidence_score": 0.0,
             "selected_experts": selected_domains,
             "context_used": False
         }
+        yield from _finish_stream(result, timer, chunk_chars)
+        return
     
     print(f"     Found {len(candidates)} candidates")
     
@@ -698,12 +696,13 @@ def retrieve_answer_with_context(query, system, memory, k=5):
     # ================================================================
     print(f"  6️⃣ Reranking candidates...")
     candidate_texts = [c["answer"] for c in candidates]
-    candidate_similarities = [1 / (1 + c["dist"]) for c in candidates]
+    candidate_similarities = [candidate_similarity(c) for c in candidates]
     
-    reranked = llm_rerank(corrected_query, candidate_texts, candidate_similarities)
+    reranked = llm_rerank(corrected_query, candidate_texts, candidate_similarities,
+                          candidate_terms=[c.get("terms") for c in candidates])
     
     if not reranked:
-        conf = 1.0 / (1.0 + candidates[0]["dist"])
+        conf = candidate_similarity(candidates[0])
         best_answer = candidates[0]["answer"]
     else:
         conf = reranked[0]["final_score"]
@@ -720,8 +719,9 @@ def retrieve_answer_with_context(query, system, memory, k=5):
         conf = reranked[1]["final_score"]
         best_answer = reranked[1]["answer"]
         is_valid, validated_answer = validate_medical_answer(corrected_query, best_answer, conf)
+    timer.mark("rerank")
     
-    return {
+    result = {
         "query": query,
         "corrected_query": corrected_query if corrected_query != query else None,
         "best_answer": validated_answer,
@@ -731,6 +731,7 @@ def retrieve_answer_with_context(query, system, memory, k=5):
         "previous_domains": previous_domains,
         "status": "success" if is_valid else "partial"
     }
+    yield from _finish_stream(result, timer, chunk_chars)
 
 
 # ============================================================================
@@ -802,31 +803,32 @@ def main():
             # PROCESS MEDICAL QUERY
             # ================================================================
             print(f"\n⏳ Processing...")
-            result = retrieve_answer_with_context(user_input, system, memory)
-            
-            # ================================================================
-            # DISPLAY ANSWER
-            # ================================================================
-            print(f"\n✅ ANSWER:")
-            answer = result['best_answer']
-            if len(answer) > 500:
-                print(f"   {answer[:500]}...\n")
-            else:
-                print(f"   {answer}\n")
-            
-            # ================================================================
-            # DOCTOR RECOMMENDATION - PLACE HERE!
-            # ================================================================
-            doctor_info = get_advanced_doctor_recommendation(
-                result['selected_experts'],
-                result['confidence_score'],
-                answer
-            )
-            
-            print(f"👨‍⚕️ SPECIALIST RECOMMENDATION:")
-            print(f"   Consult a: **{doctor_info['doctor']}**")
-            print(f"   Location: {doctor_info['clinic_type']}")
-            print(f"   {doctor_info['urgency']}\n")
+            result = None
+            answer_started = False
+            for event in stream_answer_with_context(user_input, system, memory):
+                
+                # ============================================================
+                # DISPLAY ANSWER (as it arrives)
+                # ============================================================
+                if event['event'] == 'answer':
+                    if not answer_started:
+                        answer_started = True
+                        print(f"\n✅ ANSWER:\n   ", end="")
+                    print(event['text'], end="", flush=True)
+                
+                # ============================================================
+                # DOCTOR RECOMMENDATION
+                # ============================================================
+                elif event['event'] == 'recommendation':
+                    print("\n")
+                    print(f"👨‍⚕️ SPECIALIST RECOMMENDATION:")
+                    print(f"   Consult a: **{event['doctor']}**")
+                    print(f"   Location: {event['clinic_type']}")
+                    print(f"   {event['urgency']}\n")
+                
+                elif event['event'] == 'done':
+                    result = event['result']
+                    timings = event['timings']
             
             # Show tips if high confidence
             if result['confidence_score'] > 0.75:
@@ -852,6 +854,7 @@ def main():
                 print(f"   Context Used: ✓")
             
             print(f"   Status: {result.get('status', 'unknown')}")
+            print(f"   Latency: first token {timings['ttft_ms']:.0f} ms, total {timings['total_ms']:.0f} ms")
             
             # ================================================================
             # SAVE TO MEMORY
@@ -0,0 +1,211 @@
+"""
+Medical QA System - Near-duplicate answer detection
+MinHash signatures over answer word shingles, banded LSH to find
+candidate pairs; each document joins the cluster of the first earlier
+document it nearly duplicates
+
+Every document gets a cluster id (the lowest document id in its cluster),
+stored next to its DocStore as {domain}_docs.clusters.npy. Retrieval
+with collapse_duplicates (see medical_qa_inference) keeps only the best
+ranked candidate of each cluster, so the rerank slots go to distinct
+passages. With --drop, every document but the first of its cluster is
+deleted and the domain compacted, which shrinks the index.
+
+Usage (from the repository root):
+    python src/medical_qa_dedup.py medical_qa_checkpoints/medical_qa_v1.0 --threshold 0.9
+    python src/medical_qa_dedup.py medical_qa_checkpoints/medical_qa_v1.0 --drop
+"""
+
+import argparse
+import json
+import os
+import zlib
+
+import numpy as np
+
+from medical_qa_bm25 import tokenize
+from medical_qa_docstore import checkpoint_lock, docstore_clusters_path, docstore_exists, load_docs
+
+
+DEFAULT_THRESHOLD = 0.9     # estimated Jaccard similarity of answer shingles
+NUM_PERM = 64
+BAND_ROWS = 4               # 16 bands: pairs at Jaccard 0.9 collide with p > 0.9999
+SHINGLE_SIZE = 3
+
+_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(1)
+# a, b < 2**31 and hashes < 2**32 keep a * h + b inside uint64
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM).astype(np.uint64)
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Word `size`-grams of the tokenized text (the whole text if shorter)"""
+    tokens = tokenize(text)
+    if len(tokens) <= size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash(text):
+    """(NUM_PERM,) uint64 MinHash signature of the text's shingles, or None if it has none"""
+    grams = shingles(text)
+    if not grams:
+        return None
+    hashes = np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+    return ((hashes[:, None] * _PERM_A + _PERM_B) % _PRIME).min(axis=0)
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_PERM
+
+
+class NearDuplicateIndex:
+    """
+    Banded LSH over MinHash signatures
+
+    add() registers a document, find() returns the first registered
+    document whose estimated similarity reaches the threshold.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.signatures = {}
+        self.buckets = [{} for _ in range(NUM_PERM // BAND_ROWS)]
+
+    def _bands(self, sig):
+        for band, start in enumerate(range(0, NUM_PERM, BAND_ROWS)):
+            yield self.buckets[band], sig[start:start + BAND_ROWS].tobytes()
+
+    def find(self, sig):
+        if sig is None:
+            return None
+        seen = set()
+        for buckets, key in self._bands(sig):
+            for other in buckets.get(key, ()):
+                if other not in seen:
+                    seen.add(other)
+                    if similarity(sig, self.signatures[other]) >= self.threshold:
+                        return other
+        return None
+
+    def add(self, doc_id, sig):
+        if sig is None:
+            return
+        self.signatures[doc_id] = sig
+        for buckets, key in self._bands(sig):
+            buckets.setdefault(key, []).append(doc_id)
+
+
+def near_duplicate_clusters(texts, threshold=DEFAULT_THRESHOLD):
+    """
+    Cluster id (lowest member index) of each text
+
+    A text joins the cluster of the first earlier text it is a near
+    duplicate of, so every member is similar to at least one other.
+    """
+    index = NearDuplicateIndex(threshold)
+    clusters = np.arange(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        sig = minhash(text)
+        match = index.find(sig)
+        if match is not None:
+            clusters[i] = clusters[match]
+        index.add(i, sig)
+    return clusters
+
+
+def build_clusters(faiss_dir, domain, docs, threshold=DEFAULT_THRESHOLD):
+    """Write {domain}_docs.clusters.npy for `docs` (FAISS id order); returns the number of clusters"""
+    clusters = near_duplicate_clusters([doc["answer"] for doc in docs], threshold)
+    return write_clusters(faiss_dir, domain, clusters)
+
+
+def write_clusters(faiss_dir, domain, clusters):
+    """Swap in {domain}_docs.clusters.npy; returns the number of clusters"""
+    path = docstore_clusters_path(faiss_dir, domain)
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, clusters, allow_pickle=False)
+    os.replace(path + ".tmp", path)
+    return len(np.unique(clusters))
+
+
+def refresh_clusters(faiss_dir, domain, docs, domain_stats):
+    """Recompute a domain's clusters after its documents changed, if it has any"""
+    dedup = domain_stats.get("dedup")
+    if dedup is None:
+        # not recorded in metadata: don't leave ids from another epoch behind
+        path = docstore_clusters_path(faiss_dir, domain)
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    dedup["num_clusters"] = build_clusters(faiss_dir, domain, docs, dedup["threshold"])
+
+
+# ============================================================================
+# CHECKPOINT
+# ============================================================================
+
+def dedup_checkpoint(checkpoint_path, threshold=DEFAULT_THRESHOLD, drop=False):
+    """
+    Compute clusters for every domain of a checkpoint; returns domain -> stats
+
+    drop: also delete every document but the first of its cluster and
+    compact (medical_qa_ingest), so the indexes shrink.
+    """
+    from medical_qa_indexes import _write_metadata
+    from medical_qa_ingest import WRITER_LOCK, compact_domain, delete_documents
+
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    report = {}
+    with checkpoint_lock(checkpoint_path, exclusive=True, name=WRITER_LOCK):
+        with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+            metadata = json.load(f)
+        # The slow part, outside the reader lock
+        clusters = {}
+        for domain in metadata['domain_list']:
+            if not docstore_exists(faiss_dir, domain) and not os.path.exists(os.path.join(faiss_dir, f"{domain}_docs.pkl")):
+                continue
+            docs = load_docs(faiss_dir, domain)
+            clusters[domain] = near_duplicate_clusters([doc["answer"] for doc in docs], threshold)
+
+        # Cluster files and metadata change together for readers
+        with checkpoint_lock(checkpoint_path, exclusive=True):
+            for domain, domain_clusters in clusters.items():
+                num_clusters = write_clusters(faiss_dir, domain, domain_clusters)
+                report[domain] = {"num_docs": len(domain_clusters), "num_clusters": num_clusters}
+                metadata['vector_db_stats'].setdefault(domain, {})["dedup"] = {
+                    "threshold": threshold, "num_clusters": num_clusters,
+                }
+                print(f"  ✓ {domain}: {len(domain_clusters)} documents, {num_clusters} clusters")
+            _write_metadata(checkpoint_path, metadata)
+
+    if drop:
+        for domain in report:
+            clusters = np.load(docstore_clusters_path(faiss_dir, domain), allow_pickle=False)
+            duplicates = np.flatnonzero(clusters != np.arange(len(clusters)))
+            if len(duplicates):
+                delete_documents(checkpoint_path, domain, duplicates.tolist())
+                removed = compact_domain(checkpoint_path, domain)
+                report[domain]["removed"] = removed
+                print(f"  🧹 {domain}: removed {removed} near-duplicates")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect near-duplicate answers in a checkpoint")
+    parser.add_argument("checkpoint_path", help="e.g. medical_qa_checkpoints/medical_qa_v1.0")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="estimated Jaccard similarity of answer shingles")
+    parser.add_argument("--drop", action="store_true",
+                        help="delete all but one document per cluster and compact")
+    args = parser.parse_args()
+
+    print(f"🔍 Clustering near-duplicate answers in {args.checkpoint_path}")
+    dedup_checkpoint(args.checkpoint_path, args.threshold, args.drop)
+    print("✅ Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,486 @@
+"""
+Medical QA System - Memory-mapped document store
+Replaces faiss_indexes/{domain}_docs.pkl with a pickle-free on-disk format
+
+Files per domain (next to {domain}_index.faiss):
+    {domain}_docs.json        header: fields, num_docs, format version
+    {domain}_docs.offsets.npy int64 offsets, (num_docs * num_fields + 1,)
+    {domain}_docs.blob        UTF-8 text of every field, concatenated
+    {domain}_docs.terms.npy   int64 answer term ids (medical_qa_scoring), per doc
+    {domain}_docs.terms_offsets.npy  int64, (num_docs + 1,)
+    {domain}_docs.tombstones.npy     int64 sorted ids of deleted documents (optional)
+    {domain}_docs.clusters.npy       int64 near-duplicate cluster id per doc (optional,
+                                     see medical_qa_dedup)
+
+Field f of document i is blob[offsets[i*F + f] : offsets[i*F + f + 1]].
+The data files are memory-mapped read-only, so forked workers share the
+same page-cache pages instead of each holding a copy on the heap. The
+term files are optional (stores written before they existed still load;
+the reranker then tokenizes those answers itself).
+
+Stores only grow by append_docstore (new ids at the end, the blob is
+extended in place) and shrink by being rewritten under a new "id_epoch"
+(see medical_qa_ingest.compact_domain); deletes in between are
+tombstones. Writers hold checkpoint_lock(exclusive=True) while they swap
+files in, loaders hold the shared lock while they open them.
+
+Usage (convert an existing checkpoint):
+    python src/medical_qa_docstore.py medical_qa_checkpoints/medical_qa_v1.0
+"""
+
+import argparse
+import json
+import mmap
+import os
+import pickle
+from contextlib import contextmanager
+
+import numpy as np
+
+from medical_qa_scoring import answer_terms
+
+
+DOCSTORE_FORMAT_VERSION = 1
+DEFAULT_FIELDS = ("question", "answer")
+
+
+def docstore_paths(faiss_dir, domain):
+    """Return (header, offsets, blob) paths for a domain"""
+    base = os.path.join(faiss_dir, f"{domain}_docs")
+    return f"{base}.json", f"{base}.offsets.npy", f"{base}.blob"
+
+
+def docstore_terms_paths(faiss_dir, domain):
+    """Return (term ids, term offsets) paths for a domain"""
+    base = os.path.join(faiss_dir, f"{domain}_docs")
+    return f"{base}.terms.npy", f"{base}.terms_offsets.npy"
+
+
+def docstore_tombstones_path(faiss_dir, domain):
+    return os.path.join(faiss_dir, f"{domain}_docs.tombstones.npy")
+
+
+def docstore_clusters_path(faiss_dir, domain):
+    return os.path.join(faiss_dir, f"{domain}_docs.clusters.npy")
+
+
+def docstore_exists(faiss_dir, domain):
+    return all(os.path.exists(p) for p in docstore_paths(faiss_dir, domain))
+
+
+# ============================================================================
+# READER
+# ============================================================================
+
+class DocStore:
+    """
+    Read-only, lazily decoded document list
+
+    Behaves like the list of dicts that used to come out of the pickle:
+    `len(docs)`, `docs[i]["answer"]` and iteration all work, but only the
+    requested document is decoded.
+    """
+
+    def __init__(self, faiss_dir, domain):
+        header_path, offsets_path, blob_path = docstore_paths(faiss_dir, domain)
+
+        with open(header_path) as f:
+            header = json.load(f)
+        if header.get("format_version") != DOCSTORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported docstore version in {header_path}: {header.get('format_version')}")
+
+        self.domain = domain
+        self.fields = tuple(header["fields"])
+        self.num_docs = int(header["num_docs"])
+        self.id_epoch = int(header.get("id_epoch", 0))
+
+        # The header is authoritative: after an interrupted append the
+        # offsets may already cover documents the header does not list yet
+        self.offsets = np.load(offsets_path, mmap_mode='r', allow_pickle=False)
+        expected = self.num_docs * len(self.fields) + 1
+        if self.offsets.ndim != 1 or len(self.offsets) < expected:
+            raise ValueError(f"Corrupt docstore offsets in {offsets_path}: {self.offsets.shape} < ({expected},)")
+        self.offsets = self.offsets[:expected]
+
+        self._blob_file = open(blob_path, 'rb')
+        if os.fstat(self._blob_file.fileno()).st_size > 0:
+            self._blob = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._blob = b""
+
+        self.terms = None
+        self.terms_offsets = None
+        terms_path, terms_offsets_path = docstore_terms_paths(faiss_dir, domain)
+        if "answer" in self.fields and os.path.exists(terms_path) and os.path.exists(terms_offsets_path):
+            self.terms = np.load(terms_path, mmap_mode='r', allow_pickle=False)
+            self.terms_offsets = np.load(terms_offsets_path, mmap_mode='r', allow_pickle=False)
+            if self.terms_offsets.ndim != 1 or len(self.terms_offsets) < self.num_docs + 1:
+                raise ValueError(f"Corrupt docstore terms in {terms_offsets_path}")
+            self.terms_offsets = self.terms_offsets[:self.num_docs + 1]
+
+        tombstones_path = docstore_tombstones_path(faiss_dir, domain)
+        if os.path.exists(tombstones_path):
+            deleted = np.load(tombstones_path, allow_pickle=False)
+            self.deleted = deleted[deleted < self.num_docs]
+        else:
+            self.deleted = np.empty(0, dtype=np.int64)
+
+        # documents appended after the clusters were computed are their own cluster
+        clusters_path = docstore_clusters_path(faiss_dir, domain)
+        self.clusters = np.load(clusters_path, allow_pickle=False) if os.path.exists(clusters_path) else None
+
+    def __len__(self):
+        return self.num_docs
+
+    @property
+    def num_live(self):
+        return self.num_docs - len(self.deleted)
+
+    def is_deleted(self, doc_idx):
+        pos = np.searchsorted(self.deleted, doc_idx)
+        return pos < len(self.deleted) and self.deleted[pos] == doc_idx
+
+    def cluster_of(self, doc_idx):
+        """Near-duplicate cluster id of a document, or None if the store has no clusters"""
+        if self.clusters is None:
+            return None
+        return int(self.clusters[doc_idx]) if doc_idx < len(self.clusters) else int(doc_idx)
+
+    def _field(self, slot):
+        start = int(self.offsets[slot])
+        end = int(self.offsets[slot + 1])
+        return self._blob[start:end].decode('utf-8')
+
+    def get_field(self, doc_idx, field):
+        """Decode a single field of a document without building the dict"""
+        doc_idx = self._normalize_index(doc_idx)
+        return self._field(doc_idx * len(self.fields) + self.fields.index(field))
+
+    def answer_terms(self, doc_idx):
+        """Precomputed answer term ids of a document, or None if the store has none"""
+        if self.terms is None:
+            return None
+        doc_idx = self._normalize_index(doc_idx)
+        return self.terms[int(self.terms_offsets[doc_idx]):int(self.terms_offsets[doc_idx + 1])]
+
+    def __getitem__(self, doc_idx):
+        if isinstance(doc_idx, slice):
+            return [self[i] for i in range(*doc_idx.indices(self.num_docs))]
+        doc_idx = self._normalize_index(doc_idx)
+        base = doc_idx * len(self.fields)
+        return {field: self._field(base + f) for f, field in enumerate(self.fields)}
+
+    def __iter__(self):
+        for i in range(self.num_docs):
+            yield self[i]
+
+    def _normalize_index(self, doc_idx):
+        # Same semantics as a Python list, including negative indices
+        doc_idx = int(doc_idx)
+        if doc_idx < 0:
+            doc_idx += self.num_docs
+        if not 0 <= doc_idx < self.num_docs:
+            raise IndexError(f"DocStore index out of range: {doc_idx}")
+        return doc_idx
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._blob_file.close()
+
+    def __repr__(self):
+        return f"DocStore(domain={self.domain!r}, num_docs={self.num_docs})"
+
+
+def load_docs(faiss_dir, domain):
+    """
+    Load a domain's documents, preferring the DocStore format
+
+    Falls back to {domain}_docs.pkl only for checkpoints that have not been
+    converted yet.
+    """
+    if docstore_exists(faiss_dir, domain):
+        return DocStore(faiss_dir, domain)
+
+    docs_path = os.path.join(faiss_dir, f"{domain}_docs.pkl")
+    with open(docs_path, 'rb') as f:
+        return pickle.load(f)
+
+
+# ============================================================================
+# WRITER / CONVERTER
+# ============================================================================
+
+def _raw_to_npy(raw_path, npy_path, dtype, chunk_rows=1 << 20):
+    """Copy a headerless binary array file into a .npy file, chunk by chunk"""
+    count = os.path.getsize(raw_path) // np.dtype(dtype).itemsize
+    out = np.lib.format.open_memmap(npy_path, mode='w+', dtype=dtype, shape=(count,))
+    if count:
+        src = np.memmap(raw_path, dtype=dtype, mode='r')
+        for start in range(0, count, chunk_rows):
+            out[start:start + chunk_rows] = src[start:start + chunk_rows]
+        del src
+    out.flush()
+    del out
+    os.remove(raw_path)
+
+
+class DocStoreWriter:
+    """
+    Incremental DocStore writer
+
+    Text, offsets and answer terms are streamed to temporary files as
+    documents are added, so memory stays constant however many documents
+    go in. close() renames everything into place (header last, so a reader
+    never sees a half-written store); abort() discards the temporaries.
+    Used as a context manager, it closes on success and aborts on error.
+    """
+
+    def __init__(self, faiss_dir, domain, fields=DEFAULT_FIELDS, id_epoch=0):
+        self.domain = domain
+        self.fields = tuple(fields)
+        self.id_epoch = id_epoch
+        self.with_terms = "answer" in self.fields
+        self.num_docs = 0
+        self.header_path, self.offsets_path, self.blob_path = docstore_paths(faiss_dir, domain)
+        self.terms_path, self.terms_offsets_path = docstore_terms_paths(faiss_dir, domain)
+
+        self._blob = open(self.blob_path + ".tmp", 'wb')
+        self._blob_size = 0
+        self._offsets = open(self.offsets_path + ".raw.tmp", 'wb')
+        self._offsets.write(np.zeros(1, dtype=np.int64).tobytes())
+        if self.with_terms:
+            self._terms = open(self.terms_path + ".raw.tmp", 'wb')
+            self._terms_size = 0
+            self._terms_offsets = open(self.terms_offsets_path + ".raw.tmp", 'wb')
+            self._terms_offsets.write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def add(self, doc):
+        offsets = []
+        for field in self.fields:
+            text = str(doc.get(field, "") or "")
+            data = text.encode('utf-8')
+            self._blob.write(data)
+            self._blob_size += len(data)
+            offsets.append(self._blob_size)
+            if field == "answer":
+                terms = answer_terms(text)
+                self._terms.write(terms.tobytes())
+                self._terms_size += len(terms)
+                self._terms_offsets.write(np.int64(self._terms_size).tobytes())
+        self._offsets.write(np.asarray(offsets, dtype=np.int64).tobytes())
+        self.num_docs += 1
+
+    def _raw_files(self):
+        files = [(self._offsets, self.offsets_path, np.int64)]
+        if self.with_terms:
+            files += [(self._terms, self.terms_path, np.int64),
+                      (self._terms_offsets, self.terms_offsets_path, np.int64)]
+        return files
+
+    def close(self):
+        self._blob.close()
+        for f, npy_path, dtype in self._raw_files():
+            f.close()
+            _raw_to_npy(npy_path + ".raw.tmp", npy_path + ".tmp", dtype)
+
+        with open(self.header_path + ".tmp", 'w') as f:
+            json.dump({
+                "format_version": DOCSTORE_FORMAT_VERSION,
+                "domain": self.domain,
+                "fields": list(self.fields),
+                "num_docs": self.num_docs,
+                "id_epoch": self.id_epoch,
+            }, f, indent=2)
+
+        # Header last: its presence marks the store as complete
+        os.replace(self.blob_path + ".tmp", self.blob_path)
+        for _, npy_path, _ in self._raw_files():
+            os.replace(npy_path + ".tmp", npy_path)
+        os.replace(self.header_path + ".tmp", self.header_path)
+        return self.num_docs
+
+    def abort(self):
+        self._blob.close()
+        leftovers = [self.blob_path + ".tmp", self.header_path + ".tmp"]
+        for f, npy_path, _ in self._raw_files():
+            f.close()
+            leftovers += [npy_path + ".raw.tmp", npy_path + ".tmp"]
+        for path in leftovers:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_docstore(faiss_dir, domain, docs, fields=DEFAULT_FIELDS):
+    """
+    Write `docs` (iterable of dicts) as a DocStore
+
+    Files are written to temporaries and renamed into place, so a reader
+    never sees a half-written store.
+    """
+    with DocStoreWriter(faiss_dir, domain, fields) as writer:
+        for doc in docs:
+            writer.add(doc)
+    return writer.num_docs
+
+
+def _save_npy(path, array):
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, array, allow_pickle=False)
+
+
+def append_docstore(faiss_dir, domain, docs):
+    """
+    Append `docs` to an existing DocStore; returns (first new id, number added)
+
+    The blob is extended in place (open readers only ever touch the prefix
+    their offsets cover). Offsets, terms and the header are rewritten to
+    temporaries and renamed in, header last.
+    """
+    store = DocStore(faiss_dir, domain)
+    header_path, offsets_path, blob_path = docstore_paths(faiss_dir, domain)
+    terms_path, terms_offsets_path = docstore_terms_paths(faiss_dir, domain)
+    with_terms = store.terms is not None
+    first_id = store.num_docs
+
+    offsets = []
+    terms = []
+    terms_offsets = []
+    terms_end = int(store.terms_offsets[-1]) if with_terms else 0
+    blob_end = int(store.offsets[-1])
+    with open(blob_path, 'r+b') as blob:
+        blob.truncate(blob_end)     # drop bytes of an interrupted append
+        blob.seek(blob_end)
+        for doc in docs:
+            for field in store.fields:
+                text = str(doc.get(field, "") or "")
+                data = text.encode('utf-8')
+                blob.write(data)
+                blob_end += len(data)
+                offsets.append(blob_end)
+                if field == "answer" and with_terms:
+                    terms.append(answer_terms(text))
+                    terms_end += len(terms[-1])
+                    terms_offsets.append(terms_end)
+        blob.flush()
+        os.fsync(blob.fileno())
+    added = len(offsets) // len(store.fields)
+
+    _save_npy(offsets_path, np.concatenate([store.offsets, np.asarray(offsets, dtype=np.int64)]))
+    replaced = [offsets_path]
+    if with_terms:
+        _save_npy(terms_path, np.concatenate([store.terms[:int(store.terms_offsets[-1])]] + terms))
+        _save_npy(terms_offsets_path, np.concatenate([store.terms_offsets, np.asarray(terms_offsets, dtype=np.int64)]))
+        replaced += [terms_path, terms_offsets_path]
+
+    with open(header_path + ".tmp", 'w') as f:
+        json.dump({
+            "format_version": DOCSTORE_FORMAT_VERSION,
+            "domain": domain,
+            "fields": list(store.fields),
+            "num_docs": first_id + added,
+            "id_epoch": store.id_epoch,
+        }, f, indent=2)
+    store.close()
+
+    for path in replaced:
+        os.replace(path + ".tmp", path)
+    os.replace(header_path + ".tmp", header_path)
+    return first_id, added
+
+
+def write_tombstones(faiss_dir, domain, doc_ids):
+    """Mark documents deleted (ids stay valid until compaction); returns how many were new"""
+    store = DocStore(faiss_dir, domain)
+    num_docs, previous = store.num_docs, store.deleted
+    store.close()
+
+    doc_ids = np.unique(np.asarray(list(doc_ids), dtype=np.int64))
+    if len(doc_ids) and (doc_ids[0] < 0 or doc_ids[-1] >= num_docs):
+        raise IndexError(f"{domain}: document ids must be in [0, {num_docs})")
+    merged = np.union1d(previous, doc_ids).astype(np.int64)
+
+    path = docstore_tombstones_path(faiss_dir, domain)
+    _save_npy(path, merged)
+    os.replace(path + ".tmp", path)
+    return len(merged) - len(previous)
+
+
+# ============================================================================
+# CHECKPOINT LOCK
+# ============================================================================
+
+@contextmanager
+def checkpoint_lock(checkpoint_path, exclusive=False, name=".checkpoint.lock"):
+    """
+    Advisory lock on a checkpoint directory (flock)
+
+    Loaders take it shared while they open files; ingest/compaction take it
+    exclusive while they swap files in, so a loader never sees half of an
+    update. A no-op where flock is unavailable or the directory is
+    read-only (then nobody can be updating it either).
+    """
+    try:
+        import fcntl
+        lock_file = open(os.path.join(checkpoint_path, name), 'a+')
+    except (ImportError, OSError):
+        yield
+        return
+
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def convert_pickle_docs(faiss_dir, domain):
+    """Convert {domain}_docs.pkl (trusted, produced by our notebooks) to a DocStore"""
+    docs_path = os.path.join(faiss_dir, f"{domain}_docs.pkl")
+    with open(docs_path, 'rb') as f:
+        docs = pickle.load(f)
+
+    fields = list(DEFAULT_FIELDS)
+    for doc in docs:
+        for key in doc:
+            if key not in fields:
+                fields.append(key)
+
+    return write_docstore(faiss_dir, domain, docs, fields)
+
+
+def convert_checkpoint(checkpoint_path):
+    """Convert every *_docs.pkl in a checkpoint's faiss_indexes directory"""
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    converted = {}
+    for name in sorted(os.listdir(faiss_dir)):
+        if not name.endswith("_docs.pkl"):
+            continue
+        domain = name[:-len("_docs.pkl")]
+        converted[domain] = convert_pickle_docs(faiss_dir, domain)
+        print(f"  ✓ {domain}: {converted[domain]} documents")
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert *_docs.pkl files to memory-mapped DocStores")
+    parser.add_argument("checkpoint_path", help="e.g. medical_qa_checkpoints/medical_qa_v1.0")
+    args = parser.parse_args()
+
+    print(f"🔄 Converting documents in {args.checkpoint_path}")
+    convert_checkpoint(args.checkpoint_path)
+    print("✅ Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Medical QA System - Query encoder backends
+Selects how queries are embedded from the checkpoint's embedder_config.json
+
+    {
+      "model_name": "sentence-transformers/all-MiniLM-L6-v2",
+      "embedding_dim": 384,
+      "backend": "torch",          # "torch", "torch-int8" or "onnx"
+      "num_threads": null,         # intra-op threads (null = library default)
+      "onnx_path": "embedder.onnx" # relative to the checkpoint, onnx backend only
+    }
+
+  * torch       float32 SentenceTransformer (the reference; documents are
+                always embedded with it)
+  * torch-int8  the same model with Linear layers dynamically quantized to
+                int8 (torch.ao.quantization.quantize_dynamic)
+  * onnx        ONNX Runtime session over an export of the transformer
+                (export-onnx below, optionally int8-quantized), with mean
+                pooling and normalization done in NumPy
+
+num_threads for the torch backends calls torch.set_num_threads, which is
+process-wide (the router shares it); for onnx it only sizes the session.
+
+Before switching a checkpoint to a faster backend, check it against the
+reference:
+    python src/medical_qa_embedder.py validate medical_qa_checkpoints/medical_qa_v1.0 --backend torch-int8
+    python src/medical_qa_embedder.py export-onnx medical_qa_checkpoints/medical_qa_v1.0 --quantize
+    python src/medical_qa_embedder.py validate medical_qa_checkpoints/medical_qa_v1.0 --backend onnx --threads 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+
+EMBEDDER_CONFIG_NAME = "embedder_config.json"
+EMBEDDER_BACKENDS = ("torch", "torch-int8", "onnx")
+DEFAULT_EMBEDDER_CONFIG = {
+    "model_name": "sentence-transformers/all-MiniLM-L6-v2",
+    "embedding_dim": 384,
+    "backend": "torch",
+    "num_threads": None,
+    "onnx_path": "embedder.onnx",
+    "max_seq_length": 256,
+}
+
+
+def load_embedder_config(checkpoint_path):
+    """embedder_config.json merged over the defaults (all defaults if the file is missing)"""
+    config = dict(DEFAULT_EMBEDDER_CONFIG)
+    path = os.path.join(checkpoint_path, EMBEDDER_CONFIG_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            config.update(json.load(f))
+    if config["backend"] not in EMBEDDER_BACKENDS:
+        raise ValueError(f"❌ Unknown embedder backend {config['backend']!r} in {path} "
+                         f"(expected one of {EMBEDDER_BACKENDS})")
+    config["checkpoint_path"] = checkpoint_path
+    return config
+
+
+def _set_torch_threads(num_threads):
+    if num_threads:
+        import torch
+        torch.set_num_threads(int(num_threads))
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class OnnxEmbedder:
+    """
+    SentenceTransformer-compatible encode() over an ONNX Runtime session
+
+    The session runs the exported transformer; mean pooling over the
+    attention mask and L2 normalization match all-MiniLM-L6-v2's
+    Pooling + Normalize modules.
+    """
+
+    def __init__(self, onnx_path, model_name, num_threads=None, max_seq_length=256, normalize=True):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.max_seq_length = max_seq_length
+        self.normalize = normalize
+
+    def _encode_batch(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                return_tensors="np")
+        feed = {name: tokens[name].astype(np.int64) for name in self.input_names if name in tokens}
+        hidden = self.session.run(None, feed)[0]
+        mask = tokens["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Sort by length so each batch pads to similar lengths
+        order = np.argsort([-len(t) for t in texts], kind='stable')
+        out = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            vectors = self._encode_batch([texts[i] for i in rows])
+            if out.shape[1] == 0:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[rows] = vectors
+        if normalize_embeddings and not self.normalize:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+def load_embedder(config, backend=None, num_threads=None):
+    """
+    Query encoder for an embedder config (see load_embedder_config)
+
+    backend / num_threads override the config's values.
+    """
+    backend = backend or config["backend"]
+    num_threads = num_threads or config.get("num_threads")
+
+    if backend == "onnx":
+        onnx_path = os.path.join(config.get("checkpoint_path", ""), config["onnx_path"])
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"❌ ONNX embedder not found at {onnx_path} (run export-onnx first)")
+        return OnnxEmbedder(onnx_path, config["model_name"], num_threads=num_threads,
+                            max_seq_length=config.get("max_seq_length", 256))
+
+    from sentence_transformers import SentenceTransformer
+
+    _set_torch_threads(num_threads)
+    embedder = SentenceTransformer(config["model_name"], device=config.get("device", "cpu"))
+    if backend == "torch-int8":
+        import torch
+        from torch.ao.quantization import quantize_dynamic
+
+        with warnings.catch_warnings():
+            # eager-mode quantization is deprecated upstream (Deprecation- and
+            # UserWarnings) but is still the CPU fast path
+            warnings.simplefilter("ignore")
+            quantize_dynamic(embedder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return embedder
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+
+def export_onnx(checkpoint_path, output_name=None, quantize=False, opset=17):
+    """
+    Export the config's transformer to ONNX (optionally int8) inside the checkpoint
+
+    Returns the written path. embedder_config.json is not changed; set
+    "backend": "onnx" there once validate looks good.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    config = load_embedder_config(checkpoint_path)
+    output_path = os.path.join(checkpoint_path, output_name or config["onnx_path"])
+    model = SentenceTransformer(config["model_name"], device='cpu')
+    tokenizer = model[0].tokenizer
+
+    dummy = tokenizer(["a short example query", "another one"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+
+    class HiddenStates(torch.nn.Module):
+        # keyword arguments: positional order of forward() differs across transformers versions
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    transformer = HiddenStates(model[0].auto_model).eval()
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = output_path + ".fp32" if quantize else output_path
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic as quantize_onnx
+
+        quantize_onnx(fp32_path, output_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    return output_path
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def sample_questions(checkpoint_path, num_queries=500, seed=0):
+    """(question, domain) pairs drawn evenly from the checkpoint's DocStores"""
+    import random
+    from medical_qa_docstore import docstore_exists, load_docs
+
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+        domains = [d for d in json.load(f)['domain_list']
+                   if docstore_exists(faiss_dir, d) or os.path.exists(os.path.join(faiss_dir, f"{d}_docs.pkl"))]
+
+    rng = random.Random(seed)
+    docs = {domain: load_docs(faiss_dir, domain) for domain in domains}
+    samples = []
+    for i in range(num_queries):
+        domain = domains[i % len(domains)]
+        samples.append((docs[domain][rng.randrange(len(docs[domain]))]["question"], domain))
+    for domain_docs in docs.values():
+        if hasattr(domain_docs, "close"):
+            domain_docs.close()
+    return samples
+
+
+def _single_query_ms(embedder, texts, repeats=50):
+    times = []
+    for text in texts[:repeats]:
+        start = time.perf_counter()
+        embedder.encode([text], convert_to_numpy=True)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2], times[min(len(times) - 1, int(len(times) * 0.95))]
+
+
+def validate_embedder(checkpoint_path, backend, num_threads=None, num_queries=500, k=10,
+                      reference=None, candidate=None):
+    """
+    Compare a backend's query embeddings with the float32 reference
+
+    Reports cosine similarity between the two embeddings of each query
+    (mean / p1 / min) and overlap@k of the FAISS results each one gets
+    from the query's domain index, plus single-query latency.
+    reference / candidate: already loaded encoders (default: load them).
+    """
+    from medical_qa_indexes import load_index
+
+    config = load_embedder_config(checkpoint_path)
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+        vector_db_stats = json.load(f).get('vector_db_stats', {})
+
+    samples = sample_questions(checkpoint_path, num_queries)
+    texts = [q for q, _ in samples]
+    reference = reference or load_embedder(config, backend="torch", num_threads=num_threads)
+    candidate = candidate or load_embedder(config, backend=backend, num_threads=num_threads)
+
+    ref = np.asarray(reference.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    cand = np.asarray(candidate.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    cosine = (ref * cand).sum(axis=1) / np.maximum(
+        np.linalg.norm(ref, axis=1) * np.linalg.norm(cand, axis=1), 1e-12)
+
+    overlaps = []
+    domains = np.array([d for _, d in samples])
+    for domain in dict.fromkeys(domains.tolist()):
+        index = load_index(faiss_dir, domain, vector_db_stats.get(domain, {}))
+        rows = np.flatnonzero(domains == domain)
+        _, ref_ids = index.search(np.ascontiguousarray(ref[rows]), k)
+        _, cand_ids = index.search(np.ascontiguousarray(cand[rows]), k)
+        overlaps.extend(len(set(a) & set(b)) / k for a, b in zip(ref_ids.tolist(), cand_ids.tolist()))
+    overlaps = np.asarray(overlaps)
+
+    ref_p50, ref_p95 = _single_query_ms(reference, texts)
+    cand_p50, cand_p95 = _single_query_ms(candidate, texts)
+
+    report = {
+        "backend": backend,
+        "num_threads": num_threads or config.get("num_threads"),
+        "num_queries": len(texts),
+        "cosine_mean": float(cosine.mean()),
+        "cosine_p1": float(np.percentile(cosine, 1)),
+        "cosine_min": float(cosine.min()),
+        f"overlap@{k}_mean": float(overlaps.mean()),
+        f"overlap@{k}_min": float(overlaps.min()),
+        "reference_p50_ms": ref_p50,
+        "reference_p95_ms": ref_p95,
+        "candidate_p50_ms": cand_p50,
+        "candidate_p95_ms": cand_p95,
+    }
+
+    print("="*70)
+    print(f"🔬 {backend} vs float32 reference ({len(texts)} queries, k={k})")
+    print("="*70)
+    print(f"  cosine       mean={report['cosine_mean']:.5f}  p1={report['cosine_p1']:.5f}  min={report['cosine_min']:.5f}")
+    print(f"  overlap@{k:<3} mean={overlaps.mean():.1%}  min={overlaps.min():.1%}  "
+          f"exact={np.mean(overlaps == 1.0):.1%} of queries")
+    print(f"  latency      reference p50={ref_p50:.2f} ms p95={ref_p95:.2f} ms   "
+          f"{backend} p50={cand_p50:.2f} ms p95={cand_p95:.2f} ms ({ref_p50 / max(cand_p50, 1e-9):.2f}x)")
+    return report
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Query encoder backends: export and validation")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    validate = sub.add_parser("validate", help="cosine drift and FAISS top-k overlap vs the float32 model")
+    validate.add_argument("checkpoint_path", help="e.g. medical_qa_checkpoints/medical_qa_v1.0")
+    validate.add_argument("--backend", choices=EMBEDDER_BACKENDS, required=True)
+    validate.add_argument("--threads", type=int)
+    validate.add_argument("--queries", type=int, default=500)
+    validate.add_argument("--k", type=int, default=10)
+    validate.add_argument("--min-cosine", type=float, default=0.99,
+                          help="fail if the p1 cosine similarity is below this")
+    validate.add_argument("--min-overlap", type=float, default=0.9,
+                          help="fail if the mean overlap@k is below this")
+
+    export = sub.add_parser("export-onnx", help="export the transformer to ONNX inside the checkpoint")
+    export.add_argument("checkpoint_path")
+    export.add_argument("--output", help="file name inside the checkpoint (default: config onnx_path)")
+    export.add_argument("--quantize", action="store_true", help="int8 dynamic quantization (onnxruntime)")
+    export.add_argument("--opset", type=int, default=17)
+
+    args = parser.parse_args()
+
+    if args.command == "export-onnx":
+        path = export_onnx(args.checkpoint_path, args.output, args.quantize, args.opset)
+        print(f"✅ Wrote {path}; validate it, then set \"backend\": \"onnx\" in {EMBEDDER_CONFIG_NAME}")
+    elif args.command == "validate":
+        report = validate_embedder(args.checkpoint_path, args.backend, args.threads, args.queries, args.k)
+        failed = []
+        if report["cosine_p1"] < args.min_cosine:
+            failed.append(f"p1 cosine {report['cosine_p1']:.4f} < {args.min_cosine}")
+        if report[f"overlap@{args.k}_mean"] < args.min_overlap:
+            failed.append(f"mean overlap@{args.k} {report[f'overlap@{args.k}_mean']:.3f} < {args.min_overlap}")
+        if failed:
+            print(f"❌ {args.backend} drifts too far: {'; '.join(failed)}")
+            sys.exit(1)
+        print(f"✅ {args.backend} is within tolerance")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Medical QA System - HyDE (hypothetical document embeddings)
+A small local seq2seq model (e.g. google/flan-t5-small saved to a
+directory) writes a hypothetical answer to the question; that answer is
+embedded and searched instead of the question ("replace") or averaged
+with the question's embedding ("fuse"). Answers resemble answers more
+than questions do, which helps short or oddly phrased queries.
+
+Generation is the expensive part on CPU, so results are cached by
+normalized query and capped at max_new_tokens; with a hyde_threshold
+(see medical_qa_inference) HyDE only runs for queries whose direct search
+answered with lower confidence.
+
+Usage (from the repository root):
+    python src/medical_qa_server.py --hyde-model models/flan-t5-small --hyde-threshold 0.8
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from medical_qa_text import normalize_query
+
+
+HYDE_MODES = ("replace", "fuse")
+DEFAULT_MAX_NEW_TOKENS = 64
+HYDE_PROMPT = "Answer the medical question in a few sentences.\nQuestion: {query}\nAnswer:"
+
+
+class HyDEGenerator:
+    """
+    Greedy seq2seq generation of hypothetical answers with an LRU cache
+
+    Keyed by the lowercased, whitespace-collapsed query, which is also
+    what the model sees, so a cached text is exactly what would be
+    generated again. Misses of one generate_many() call share one
+    generate() forward.
+    """
+
+    def __init__(self, model_path, max_new_tokens=DEFAULT_MAX_NEW_TOKENS, cache_size=4096, batch_size=8):
+        if not os.path.isdir(model_path):
+            raise FileNotFoundError(f"❌ HyDE model not found at {model_path}")
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_path, local_files_only=True)
+        self.model.eval()
+        self.model_path = model_path
+        self.max_new_tokens = max_new_tokens
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._generate_lock = threading.Lock()
+        self._cache = OrderedDict()     # normalized query -> hypothetical answer
+
+        self.hits = 0
+        self.misses = 0
+        self.generate_seconds = 0.0
+
+    def _generate(self, prompts):
+        import torch
+
+        encoded = self.tokenizer([HYDE_PROMPT.format(query=p) for p in prompts], padding=True, truncation=True,
+                                 max_length=256, return_tensors="pt")
+        # one generation at a time: torch already spreads a batch over the cores
+        with self._generate_lock, torch.no_grad():
+            output = self.model.generate(input_ids=encoded["input_ids"], attention_mask=encoded["attention_mask"],
+                                         max_new_tokens=self.max_new_tokens, do_sample=False, num_beams=1)
+        return [text.strip() for text in self.tokenizer.batch_decode(output, skip_special_tokens=True)]
+
+    def generate_many(self, queries):
+        """Hypothetical answer for each query"""
+        keys = [normalize_query(q, spell_correct=False) for q in queries]
+        found = {}
+        with self._lock:
+            for key in keys:
+                text = self._cache.get(key)
+                if text is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = text
+            self.hits += sum(1 for key in keys if key in found)
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            start = time.perf_counter()
+            for i in range(0, len(missing), self.batch_size):
+                batch = missing[i:i + self.batch_size]
+                found.update(zip(batch, self._generate(batch)))
+            with self._lock:
+                self.misses += len(missing)
+                self.generate_seconds += time.perf_counter() - start
+                for key in missing:
+                    self._cache[key] = found[key]
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def generate(self, query):
+        return self.generate_many([query])[0]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "generations": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._cache),
+                "ms_per_generation": 1000 * self.generate_seconds / self.misses if self.misses else 0.0,
+                "max_new_tokens": self.max_new_tokens,
+            }
+
+
+def hyde_embeddings(query_embs, hypothetical_embs, mode):
+    """Search vectors: the hypothetical answers' embeddings, or their unit-length mean with the queries'"""
+    if mode == "replace":
+        return hypothetical_embs
+    fused = query_embs + hypothetical_embs
+    norms = np.linalg.norm(fused, axis=1, keepdims=True)
+    return (fused / np.maximum(norms, 1e-12)).astype(np.float32)
@@ -0,0 +1,532 @@
+"""
+Medical QA System - Pluggable FAISS index types
+Build, load and tune per-domain ANN indexes (IVF-Flat, IVF-PQ, HNSW)
+
+The index used for each domain is selected in checkpoint metadata:
+
+    "vector_db_stats": {
+        "Neurology": {
+            "num_docs": 1452,
+            "index_type": "IndexHNSWFlat",
+            "index_file": "Neurology_index_IndexHNSWFlat.faiss",
+            "build_params": {"M": 32, "efConstruction": 80},
+            "search_params": {"efSearch": 64}
+        }
+    }
+
+Domains without "index_file" keep using {domain}_index.faiss (IndexFlatL2),
+which stays on disk as the exact baseline and as the source vectors for
+rebuilds.
+
+A checkpoint can also carry a single unified index over all domains
+(metadata["unified_index"], selected with metadata["index_mode"] =
+"unified" or load_complete_system(..., index_mode="unified")).
+
+Usage:
+    python src/medical_qa_indexes.py build-unified medical_qa_checkpoints/medical_qa_v1.0
+    python src/medical_qa_indexes.py report medical_qa_checkpoints/medical_qa_v1.0
+    python src/medical_qa_indexes.py build medical_qa_checkpoints/medical_qa_v1.0 \\
+        --domain Neurology --index-type IndexHNSWFlat --search efSearch=64
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+from medical_qa_docstore import DocStore, checkpoint_lock, load_docs, write_docstore
+
+
+FLAT_INDEX_TYPE = "IndexFlatL2"
+INDEX_TYPES = (FLAT_INDEX_TYPE, "IndexIVFFlat", "IndexIVFPQ", "IndexHNSWFlat")
+
+# Query-time knobs understood by faiss.ParameterSpace, per index type
+SEARCH_PARAM_NAMES = {
+    FLAT_INDEX_TYPE: (),
+    "IndexIVFFlat": ("nprobe",),
+    "IndexIVFPQ": ("nprobe",),
+    "IndexHNSWFlat": ("efSearch",),
+}
+
+
+# ============================================================================
+# BUILD
+# ============================================================================
+
+def default_build_params(index_type, num_docs, dim=384):
+    """Reasonable build parameters for a domain of `num_docs` vectors"""
+    if index_type == FLAT_INDEX_TYPE:
+        return {}
+    if index_type in ("IndexIVFFlat", "IndexIVFPQ"):
+        # ~4*sqrt(n) lists, but keep >= 39 training points per centroid
+        nlist = max(1, min(int(4 * math.sqrt(num_docs)), num_docs // 39))
+        params = {"nlist": nlist}
+        if index_type == "IndexIVFPQ":
+            # 8-dim sub-vectors; shrink codebooks when the domain is small
+            params["m"] = 48 if dim % 48 == 0 else 1
+            params["nbits"] = max(4, min(8, int(math.log2(max(num_docs // 39, 16)))))
+        return params
+    if index_type == "IndexHNSWFlat":
+        return {"M": 32, "efConstruction": 80}
+    raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+
+
+def build_index(vectors, index_type, build_params=None):
+    """Build and train an index of `index_type` over float32 `vectors`"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_docs, dim = vectors.shape
+    params = dict(default_build_params(index_type, num_docs, dim))
+    params.update(build_params or {})
+
+    if index_type == FLAT_INDEX_TYPE:
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "IndexIVFFlat":
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], faiss.METRIC_L2)
+    elif index_type == "IndexIVFPQ":
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, params["nlist"], params["m"], params["nbits"])
+    elif index_type == "IndexHNSWFlat":
+        index = faiss.IndexHNSWFlat(dim, params["M"])
+        index.hnsw.efConstruction = params["efConstruction"]
+    else:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index, params
+
+
+def flat_vectors(index):
+    """Reconstruct all stored vectors of a flat index"""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# ============================================================================
+# LOAD + QUERY-TIME TUNING
+# ============================================================================
+
+def index_file_for(domain, stats=None):
+    stats = stats or {}
+    return stats.get("index_file", f"{domain}_index.faiss")
+
+
+def set_search_params(index, **search_params):
+    """
+    Set query-time parameters (nprobe for IVF, efSearch for HNSW)
+
+    Parameters that do not apply to the index type are ignored, so the
+    same call can be used on every domain.
+    """
+    index_type = index_type_of(index)
+    allowed = SEARCH_PARAM_NAMES.get(index_type, ())
+    space = faiss.ParameterSpace()
+    for name, value in search_params.items():
+        if value is not None and name in allowed:
+            space.set_index_parameter(index, name, value)
+    return index
+
+
+def index_type_of(index):
+    """Map a FAISS index object to the index_type string used in metadata"""
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return "IndexHNSWFlat"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "IndexIVFPQ"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "IndexIVFFlat"
+    if isinstance(index, faiss.IndexFlatL2):
+        return FLAT_INDEX_TYPE
+    return type(index).__name__
+
+
+def load_index(faiss_dir, domain, stats=None):
+    """Load the index selected for `domain` in metadata and apply its search params"""
+    stats = stats or {}
+    index = faiss.read_index(os.path.join(faiss_dir, index_file_for(domain, stats)))
+    set_search_params(index, **stats.get("search_params", {}))
+    return index
+
+
+def tune_system(system, domain=None, **search_params):
+    """Change nprobe / efSearch on a loaded system, for one domain or all of them"""
+    vector_dbs = system['vector_dbs']
+    lazy = hasattr(vector_dbs, 'loaded_domains')
+    if lazy and domain is None:
+        # domains that have not loaded yet pick these up when they do
+        vector_dbs.search_overrides.update(search_params)
+    domains = [domain] if domain else (vector_dbs.loaded_domains() if lazy else list(vector_dbs))
+    for d in domains:
+        index, _ = vector_dbs[d]
+        set_search_params(index, **search_params)
+    if domain is None and system.get('unified_index') is not None:
+        system['unified_index'].set_search_params(**search_params)
+    # cached answers were produced with the old parameters
+    if system.get('answer_cache') is not None:
+        system['answer_cache'].clear()
+
+
+# ============================================================================
+# CHECKPOINT METADATA
+# ============================================================================
+
+def _write_metadata(checkpoint_path, metadata):
+    # a new timestamp is a new checkpoint id: answer caches keyed on the old one miss
+    metadata["timestamp"] = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(checkpoint_path, "metadata.json")
+    with open(path + ".tmp", 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def build_domain_index(checkpoint_path, domain, index_type, build_params=None, search_params=None):
+    """
+    Build `index_type` for `domain` from its flat baseline and select it in metadata.json
+    """
+    from medical_qa_ingest import WRITER_LOCK
+
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with checkpoint_lock(checkpoint_path, exclusive=True, name=WRITER_LOCK):
+        with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+            metadata = json.load(f)
+
+        flat = faiss.read_index(os.path.join(faiss_dir, f"{domain}_index.faiss"))
+        stats = metadata.setdefault('vector_db_stats', {}).setdefault(domain, {})
+
+        tmp_path = None
+        if index_type == FLAT_INDEX_TYPE:
+            for key in ("index_file", "build_params", "search_params"):
+                stats.pop(key, None)
+        else:
+            index, used_params = build_index(flat_vectors(flat), index_type, build_params)
+            index_file = f"{domain}_index_{index_type}.faiss"
+            tmp_path = os.path.join(faiss_dir, index_file + ".tmp")
+            faiss.write_index(index, tmp_path)
+            stats["index_file"] = index_file
+            stats["build_params"] = used_params
+            stats["search_params"] = dict(search_params or {})
+
+        stats["num_docs"] = int(flat.ntotal)
+        stats["index_type"] = index_type
+        with checkpoint_lock(checkpoint_path, exclusive=True):
+            if tmp_path is not None:
+                os.replace(tmp_path, os.path.join(faiss_dir, index_file))
+            _write_metadata(checkpoint_path, metadata)
+    return stats
+
+
+# ============================================================================
+# UNIFIED INDEX (all domains in one index, filtered by ID range)
+# ============================================================================
+
+UNIFIED_DOCS_NAME = "unified"
+
+
+class UnifiedIndex:
+    """
+    One FAISS index holding every domain, with a contiguous ID range per domain
+
+    A query searches only its router-selected domains in a single call
+    (via an IDSelector over their ranges), and hits come back ranked by
+    true L2 distance across domains.
+    """
+
+    def __init__(self, index, docs, domain_ranges):
+        self.index = index
+        self.docs = docs
+        self.domain_ranges = {d: (int(start), int(end)) for d, (start, end) in domain_ranges.items()}
+        ordered = sorted(self.domain_ranges.items(), key=lambda item: item[1][0])
+        self._domains = [d for d, _ in ordered]
+        self._starts = np.array([start for _, (start, _) in ordered], dtype=np.int64)
+        # tuple(domains) -> (search params, selectors kept alive for FAISS)
+        self._params_cache = {}
+
+    @property
+    def domains(self):
+        return list(self._domains)
+
+    def _search_params(self, domains):
+        key = tuple(sorted(d for d in domains if d in self.domain_ranges))
+        if key in self._params_cache:
+            return self._params_cache[key]
+
+        selectors = [faiss.IDSelectorRange(*self.domain_ranges[d]) for d in key]
+        sel = selectors[0] if selectors else faiss.IDSelectorRange(0, 0)
+        for other in selectors[1:]:
+            sel = faiss.IDSelectorOr(sel, other)
+            selectors.append(sel)
+
+        index_type = index_type_of(self.index)
+        if index_type in ("IndexIVFFlat", "IndexIVFPQ"):
+            params = faiss.SearchParametersIVF(sel=sel, nprobe=faiss.extract_index_ivf(self.index).nprobe)
+        elif index_type == "IndexHNSWFlat":
+            params = faiss.SearchParametersHNSW(sel=sel, efSearch=self.index.hnsw.efSearch)
+        else:
+            params = faiss.SearchParameters(sel=sel)
+
+        self._params_cache[key] = (params, selectors)
+        return self._params_cache[key]
+
+    def domain_of(self, doc_id):
+        return self._domains[int(np.searchsorted(self._starts, doc_id, side='right')) - 1]
+
+    def search(self, query_embs, domains, k):
+        """
+        Search `domains` for every row of `query_embs`
+
+        Returns one candidate list per row, in the same shape as the
+        per-domain path ({"answer", "domain", "doc_id", "dist", "terms"}), sorted by distance.
+        """
+        params, _ = self._search_params(domains)
+        D, I = self.index.search(np.ascontiguousarray(query_embs, dtype=np.float32), k, params=params)
+
+        results = []
+        for D_row, I_row in zip(D, I):
+            candidates = []
+            for dist, doc_id in zip(D_row, I_row):
+                if doc_id < 0:
+                    continue
+                candidates.append({
+                    "answer": self.docs.get_field(doc_id, "answer"),
+                    "domain": self.domain_of(doc_id),
+                    "doc_id": int(doc_id),
+                    "dist": float(dist),
+                    "terms": self.docs.answer_terms(doc_id)
+                })
+            results.append(candidates)
+        return results
+
+    def set_search_params(self, **search_params):
+        set_search_params(self.index, **search_params)
+        # cached SearchParameters carry nprobe/efSearch, rebuild them
+        self._params_cache = {}
+
+    def __len__(self):
+        return self.index.ntotal
+
+
+def build_unified_index(checkpoint_path, index_type=FLAT_INDEX_TYPE, build_params=None,
+                        search_params=None, domains=None, set_default=False):
+    """
+    Merge the live documents of the per-domain flat indexes into one index + DocStore
+
+    Writes faiss_indexes/unified_index.faiss and unified_docs.*, and records
+    the per-domain ID ranges under metadata["unified_index"] (no longer
+    stale). set_default also sets metadata["index_mode"] to "unified".
+    """
+    from medical_qa_ingest import WRITER_LOCK
+
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with checkpoint_lock(checkpoint_path, exclusive=True, name=WRITER_LOCK):
+        with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+            metadata = json.load(f)
+
+        vectors = []
+        all_docs = []
+        domain_ranges = {}
+        for domain in domains or metadata['domain_list']:
+            index_path = os.path.join(faiss_dir, f"{domain}_index.faiss")
+            if not os.path.exists(index_path):
+                print(f"  ❌ {domain}: {index_path} not found, skipping")
+                continue
+
+            domain_vectors = flat_vectors(faiss.read_index(index_path))
+            docs = load_docs(faiss_dir, domain)
+            if len(docs) != len(domain_vectors):
+                raise ValueError(f"{domain}: {len(domain_vectors)} vectors but {len(docs)} documents")
+
+            # tombstoned documents are left out: unified search has no delete filter
+            live = np.arange(len(docs))
+            if isinstance(docs, DocStore) and len(docs.deleted):
+                live = np.setdiff1d(live, docs.deleted)
+
+            start = len(all_docs)
+            vectors.append(domain_vectors[live])
+            all_docs.extend(docs[int(i)] for i in live)
+            domain_ranges[domain] = [start, len(all_docs)]
+            print(f"  ✓ {domain}: ids [{start}, {len(all_docs)})")
+
+        index, used_params = build_index(np.concatenate(vectors), index_type, build_params)
+        index_file = "unified_index.faiss"
+        tmp_path = os.path.join(faiss_dir, index_file + ".tmp")
+        faiss.write_index(index, tmp_path)
+
+        metadata["unified_index"] = {
+            "index_file": index_file,
+            "index_type": index_type,
+            "build_params": used_params,
+            "search_params": dict(search_params or {}),
+            "docs": UNIFIED_DOCS_NAME,
+            "num_docs": len(all_docs),
+            "domain_ranges": domain_ranges,
+            "stale": False,
+        }
+        if set_default:
+            metadata["index_mode"] = "unified"
+        with checkpoint_lock(checkpoint_path, exclusive=True):
+            os.replace(tmp_path, os.path.join(faiss_dir, index_file))
+            write_docstore(faiss_dir, UNIFIED_DOCS_NAME, all_docs)
+            _write_metadata(checkpoint_path, metadata)
+    return metadata["unified_index"]
+
+
+def load_unified_index(faiss_dir, unified_stats):
+    """Load the unified index described by metadata["unified_index"]"""
+    index = faiss.read_index(os.path.join(faiss_dir, unified_stats["index_file"]))
+    set_search_params(index, **unified_stats.get("search_params", {}))
+    docs = DocStore(faiss_dir, unified_stats.get("docs", UNIFIED_DOCS_NAME))
+    return UnifiedIndex(index, docs, unified_stats["domain_ranges"])
+
+
+# ============================================================================
+# RECALL@K vs LATENCY REPORT
+# ============================================================================
+
+def default_search_sweep(index_type):
+    if index_type in ("IndexIVFFlat", "IndexIVFPQ"):
+        return [{"nprobe": n} for n in (1, 2, 4, 8, 16, 32)]
+    if index_type == "IndexHNSWFlat":
+        return [{"efSearch": ef} for ef in (16, 32, 64, 128, 256)]
+    return [{}]
+
+
+def _per_query_latency(index, queries, k):
+    # The pipeline searches one query at a time, so time it that way
+    start = time.perf_counter()
+    for i in range(len(queries)):
+        index.search(queries[i:i + 1], k)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def recall_report(vectors, k=10, num_queries=200, index_types=INDEX_TYPES[1:], seed=0):
+    """
+    Recall@k and per-query latency of each index type against IndexFlatL2
+
+    Queries are database vectors with small Gaussian noise, so each one
+    has a realistic (non-trivial) neighbourhood.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.RandomState(seed)
+    sample = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    noise_scale = float(vectors.std()) * 0.1
+    queries = (vectors[sample] + rng.normal(0, noise_scale, (len(sample), vectors.shape[1]))).astype(np.float32)
+
+    flat, _ = build_index(vectors, FLAT_INDEX_TYPE)
+    _, truth = flat.search(queries, k)
+    rows = [{
+        "index_type": FLAT_INDEX_TYPE,
+        "build_params": {},
+        "search_params": {},
+        "recall": 1.0,
+        "latency_us": _per_query_latency(flat, queries, k) * 1e6,
+    }]
+
+    for index_type in index_types:
+        index, build_params = build_index(vectors, index_type)
+        for search_params in default_search_sweep(index_type):
+            set_search_params(index, **search_params)
+            _, found = index.search(queries, k)
+            hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+            rows.append({
+                "index_type": index_type,
+                "build_params": build_params,
+                "search_params": search_params,
+                "recall": hits / float(truth.size),
+                "latency_us": _per_query_latency(index, queries, k) * 1e6,
+            })
+    return rows
+
+
+def report_checkpoint(checkpoint_path, domains=None, k=10, num_queries=200):
+    """Print the recall@k / latency table for each domain of a checkpoint"""
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+        metadata = json.load(f)
+
+    report = {}
+    for domain in domains or metadata['domain_list']:
+        index_path = os.path.join(faiss_dir, f"{domain}_index.faiss")
+        if not os.path.exists(index_path):
+            print(f"  ❌ {domain}: {index_path} not found, skipping")
+            continue
+
+        vectors = flat_vectors(faiss.read_index(index_path))
+        rows = recall_report(vectors, k=k, num_queries=num_queries)
+        report[domain] = rows
+
+        print(f"\n📊 {domain} ({len(vectors)} docs), recall@{k} vs {FLAT_INDEX_TYPE}")
+        print(f"   {'index':<15} {'build':<28} {'search':<16} {'recall':>7} {'µs/query':>10}")
+        for row in rows:
+            build = ",".join(f"{k_}={v}" for k_, v in row["build_params"].items()) or "-"
+            search = ",".join(f"{k_}={v}" for k_, v in row["search_params"].items()) or "-"
+            print(f"   {row['index_type']:<15} {build:<28} {search:<16} "
+                  f"{row['recall']:>7.3f} {row['latency_us']:>10.1f}")
+    return report
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def _parse_params(pairs):
+    params = {}
+    for pair in pairs or []:
+        key, value = pair.split("=", 1)
+        params[key] = int(value)
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and evaluate per-domain FAISS indexes")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    report = sub.add_parser("report", help="recall@k vs latency against the flat baseline")
+    report.add_argument("checkpoint_path")
+    report.add_argument("--domains", nargs="+")
+    report.add_argument("--k", type=int, default=10)
+    report.add_argument("--num-queries", type=int, default=200)
+
+    build = sub.add_parser("build", help="build an index for a domain and select it in metadata.json")
+    build.add_argument("checkpoint_path")
+    build.add_argument("--domain", required=True)
+    build.add_argument("--index-type", required=True, choices=INDEX_TYPES)
+    build.add_argument("--param", nargs="*", help="build params, e.g. nlist=64 M=32")
+    build.add_argument("--search", nargs="*", help="search params, e.g. nprobe=8 efSearch=64")
+
+    unified = sub.add_parser("build-unified", help="merge all domains into one filtered index")
+    unified.add_argument("checkpoint_path")
+    unified.add_argument("--index-type", default=FLAT_INDEX_TYPE, choices=INDEX_TYPES)
+    unified.add_argument("--param", nargs="*", help="build params, e.g. nlist=64 M=32")
+    unified.add_argument("--search", nargs="*", help="search params, e.g. nprobe=8 efSearch=64")
+    unified.add_argument("--set-default", action="store_true",
+                         help="also set metadata index_mode to 'unified'")
+
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report_checkpoint(args.checkpoint_path, args.domains, k=args.k, num_queries=args.num_queries)
+    elif args.command == "build":
+        stats = build_domain_index(
+            args.checkpoint_path, args.domain, args.index_type,
+            build_params=_parse_params(args.param),
+            search_params=_parse_params(args.search),
+        )
+        print(f"✅ {args.domain}: {json.dumps(stats)}")
+    elif args.command == "build-unified":
+        stats = build_unified_index(
+            args.checkpoint_path, args.index_type,
+            build_params=_parse_params(args.param),
+            search_params=_parse_params(args.search),
+            set_default=args.set_default,
+        )
+        print(f"✅ Unified index: {stats['num_docs']} documents, {len(stats['domain_ranges'])} domains")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,126 +2,109 @@
 Medical QA System - FULL PRODUCTION VERSION
 Includes HyDE, LLM Reranking, and Text Generation
 Optimized for good laptops (4-8GB RAM)
+
+Importing this module is cheap: torch, faiss and sentence_transformers
+are imported by the functions that load or run models, and the router
+classes (MedicalMoE, ...) are resolved from medical_qa_models on first
+access.
 """
 
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-import faiss
-import pickle
 import json
 import os
-import re
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from datetime import datetime
+
+from medical_qa_bm25 import reciprocal_rank_fusion
+from medical_qa_cache import CachedEmbedder
+from medical_qa_docstore import DocStore, checkpoint_lock, docstore_exists, load_docs
+from medical_qa_embedder import load_embedder, load_embedder_config
+from medical_qa_hyde import DEFAULT_MAX_NEW_TOKENS, HYDE_MODES, HyDEGenerator, hyde_embeddings
+from medical_qa_rerank import DEFAULT_BUDGET_MS, load_reranker
+from medical_qa_sentences import load_sentence_indexes
+from medical_qa_router import (
+    DEFAULT_MAX_FANOUT,
+    DEFAULT_MIN_FANOUT,
+    ROUTER_BACKENDS,
+    FanoutStats,
+    GatingRouter,
+    load_gating_router,
+    select_routes,
+)
+from medical_qa_scoring import answer_terms, keyword_score, llm_rerank, validate_medical_answer
 
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
 CHECKPOINT_DIR = "medical_qa_checkpoints"
-device = torch.device('cpu')
 
-print("="*70)
-print("🏥 MEDICAL QA SYSTEM - FULL PRODUCTION VERSION")
-print("="*70)
+# Provided lazily by __getattr__ so `import medical_qa_inference` stays torch-free
+_MODEL_EXPORTS = ("MedicalExpert", "GatingNetwork", "MedicalMoE", "device")
 
-# ============================================================================
-# MODEL CLASSES (Same as before)
-# ============================================================================
 
-class MedicalExpert(nn.Module):
-    """Single expert neural network"""
-    def __init__(self, input_dim=384, hidden_dim=512, output_dim=384):
-        super().__init__()
-        self.network = nn.Sequential(
-            nn.Linear(input_dim, hidden_dim),
-            nn.Tanh(),
-            nn.Linear(hidden_dim, output_dim)
-        )
-    def forward(self, x):
-        return self.network(x)
-
-
-class GatingNetwork(nn.Module):
-    """Gating network for routing"""
-    def __init__(self, input_dim=384, num_experts=3, hidden_dim=256):
-        super().__init__()
-        self.fc1 = nn.Linear(input_dim, hidden_dim)
-        self.relu = nn.ReLU()
-        self.dropout = nn.Dropout(0.1)
-        self.fc2 = nn.Linear(hidden_dim, num_experts)
-    def forward(self, x):
-        x = self.fc1(x)
-        x = self.relu(x)
-        x = self.dropout(x)
-        return self.fc2(x)
-
-
-class MedicalMoE(nn.Module):
-    """Mixture of Experts"""
-    def __init__(self, input_dim=384, hidden_dim=512, output_dim=384, num_experts=3, top_k=2):
-        super().__init__()
-        self.num_experts = num_experts
-        self.top_k = min(top_k, num_experts)
-        self.experts = nn.ModuleList([
-            MedicalExpert(input_dim, hidden_dim, output_dim) for _ in range(num_experts)
-        ])
-        self.gating = GatingNetwork(input_dim, num_experts)
-        self.expert_names = None
-
-    def forward(self, x, return_router_logits=False):
-        router_logits = self.gating(x)
-        if return_router_logits:
-            return router_logits
-        router_probs = F.softmax(router_logits, dim=-1)
-        topk_probs, topk_indices = torch.topk(router_probs, self.top_k, dim=1)
-        topk_probs = topk_probs / topk_probs.sum(dim=1, keepdim=True)
-        batch_size = x.size(0)
-        out = torch.zeros(batch_size, x.size(1), device=x.device)
-        for i in range(self.top_k):
-            expert_idx_col = topk_indices[:, i]
-            weights = topk_probs[:, i]
-            for b in range(batch_size):
-                eidx = expert_idx_col[b].item()
-                out[b] += weights[b] * self.experts[eidx](x[b].unsqueeze(0)).squeeze(0)
-        return out, topk_indices
+def __getattr__(name):
+    if name in _MODEL_EXPORTS:
+        import medical_qa_models
+        return getattr(medical_qa_models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ============================================================================
 # LOAD CHECKPOINT FUNCTION
 # ============================================================================
 
-def load_complete_system(checkpoint_name="medical_qa_v1.0"):
-    """Load complete system with all components"""
+LOAD_MODES = ("sequential", "parallel", "lazy")
+RETRIEVAL_MODES = ("dense", "hybrid")
+DUPLICATE_OVERFETCH = 2     # candidates searched per slot when collapsing near-duplicates
+MAX_SEARCH_WORKERS = 4      # default per-domain search threads (capped by the core count)
 
-    checkpoint_path = os.path.join(CHECKPOINT_DIR, checkpoint_name)
-    
-    if not os.path.exists(checkpoint_path):
-        raise FileNotFoundError(f"❌ Checkpoint not found: {checkpoint_path}")
-    
-    print(f"\n🔄 Loading checkpoint: {checkpoint_name}")
-    
-    # Load metadata
-    print("  1️⃣ Loading Metadata...")
-    with open(os.path.join(checkpoint_path, "metadata.json")) as f:
-        metadata = json.load(f)
-    
-    domain_list = metadata['domain_list']
-    domain_to_label = metadata['domain_to_label']
-    num_classes = metadata['num_domains']
-    label_to_domain = {int(k): v for k, v in enumerate(domain_list)}
-    print(f"     ✓ Domains: {', '.join(domain_list)}")
-    
-    # Load embedder
-    print("  2️⃣ Loading Embedder...")
-    embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", device='cpu')
-    print(f"     ✓ all-MiniLM-L6-v2 loaded")
+
+def _timed(report_section, name, fn, *args):
+    """Run fn(*args), recording its wall time (seconds) under report_section[name]"""
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        report_section[name] = time.perf_counter() - start
+
+
+# transformers' from_pretrained shares initialization state between threads:
+# models load one at a time, while routers, indexes and BM25 load alongside
+_MODEL_LOAD_LOCK = threading.Lock()
+
+
+def _load_model(fn, *args):
+    with _MODEL_LOAD_LOCK:
+        return fn(*args)
+
+
+def _load_embedder(embedder_config, embedding_cache=None):
+    embedder = load_embedder(embedder_config)
+    if embedding_cache is not None:
+        embedder = CachedEmbedder(embedder, embedding_cache)
+    return embedder
+
+
+def _load_router(checkpoint_path, num_classes, domain_list, router_backend="numpy"):
+    """
+    Return (moe_model, gating_router)
+
+    numpy backend: an up-to-date router_gating.npz is used as is and the
+    MoE (and torch) is never loaded, so moe_model is None; otherwise the
+    gating weights are copied out of the loaded MoE. torch backend:
+    gating_router is None and routing runs the MoE module.
+    """
+    if router_backend == "numpy":
+        gating_router = load_gating_router(checkpoint_path)
+        if gating_router is not None and gating_router.num_domains == num_classes:
+            return None, gating_router
     
-    # Load MoE model
-    print("  3️⃣ Loading MoE Router...")
+    import torch
+    from medical_qa_models import MedicalMoE, device
+
     moe_checkpoint = torch.load(os.path.join(checkpoint_path, "moe_router.pt"), map_location=device)
     
     moe_model = MedicalMoE(
@@ -135,209 +118,657 @@ def load_complete_system(checkpoint_name="medical_qa_v1.0"):
     moe_model.expert_names = domain_list
     moe_model.to(device)
     moe_model.eval()
-    print(f"     ✓ MoE Router loaded (98.10% accuracy)")
-    
-    # Load FAISS indexes
-    # Load FAISS indexes
-    print("  4️⃣ Loading FAISS Indexes...")
-    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
-    vector_dbs = {}
+    return moe_model, GatingRouter.from_moe(moe_model) if router_backend == "numpy" else None
 
-    for domain in domain_list:
-        index_path = os.path.join(faiss_dir, f"{domain}_index.faiss")
-        docs_path = os.path.join(faiss_dir, f"{domain}_docs.pkl")
-        
-        # Debug: Check if files exist
-        if not os.path.exists(index_path):
-            print(f"     ❌ {domain}: Index file NOT found at {index_path}")
-            continue
-        if not os.path.exists(docs_path):
-            print(f"     ❌ {domain}: Docs file NOT found at {docs_path}")
-            continue
-        
-        try:
-            index = faiss.read_index(index_path)
-            with open(docs_path, 'rb') as f:
-                docs = pickle.load(f)
-            
-            vector_dbs[domain] = (index, docs)
-            print(f"     ✓ {domain}: {len(docs)} documents")
-        except Exception as e:
-            print(f"     ❌ {domain}: Error loading - {e}")
-            continue
 
+def _missing_domain_files(faiss_dir, domain, domain_stats):
+    """Return an error message if a domain's index or docs are missing, else None"""
+    from medical_qa_indexes import index_file_for
+
+    index_path = os.path.join(faiss_dir, index_file_for(domain, domain_stats))
+    docs_path = os.path.join(faiss_dir, f"{domain}_docs.pkl")
+    if not os.path.exists(index_path):
+        return f"Index file NOT found at {index_path}"
+    if not docstore_exists(faiss_dir, domain) and not os.path.exists(docs_path):
+        return f"Docs file NOT found at {docs_path}"
+    return None
+
+
+class SearchPool:
+    """
+    Bounded thread pool shared by every query's per-domain FAISS searches
+
+    FAISS releases the GIL, so the domains a query is routed to can be
+    searched at once. FAISS's OpenMP team is shrunk to cores // workers
+    threads so that concurrent requests filling the pool don't
+    oversubscribe the cores. OpenMP keeps that limit per thread: the
+    pool's workers set it as they start, and other threads that search
+    (the constructing thread, scheduler and server workers) call
+    cap_thread().
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.omp_threads = max(1, (os.cpu_count() or 1) // workers)
+        self.cap_thread()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="medqa-search",
+                                            initializer=self.cap_thread)
+
+    def cap_thread(self):
+        """Limit FAISS's OpenMP team on the calling thread"""
+        import faiss
+
+        faiss.omp_set_num_threads(self.omp_threads)
+
+    def worker_omp_threads(self):
+        """OpenMP team size a pool worker actually runs with"""
+        import faiss
+
+        return self._executor.submit(faiss.omp_get_max_threads).result()
+
+    def map(self, fn, items):
+        return list(self._executor.map(fn, items))
+
+    def stats(self):
+        return {"workers": self.workers, "omp_threads": self.omp_threads}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def default_search_workers():
+    return min(MAX_SEARCH_WORKERS, os.cpu_count() or 1)
+
+
+def _load_domain(faiss_dir, domain, domain_stats):
+    from medical_qa_indexes import load_index
+
+    return load_index(faiss_dir, domain, domain_stats), load_docs(faiss_dir, domain)
+
+
+class LazyVectorDBs(Mapping):
+    """
+    domain -> (index, docs), loading each domain on first access
+
+    Membership and iteration only look at which domains have files on
+    disk, so routing code can test `domain in vector_dbs` without loading
+    anything. Search parameters set before a domain loads are applied when
+    it does.
+    """
+
+    def __init__(self, faiss_dir, domains, vector_db_stats, load_report):
+        self.faiss_dir = faiss_dir
+        self.vector_db_stats = vector_db_stats
+        self.load_report = load_report
+        self.search_overrides = {}
+        self._domains = list(domains)
+        self._loaded = {}
+        self._locks = {domain: threading.Lock() for domain in self._domains}
+
+    def __getitem__(self, domain):
+        entry = self._loaded.get(domain)
+        if entry is not None:
+            return entry
+        if domain not in self._locks:
+            raise KeyError(domain)
+        with self._locks[domain], checkpoint_lock(os.path.dirname(self.faiss_dir)):
+            if domain not in self._loaded:
+                index, docs = _timed(
+                    self.load_report['domains'], domain, _load_domain,
+                    self.faiss_dir, domain, self.vector_db_stats.get(domain, {})
+                )
+                if self.search_overrides:
+                    from medical_qa_indexes import set_search_params
+                    set_search_params(index, **self.search_overrides)
+                self._loaded[domain] = (index, docs)
+        return self._loaded[domain]
+
+    def __contains__(self, domain):
+        return domain in self._locks
+
+    def __iter__(self):
+        return iter(self._domains)
+
+    def __len__(self):
+        return len(self._domains)
+
+    def loaded_domains(self):
+        return list(self._loaded)
+
+
+def format_load_report(report):
+    """Render a load_complete_system timing report as text"""
+    lines = [f"Checkpoint {report['checkpoint']} ({report['load_mode']} load): {report['total']:.2f}s total"]
+    for stage, seconds in report['stages'].items():
+        lines.append(f"  {stage:<36} {seconds:8.3f}s")
+    for domain, seconds in report['domains'].items():
+        lines.append(f"  {'domain ' + domain:<36} {seconds:8.3f}s")
+    for domain in report.get('lazy_domains', []):
+        if domain not in report['domains']:
+            lines.append(f"  {'domain ' + domain:<36}   (lazy)")
+    for domain, error in report['errors'].items():
+        lines.append(f"  {'domain ' + domain:<36} ERROR: {error}")
+    return "\n".join(lines)
+
+
+def load_complete_system(checkpoint_name="medical_qa_v1.0", index_mode=None, embedding_cache=None,
+                         answer_cache=None, load_mode="parallel", retrieval_mode=None,
+                         collapse_duplicates=None, router_backend=None, fanout_mass=None, min_fanout=None,
+                         max_fanout=None, search_workers=None, cross_encoder=None, rerank_budget_ms=None,
+                         hyde_model=None, hyde_mode=None, hyde_threshold=None, hyde_max_new_tokens=None,
+                         sentence_window=None, verbose=True):
+    """
+    Load complete system with all components
+
+    index_mode: "per_domain" (one FAISS index per domain) or "unified" (one
+    index over all domains, see medical_qa_indexes.UnifiedIndex). Defaults
+    to metadata["index_mode"], else "per_domain". A unified index marked
+    stale by ingest/delete is not used: loading falls back to "per_domain".
+    embedding_cache: optional medical_qa_cache.EmbeddingCache placed in
+    front of embedder.encode.
+    answer_cache: optional medical_qa_cache.AnswerCache consulted by
+    retrieve_answer_full / retrieve_answers_batch; it is re-bound (and
+    emptied) whenever a different checkpoint is loaded.
+    load_mode: "sequential" (one stage after another), "parallel" (embedder,
+    router and every domain load on a thread pool) or "lazy" (embedder and
+    router in parallel, each domain on its first routed query).
+    retrieval_mode: "dense" (FAISS only) or "hybrid" (FAISS + per-domain
+    BM25, fused by reciprocal rank; see medical_qa_bm25). Defaults to
+    metadata["retrieval_mode"], else "dense". Hybrid needs per_domain
+    index mode; domains without a BM25 index fall back to dense hits.
+    collapse_duplicates: keep one candidate per near-duplicate group before
+    reranking (see collapse_candidates). Defaults to
+    metadata["collapse_duplicates"], else False.
+    router_backend: "numpy" (gating network as two NumPy matmuls, see
+    medical_qa_router) or "torch" (the MoE module). Defaults to
+    metadata["router_backend"], else "numpy".
+    fanout_mass / min_fanout / max_fanout: routing policy, see
+    medical_qa_router.select_routes. Each domain is searched in router
+    probability order until the searched domains hold fanout_mass of the
+    probability, within [min_fanout, max_fanout]. Default to the same
+    metadata keys, else None / 1 / 2 (always the top 2 domains).
+    Searches saved against the fixed top-2 are counted in
+    system['fanout_stats'].
+    search_workers: threads of the SearchPool that searches a query's
+    domains concurrently (per_domain index mode). Defaults to
+    metadata["search_workers"], else min(MAX_SEARCH_WORKERS, cores);
+    1 searches domains one after another.
+    cross_encoder: directory of a local cross-encoder that reranks the
+    candidates in place of llm_rerank (see medical_qa_rerank). Defaults to
+    metadata["cross_encoder"], else None (heuristic reranking only).
+    rerank_budget_ms: per-query time the cross-encoder may take before
+    the heuristic ranking is used instead (0 = no limit). Defaults to
+    metadata["rerank_budget_ms"], else DEFAULT_BUDGET_MS.
+    hyde_model: directory of a local seq2seq model that writes a
+    hypothetical answer to search with (see medical_qa_hyde and
+    apply_hyde). hyde_mode: "replace" or "fuse" (default). hyde_threshold:
+    only queries whose direct answer has lower confidence (or failed) get
+    HyDE; None = every query. hyde_max_new_tokens caps generation. All
+    default to the same metadata keys; without a model HyDE is off.
+    sentence_window: search the domains' sentence indexes (see
+    medical_qa_sentences) and answer with the best sentence plus this many
+    sentences either side. Defaults to metadata["sentence_window"], else
+    None (whole answers). Needs per_domain index mode and dense retrieval;
+    domains without a current sentence index fall back to their passages.
+
+    The per-stage timing report is returned as system['load_report'] and
+    printed when verbose.
+    """
+
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"❌ Unknown load_mode: {load_mode} (expected one of {LOAD_MODES})")
+
+    checkpoint_path = os.path.join(CHECKPOINT_DIR, checkpoint_name)
+    
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"❌ Checkpoint not found: {checkpoint_path}")
     
-    print(f"\n✅ System loaded successfully!\n")
+    load_started = time.perf_counter()
+    report = {
+        'checkpoint': checkpoint_name,
+        'load_mode': load_mode,
+        'stages': {},
+        'domains': {},
+        'errors': {},
+    }
+    stages = report['stages']
+    
+    # Shared lock: ingest / compaction cannot swap files in while we open them
+    with checkpoint_lock(checkpoint_path):
+        # Load metadata
+        def read_metadata():
+            with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+                return json.load(f)
+        metadata = _timed(stages, 'metadata', read_metadata)
+        embedder_config = load_embedder_config(checkpoint_path)
+    
+        domain_list = metadata['domain_list']
+        domain_to_label = metadata['domain_to_label']
+        num_classes = metadata['num_domains']
+        label_to_domain = {int(k): v for k, v in enumerate(domain_list)}
+    
+        faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+        vector_db_stats = metadata.get('vector_db_stats', {})
+        index_mode = index_mode or metadata.get('index_mode', 'per_domain')
+        if index_mode == 'unified' and 'unified_index' not in metadata:
+            raise ValueError(f"❌ Checkpoint {checkpoint_name} has no unified index")
+        if index_mode not in ('per_domain', 'unified'):
+            raise ValueError(f"❌ Unknown index_mode: {index_mode}")
+        if index_mode == 'unified' and metadata['unified_index'].get('stale'):
+            # it would serve deleted documents and miss new ones
+            if verbose:
+                print("⚠️ Unified index predates the last ingest/delete, using per-domain indexes; "
+                      "rebuild it with `medical_qa_indexes.py build-unified`")
+            index_mode = 'per_domain'
+        retrieval_mode = retrieval_mode or metadata.get('retrieval_mode', 'dense')
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"❌ Unknown retrieval_mode: {retrieval_mode} (expected one of {RETRIEVAL_MODES})")
+        if retrieval_mode == 'hybrid' and index_mode != 'per_domain':
+            raise ValueError("❌ Hybrid retrieval needs index_mode='per_domain'")
+        if collapse_duplicates is None:
+            collapse_duplicates = metadata.get('collapse_duplicates', False)
+        router_backend = router_backend or metadata.get('router_backend', 'numpy')
+        if router_backend not in ROUTER_BACKENDS:
+            raise ValueError(f"❌ Unknown router_backend: {router_backend} (expected one of {ROUTER_BACKENDS})")
+        if fanout_mass is None:
+            fanout_mass = metadata.get('fanout_mass')
+        min_fanout = min_fanout or metadata.get('min_fanout', DEFAULT_MIN_FANOUT)
+        max_fanout = max_fanout or metadata.get('max_fanout', DEFAULT_MAX_FANOUT)
+        if not 1 <= min_fanout <= max_fanout:
+            raise ValueError(f"❌ Need 1 <= min_fanout <= max_fanout (got {min_fanout}, {max_fanout})")
+        search_workers = search_workers or metadata.get('search_workers') or default_search_workers()
+        cross_encoder = cross_encoder or metadata.get('cross_encoder')
+        if rerank_budget_ms is None:
+            rerank_budget_ms = metadata.get('rerank_budget_ms', DEFAULT_BUDGET_MS)
+        hyde_model = hyde_model or metadata.get('hyde_model')
+        hyde_mode = hyde_mode or metadata.get('hyde_mode', 'fuse')
+        if hyde_mode not in HYDE_MODES:
+            raise ValueError(f"❌ Unknown hyde_mode: {hyde_mode} (expected one of {HYDE_MODES})")
+        if hyde_threshold is None:
+            hyde_threshold = metadata.get('hyde_threshold')
+        hyde_max_new_tokens = hyde_max_new_tokens or metadata.get('hyde_max_new_tokens', DEFAULT_MAX_NEW_TOKENS)
+        if sentence_window is None:
+            sentence_window = metadata.get('sentence_window')
+        if sentence_window is not None and (index_mode != 'per_domain' or retrieval_mode != 'dense'):
+            raise ValueError("❌ Sentence-window retrieval needs index_mode='per_domain' and retrieval_mode='dense'")
+    
+        # Which domains can be loaded at all
+        available_domains = []
+        if index_mode == 'per_domain':
+            for domain in domain_list:
+                error = _missing_domain_files(faiss_dir, domain, vector_db_stats.get(domain, {}))
+                if error:
+                    report['errors'][domain] = error
+                else:
+                    available_domains.append(domain)
+    
+        # Embedder, router and indexes (sequentially or on a thread pool)
+        unified_index = None
+        vector_dbs = {}
+        eager_domains = available_domains if load_mode != 'lazy' else []
+        workers = 1 if load_mode == 'sequential' else min(8, 3 + len(eager_domains))
+    
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="medqa-load") as pool:
+            embedder_future = pool.submit(_timed, stages, 'embedder', _load_model, _load_embedder,
+                                          embedder_config, embedding_cache)
+            router_future = pool.submit(_timed, stages, 'router', _load_router,
+                                        checkpoint_path, num_classes, domain_list, router_backend)
+            unified_future = None
+            if index_mode == 'unified':
+                from medical_qa_indexes import load_unified_index
+                unified_future = pool.submit(_timed, stages, 'unified_index', load_unified_index,
+                                             faiss_dir, metadata['unified_index'])
+            reranker_future = None
+            if cross_encoder:
+                reranker_future = pool.submit(_timed, stages, 'cross_encoder', _load_model, load_reranker,
+                                              cross_encoder, rerank_budget_ms)
+            hyde_future = None
+            if hyde_model:
+                hyde_future = pool.submit(_timed, stages, 'hyde', _load_model, HyDEGenerator,
+                                          hyde_model, hyde_max_new_tokens)
+            sentences_future = None
+            if sentence_window is not None:
+                sentences_future = pool.submit(_timed, stages, 'sentences', load_sentence_indexes,
+                                               faiss_dir, available_domains)
+            sparse_future = None
+            if retrieval_mode == 'hybrid':
+                from medical_qa_bm25 import load_sparse_indexes
+                sparse_future = pool.submit(_timed, stages, 'bm25', load_sparse_indexes,
+                                            faiss_dir, available_domains)
+            domain_futures = {
+                domain: pool.submit(_timed, report['domains'], domain, _load_domain,
+                                    faiss_dir, domain, vector_db_stats.get(domain, {}))
+                for domain in eager_domains
+            }
+        
+            embedder = embedder_future.result()
+            moe_model, gating_router = router_future.result()
+            if unified_future is not None:
+                unified_index = unified_future.result()
+            sparse_indexes = sparse_future.result() if sparse_future is not None else {}
+            reranker = reranker_future.result() if reranker_future is not None else None
+            hyde = hyde_future.result() if hyde_future is not None else None
+            sentence_indexes = sentences_future.result() if sentences_future is not None else {}
+            for domain, future in domain_futures.items():
+                try:
+                    vector_dbs[domain] = future.result()
+                except Exception as e:
+                    report['errors'][domain] = f"Error loading - {e}"
+    
+    if load_mode == 'lazy' and index_mode == 'per_domain':
+        vector_dbs = LazyVectorDBs(faiss_dir, available_domains, vector_db_stats, report)
+        report['lazy_domains'] = list(available_domains)
+    
+    search_pool = None
+    if index_mode == 'per_domain' and search_workers > 1:
+        search_pool = SearchPool(search_workers)
+    
+    checkpoint_id = f"{checkpoint_name}@{metadata.get('timestamp', '')}"
+    if answer_cache is not None:
+        answer_cache.bind(checkpoint_id)
+    if reranker is not None:
+        # document ids differ between the per-domain and unified indexes,
+        # passage texts between sentence windows
+        reranker.cache.bind(f"{checkpoint_id}/{index_mode}/{sentence_window}")
+    
+    report['total'] = time.perf_counter() - load_started
+    if verbose:
+        print(format_load_report(report))
     
     return {
         'moe_model': moe_model,
+        'router': gating_router,
+        'fanout_mass': fanout_mass,
+        'min_fanout': min_fanout,
+        'max_fanout': max_fanout,
+        'fanout_stats': FanoutStats(baseline=min(DEFAULT_MAX_FANOUT, len(domain_list))),
         'vector_dbs': vector_dbs,
+        'search_pool': search_pool,
+        'unified_index': unified_index,
+        'retrieval_mode': retrieval_mode,
+        'sparse_indexes': sparse_indexes,
+        'sentence_indexes': sentence_indexes,
+        'sentence_window': sentence_window,
+        'collapse_duplicates': collapse_duplicates,
+        'reranker': reranker,
+        'hyde': hyde,
+        'hyde_mode': hyde_mode,
+        'hyde_threshold': hyde_threshold,
         'embedder': embedder,
+        'embedder_config': embedder_config,
+        'embedding_cache': embedding_cache,
+        'answer_cache': answer_cache,
+        'checkpoint_id': checkpoint_id,
         'domain_list': domain_list,
         'domain_to_label': domain_to_label,
         'label_to_domain': label_to_domain,
-        'metadata': metadata
+        'metadata': metadata,
+        'load_report': report
     }
 
 
 # ============================================================================
-# HELPER FUNCTIONS FOR FULL INFERENCE
+# MAIN INFERENCE FUNCTION (FULL VERSION)
 # ============================================================================
 
-def keyword_score(query, answer):
-    """Simple keyword scoring"""
-    query_words = set(query.lower().split()) - {
-        'what', 'is', 'the', 'a', 'how', 'why', 'when', 'where',
-        'in', 'on', 'to', 'for', 'and', 'or', 'but'
+def route_queries(query_embs, system, record=True):
+    """
+    Route a batch of query embeddings through the MoE gating network
+
+    Returns one (selected_domains, selected_probs) pair per row, highest
+    probability first: the top 2 domains, or as many as the system's
+    fanout_mass / min_fanout / max_fanout policy asks for.
+    Uses the NumPy gating router when the system has one.
+    record=False keeps the routes out of system['fanout_stats'] (re-routes
+    of queries already counted).
+    """
+    
+    label_to_domain = system['label_to_domain']
+    policy = {
+        'fanout_mass': system.get('fanout_mass'),
+        'min_fanout': system.get('min_fanout', DEFAULT_MIN_FANOUT),
+        'max_fanout': system.get('max_fanout', DEFAULT_MAX_FANOUT),
     }
-    answer_words = set(answer.lower().split())
-    overlap = len(query_words & answer_words)
-    return min(1.0, overlap / max(len(query_words), 1))
+    if system.get('router') is not None:
+        routes = system['router'].route(query_embs, label_to_domain, **policy)
+    else:
+        routes = select_routes(_moe_probs(system['moe_model'], query_embs), label_to_domain, **policy)
+    
+    if record and system.get('fanout_stats') is not None:
+        system['fanout_stats'].record(routes)
+    return routes
 
 
-def llm_rerank(query, candidate_answers, candidate_similarities=None):
-    """Rerank candidates - IMPROVED relevance check"""
-    
-    if not candidate_answers:
-        return []
-    
-    # Normalize similarities
-    if candidate_similarities is not None and len(candidate_similarities) > 0:
-        min_s = min(candidate_similarities)
-        max_s = max(candidate_similarities)
-        
-        if max_s > min_s:
-            candidate_similarities = [(s - min_s) / (max_s - min_s) for s in candidate_similarities]
-        else:
-            candidate_similarities = [0.5] * len(candidate_answers)
-    else:
-        candidate_similarities = [0.5] * len(candidate_answers)
+def _moe_probs(trained_moe_model, query_embs):
     
-    scored_answers = []
+    import torch
+    import torch.nn.functional as F
+    from medical_qa_models import device
     
-    # Score each candidate
-    for i, ans in enumerate(candidate_answers[:5]):
-        embedding_score = candidate_similarities[i]
-        reranker_score = keyword_score(query, ans)
-        
-        # IMPROVED: Penalize answers that don't address key query terms
-        query_key_words = [w for w in query.lower().split() if len(w) > 4]
-        key_word_match = sum(1 for word in query_key_words if word in ans.lower())
-        key_word_ratio = key_word_match / max(len(query_key_words), 1)
-        
-        # IMPROVED: Reduce score if key words missing
-        if key_word_ratio < 0.5:
-            reranker_score *= 0.5  # Penalize missing key terms
-        
-        # Combine scores
-        final_score = 0.7 * embedding_score + 0.3 * reranker_score
-        
-        scored_answers.append({
-            "answer": ans,
-            "embedding_score": embedding_score,
-            "reranker_score": reranker_score,
-            "key_word_ratio": key_word_ratio,
-            "final_score": final_score,
+    with torch.no_grad():
+        q_tensor = torch.from_numpy(query_embs).to(device)
+        logits = trained_moe_model(q_tensor, return_router_logits=True)
+        return F.softmax(logits, dim=-1).cpu().numpy()
+
+
+def fuse_candidates(domain, docs, D_row, I_row, sparse_index, query_text, k):
+    """
+    Reciprocal-rank fusion of one row of dense hits with the domain's BM25 hits
+
+    Candidates get "similarity" (the fused score, used by the reranker in
+    place of the dense distance) and keep "dist" when the dense search
+    found them (None for BM25-only hits).
+    """
+    dense = [(int(doc_idx), float(dist)) for dist, doc_idx in zip(D_row, I_row) if 0 <= doc_idx < len(docs)]
+    ranked = [[doc_idx for doc_idx, _ in dense]]
+    store = docs if isinstance(docs, DocStore) else None
+    # a BM25 index from before a compaction numbers documents differently
+    if sparse_index is not None and sparse_index.id_epoch == (store.id_epoch if store else 0):
+        ranked.append(sparse_index.search(query_text, k, exclude=store.deleted if store else None)[1])
+    
+    dense_dist = dict(dense)
+    candidates = []
+    for doc_idx, fused_score in reciprocal_rank_fusion(ranked, k):
+        candidates.append({
+            "answer": docs[doc_idx]["answer"],
+            "domain": domain,
+            "doc_id": doc_idx,
+            "dist": dense_dist.get(doc_idx),
+            "similarity": fused_score,
+            "terms": docs.answer_terms(doc_idx) if isinstance(docs, DocStore) else None,
+            "cluster": docs.cluster_of(doc_idx) if isinstance(docs, DocStore) else None
         })
-    
-    # Sort by final score
-    return sorted(scored_answers, key=lambda x: x["final_score"], reverse=True)
+    return candidates
 
 
-def validate_medical_answer(query, answer, confidence):
-    """Validate answer quality"""
-    
-    # Check minimum length
-    if len(answer) < 25:
-        return False, "Too short"
-    
-    # Clean answer
-    answer = answer.replace('ï¿½', '').replace('�', '')
-    
-    # Check sentence ending
-    if not answer.strip()[-1] in '.!?':
-        sentences = answer.split('.')
-        if len(sentences) > 1:
-            answer = '. '.join(sentences[:-1]) + '.'
-        else:
-            return False, "Incomplete"
-    
-    # Check query-answer overlap
-    query_core = set(query.lower().split()) - {
-        'what', 'are', 'the', 'is', 'how', 'why', 'when'
-    }
-    answer_words = set(answer.lower().split())
-    overlap_ratio = len(query_core & answer_words) / max(len(query_core), 1)
-    
-    # Check for medical content
-    has_medical_content = any(term in answer.lower() for term in [
-        'disease', 'symptoms', 'treatment', 'condition', 'patient',
-        'diagnosis', 'therapy', 'medicine', 'caused', 'risk'
-    ])
-    
-    # Validate
-    if overlap_ratio < 0.2 and not (len(answer) > 100 and has_medical_content):
-        return False, "Low relevance"
-    
-    return True, answer
+def sentence_candidates(domain, docs, sentence_index, hits, window):
+    """Candidate dicts for one row of SentenceIndex.search hits: the best sentence and its window"""
+    candidates = []
+    for doc_idx, dist, row in hits:
+        candidates.append({
+            "answer": sentence_index.window_text(docs[doc_idx]["answer"], row, window),
+            "domain": domain,
+            "doc_id": doc_idx,
+            "sentence": int(sentence_index.offsets[row]),
+            "dist": dist,
+            "terms": None,
+            "cluster": docs.cluster_of(doc_idx) if isinstance(docs, DocStore) else None
+        })
+    return candidates
 
 
-# ============================================================================
-# MAIN INFERENCE FUNCTION (FULL VERSION)
-# ============================================================================
+def candidate_similarity(candidate):
+    """Retrieval score the reranker normalizes: fused score if present, else 1 / (1 + dist)"""
+    if candidate.get("similarity") is not None:
+        return candidate["similarity"]
+    return 1 / (1 + candidate["dist"])
 
-def retrieve_answer_full(query, system, k=5):
+
+def search_domain(index, docs, query_embs, k):
     """
-    Complete inference pipeline with all features
-    
-    1. Embed query
-    2. Route through MoE
-    3. Retrieve from FAISS
-    4. Rerank with LLM
-    5. Validate answer
+    FAISS search over one domain that never returns tombstoned documents
+
+    Over-fetches by the number of deletions (compaction keeps that small)
+    and drops them; rows that run short are padded with id -1.
     """
-    
-    trained_moe_model = system['moe_model']
-    vector_dbs = system['vector_dbs']
-    embedder = system['embedder']
-    domain_list = system['domain_list']
-    label_to_domain = system['label_to_domain']
-    
-    # Step 1: Embed query
-    print(f"  🔍 Embedding query...")
-    query_emb = embedder.encode([query], convert_to_numpy=True).astype(np.float32)
-    
-    # Step 2: Route through MoE
-    print(f"  🧭 Routing through MoE...")
-    with torch.no_grad():
-        q_tensor = torch.from_numpy(query_emb).to(device)
-        logits = trained_moe_model(q_tensor, return_router_logits=True)
-        probs = F.softmax(logits, dim=-1).cpu().numpy().squeeze(0)
+    query_embs = np.ascontiguousarray(query_embs)
+    deleted = docs.deleted if isinstance(docs, DocStore) else ()
+    if not len(deleted):
+        return index.search(query_embs, k)
+    
+    D, I = index.search(query_embs, min(k + len(deleted), index.ntotal))
+    removed = np.isin(I, deleted)
+    I[removed] = -1
+    D[removed] = np.inf
+    # keep the surviving hits in distance order, removed ones last
+    order = np.argsort(removed, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+
+def collect_candidates(domain, docs, D_row, I_row):
+    """Turn one row of FAISS search results into candidate dicts"""
+    candidates = []
+    for dist, doc_idx in zip(D_row, I_row):
+        if 0 <= doc_idx < len(docs):
+            candidates.append({
+                "answer": docs[doc_idx]["answer"],
+                "domain": domain,
+                "doc_id": int(doc_idx),
+                "dist": float(dist),
+                "terms": docs.answer_terms(doc_idx) if isinstance(docs, DocStore) else None,
+                "cluster": docs.cluster_of(doc_idx) if isinstance(docs, DocStore) else None
+            })
+    return candidates
+
+
+def collapse_candidates(candidates, per_domain=None, limit=None):
+    """
+    Keep the first (best ranked) candidate of each near-duplicate group
+
+    Candidates of a domain are grouped by their DocStore cluster id
+    (medical_qa_dedup); identical answer word sets are grouped across
+    domains too. per_domain / limit cap the survivors per domain / overall.
+    """
+    seen = set()
+    kept = []
+    per_domain_count = {}
+    for c in candidates:
+        terms = c.get("terms")
+        keys = [(terms if terms is not None else answer_terms(c["answer"])).tobytes()]
+        if c.get("cluster") is not None:
+            keys.append((c["domain"], c["cluster"]))
+        if any(key in seen for key in keys):
+            continue
+        seen.update(keys)
         
-        topk = min(2, len(domain_list))
-        top_indices = probs.argsort()[::-1][:topk]
-        selected_domains = [label_to_domain[int(i)] for i in top_indices]
-        selected_probs = [float(probs[int(i)]) for i in top_indices]
+        if per_domain is not None:
+            if per_domain_count.get(c["domain"], 0) >= per_domain:
+                continue
+            per_domain_count[c["domain"]] = per_domain_count.get(c["domain"], 0) + 1
+        kept.append(c)
+        if limit is not None and len(kept) >= limit:
+            break
+    return kept
+
+
+def search_candidates(query_embs, routes, system, k=5, query_texts=None):
+    """
+    Retrieve candidates for a batch of routed query embeddings
+
+    routes is the output of route_queries (one (domains, probs) pair per
+    row). Per-domain mode issues one multi-row FAISS search per domain,
+    concurrently on system['search_pool'] when there is one; unified mode issues one filtered search per distinct domain set.
+    In hybrid retrieval mode (query_texts given), each domain's dense hits
+    are fused with its BM25 hits for the same row. With
+    system['sentence_window'], domains are searched by sentence and
+    candidates are sentence windows of their answers.
+    With system['collapse_duplicates'], DUPLICATE_OVERFETCH times as many
+    hits are searched and near-duplicates collapsed, so a row still gets
+    up to k distinct candidates per domain.
+    Returns one candidate list per row.
+    """
     
-    print(f"     Selected: {', '.join(selected_domains)}")
+    unified_index = system.get('unified_index')
+    collapse = system.get('collapse_duplicates', False)
+    fetch_k = k * DUPLICATE_OVERFETCH if collapse else k
+    results = [[] for _ in routes]
     
-    # Step 3: Retrieve from FAISS
-    print(f"  🔎 Searching FAISS indexes...")
-    candidates = []
-    for domain in selected_domains:
-        if domain not in vector_dbs:
-            continue
+    if unified_index is not None:
+        # Search k per selected domain, ranked by true distance across domains
+        rows_by_domains = {}
+        for row, (selected_domains, _) in enumerate(routes):
+            rows_by_domains.setdefault(tuple(selected_domains), []).append(row)
         
+        for selected_domains, rows in rows_by_domains.items():
+            num_present = sum(1 for d in selected_domains if d in unified_index.domain_ranges)
+            if num_present == 0:
+                continue
+            found = unified_index.search(query_embs[rows], selected_domains, fetch_k * num_present)
+            for row, candidates in zip(rows, found):
+                results[row] = collapse_candidates(candidates, limit=k * num_present) if collapse else candidates
+        return results
+    
+    vector_dbs = system['vector_dbs']
+    hybrid = system.get('retrieval_mode') == 'hybrid' and query_texts is not None
+    sparse_indexes = system.get('sparse_indexes') or {}
+    rows_by_domain = {}
+    for row, (selected_domains, _) in enumerate(routes):
+        for domain in selected_domains:
+            rows_by_domain.setdefault(domain, []).append(row)
+    
+    sentence_indexes = system.get('sentence_indexes') or {}
+    window = system.get('sentence_window')
+    
+    def search_rows(item):
+        domain, rows = item
         idx, docs = vector_dbs[domain]
-        D, I = idx.search(query_emb, k)
-        
-        for dist, doc_idx in zip(D[0], I[0]):
-            if doc_idx < len(docs):
-                candidates.append({
-                    "answer": docs[doc_idx]["answer"],
-                    "domain": domain,
-                    "dist": float(dist)
-                })
+        sentence_index = sentence_indexes.get(domain) if window is not None else None
+        # doc ids from before a compaction no longer match the DocStore
+        if sentence_index is not None and sentence_index.id_epoch == getattr(docs, 'id_epoch', 0):
+            deleted = docs.deleted if isinstance(docs, DocStore) else ()
+            found = sentence_index.search(docs, query_embs[rows], fetch_k, deleted)
+            return {(row, domain): sentence_candidates(domain, docs, sentence_index, hits, window)
+                    for row, hits in zip(rows, found)}
+        D, I = search_domain(idx, docs, query_embs[rows], fetch_k)
+        found = {}
+        for j, row in enumerate(rows):
+            if hybrid:
+                found[(row, domain)] = fuse_candidates(domain, docs, D[j], I[j], sparse_indexes.get(domain),
+                                                       query_texts[row], fetch_k)
+            else:
+                found[(row, domain)] = collect_candidates(domain, docs, D[j], I[j])
+        return found
+    
+    searches = [(domain, rows) for domain, rows in rows_by_domain.items() if domain in vector_dbs]
+    search_pool = system.get('search_pool')
+    if search_pool is not None and len(searches) > 1:
+        found_per_domain = search_pool.map(search_rows, searches)
+    else:
+        found_per_domain = map(search_rows, searches)
+    
+    hits = {}
+    for found in found_per_domain:
+        hits.update(found)
+    
+    # Keep the router's domain order within each row
+    for row, (selected_domains, _) in enumerate(routes):
+        for domain in selected_domains:
+            results[row].extend(hits.get((row, domain), []))
+        if collapse:
+            results[row] = collapse_candidates(results[row], per_domain=k)
+    
+    return results
+
+
+def select_best_answer(query, candidates, selected_domains, rerank_top_n=5, reranker=None):
+    """
+    Rerank candidates and validate the winner (steps 4-5 of the pipeline)
+
+    rerank_top_n: how many of the leading candidates the reranker scores
+    (None = all of them).
+    reranker: optional medical_qa_rerank.CrossEncoderReranker; llm_rerank
+    is used without one, or when it runs out of time budget.
+    """
     
     if not candidates:
         return {
@@ -348,24 +779,21 @@ def retrieve_answer_full(query, system, k=5):
             "status": "no_candidates"
         }
     
-    print(f"     Found {len(candidates)} candidates")
-    
-    # Step 4: Rerank with LLM
-    print(f"  ⚖️ Reranking candidates...")
     candidate_texts = [c["answer"] for c in candidates]
-    candidate_similarities = [1 / (1 + c["dist"]) for c in candidates]
+    candidate_similarities = [candidate_similarity(c) for c in candidates]
     
-    reranked = llm_rerank(query, candidate_texts, candidate_similarities)
+    reranked = reranker.rerank(query, candidates, rerank_top_n) if reranker is not None else None
+    if reranked is None:
+        reranked = llm_rerank(query, candidate_texts, candidate_similarities, top_n=rerank_top_n,
+                              candidate_terms=[c.get("terms") for c in candidates])
     
     if not reranked:
-        conf = 1.0 / (1.0 + candidates[0]["dist"])
+        conf = candidate_similarity(candidates[0])
         best_answer = candidates[0]["answer"]
     else:
         conf = reranked[0]["final_score"]
         best_answer = reranked[0]["answer"]
     
-    # Step 5: Validate answer
-    print(f"  ✓ Validating answer...")
     is_valid, validated_answer = validate_medical_answer(query, best_answer, conf)
     
     if not is_valid:
@@ -387,6 +815,162 @@ def retrieve_answer_full(query, system, k=5):
     }
 
 
+def needs_hyde(result, threshold):
+    """Whether a direct-search result should be retried with HyDE"""
+    if threshold is None:
+        return True
+    return result["status"] != "success" or result["confidence_score"] < threshold
+
+
+def apply_hyde(queries, query_embs, direct_results, system, k=5):
+    """
+    Retrieve again with HyDE search vectors (see medical_qa_hyde)
+
+    Routing and dense search use the hypothetical answers' embeddings
+    (system['hyde_mode']); BM25 and reranking still see the question.
+    The HyDE result replaces the direct one unless only the direct one
+    passed validation. Both carry "hyde": {"used", "hypothetical_answer"}.
+    """
+    hypotheticals = system['hyde'].generate_many(queries)
+    # generated text is not a query: skip the embedding cache's spelling fixes
+    # and keep one-off hypotheticals from evicting cached queries
+    embedder = getattr(system['embedder'], 'embedder', system['embedder'])
+    hypothetical_embs = embedder.encode(hypotheticals, convert_to_numpy=True).astype(np.float32)
+    search_embs = hyde_embeddings(query_embs, hypothetical_embs, system['hyde_mode'])
+    
+    routes = route_queries(search_embs, system, record=False)
+    candidates_per_query = search_candidates(search_embs, routes, system, k, queries)
+    
+    results = []
+    for query, direct, candidates, (selected_domains, _), hypothetical in zip(
+            queries, direct_results, candidates_per_query, routes, hypotheticals):
+        result = select_best_answer(query, candidates, selected_domains, reranker=system.get('reranker'))
+        used = not (direct["status"] == "success" and result["status"] != "success")
+        result = dict(result if used else direct, hyde={"used": used, "hypothetical_answer": hypothetical})
+        results.append(result)
+    return results
+
+
+def retrieve_answer_full(query, system, k=5):
+    """
+    Complete inference pipeline with all features
+    
+    1. Embed query
+    2. Route through MoE
+    3. Retrieve from FAISS
+    4. Rerank with LLM
+    5. Validate answer
+    6. With a HyDE model: retry steps 2-5 with a hypothetical answer
+       (only if confidence < hyde_threshold when one is set)
+    """
+    
+    embedder = system['embedder']
+    answer_cache = system.get('answer_cache')
+    
+    if answer_cache is not None:
+        cached = answer_cache.get(system['checkpoint_id'], query, k)
+        if cached is not None:
+            print(f"  ⚡ Answer cache hit")
+            return cached
+    
+    # Step 1: Embed query
+    print(f"  🔍 Embedding query...")
+    query_emb = embedder.encode([query], convert_to_numpy=True).astype(np.float32)
+    
+    # Step 2: Route through MoE
+    print(f"  🧭 Routing through MoE...")
+    routes = route_queries(query_emb, system)
+    selected_domains, selected_probs = routes[0]
+    
+    print(f"     Selected: {', '.join(selected_domains)}")
+    
+    # Step 3: Retrieve from FAISS
+    print(f"  🔎 Searching FAISS indexes...")
+    candidates = search_candidates(query_emb, routes, system, k, [query])[0]
+    
+    if candidates:
+        print(f"     Found {len(candidates)} candidates")
+        
+        # Step 4 + 5: Rerank with LLM, validate answer
+        print(f"  ⚖️ Reranking and validating candidates...")
+    
+    result = select_best_answer(query, candidates, selected_domains, reranker=system.get('reranker'))
+    
+    # Step 6: HyDE for queries the direct search answered poorly
+    if system.get('hyde') is not None and needs_hyde(result, system.get('hyde_threshold')):
+        print(f"  💭 Searching with a hypothetical answer (HyDE)...")
+        result = apply_hyde([query], query_emb, [result], system, k)[0]
+    
+    if answer_cache is not None:
+        answer_cache.put(system['checkpoint_id'], query, k, result)
+    
+    return result
+
+
+def retrieve_answers_batch(queries, system, k=5, batch_size=64):
+    """
+    Batched version of retrieve_answer_full for replaying many queries
+    
+    1. Embed all queries in one encoder call
+    2. Route all queries with one MoE forward
+    3. Group queries by selected domain -> one multi-row FAISS search per domain
+       (or per distinct domain set in unified index mode)
+    4. Rerank + validate per query (same code as the single-query path)
+    5. HyDE for the queries that need it, with one generate call
+    
+    Returns a list of result dicts in the same order as `queries`.
+    """
+    
+    queries = list(queries)
+    if not queries:
+        return []
+    
+    embedder = system['embedder']
+    answer_cache = system.get('answer_cache')
+    
+    # Serve repeats from the answer cache, run the pipeline on the rest
+    results = [None] * len(queries)
+    if answer_cache is not None:
+        for row, query in enumerate(queries):
+            results[row] = answer_cache.get(system['checkpoint_id'], query, k)
+    pending = [row for row, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+    pending_queries = [queries[row] for row in pending]
+    
+    # Step 1: Embed all queries
+    query_embs = embedder.encode(
+        pending_queries, batch_size=batch_size, convert_to_numpy=True
+    ).astype(np.float32)
+    
+    # Step 2: Route all queries
+    routes = route_queries(query_embs, system)
+    
+    # Step 3: One search per domain over every query routed to it
+    candidates_per_query = search_candidates(query_embs, routes, system, k, pending_queries)
+    
+    # Step 4: Rerank + validate each query
+    for i, row in enumerate(pending):
+        selected_domains, _ = routes[i]
+        results[row] = select_best_answer(queries[row], candidates_per_query[i], selected_domains,
+                                          reranker=system.get('reranker'))
+    
+    # Step 5: HyDE for the queries the direct search answered poorly
+    if system.get('hyde') is not None:
+        retry = [i for i, row in enumerate(pending) if needs_hyde(results[row], system.get('hyde_threshold'))]
+        if retry:
+            retried = apply_hyde([pending_queries[i] for i in retry], query_embs[retry],
+                                 [results[pending[i]] for i in retry], system, k)
+            for i, result in zip(retry, retried):
+                results[pending[i]] = result
+    
+    if answer_cache is not None:
+        for row in pending:
+            answer_cache.put(system['checkpoint_id'], queries[row], k, results[row])
+    
+    return results
+
+
 # ============================================================================
 # MAIN: INTERACTIVE QUERY MODE
 # ============================================================================
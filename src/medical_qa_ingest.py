@@ -0,0 +1,370 @@
+"""
+Medical QA System - Incremental index updates
+Append new Q&A documents to a domain, tombstone retracted ones, and
+compact, without re-embedding existing documents
+
+Usage (from the repository root):
+    python src/medical_qa_ingest.py medical_qa_checkpoints/medical_qa_v1.0 add \\
+        --domain Cardiology --file new_answers.jsonl
+    python src/medical_qa_ingest.py medical_qa_checkpoints/medical_qa_v1.0 delete --domain Cancer --ids 12 40
+    python src/medical_qa_ingest.py medical_qa_checkpoints/medical_qa_v1.0 compact --min-deleted-fraction 0.1
+    python src/medical_qa_ingest.py medical_qa_checkpoints/medical_qa_v1.0 status
+
+--file takes JSONL ({"question": ..., "answer": ...}) or a CSV with
+Question/Answer columns (the DataSets format).
+
+Safe next to running readers:
+  * document ids only change at compaction, which bumps the DocStore
+    "id_epoch"; until then deletes are tombstones that search skips
+  * every file is replaced by rename (the DocStore blob is only ever
+    extended), so a process that already has the checkpoint open keeps
+    reading its own consistent snapshot
+  * files are swapped in under checkpoint_lock(exclusive=True), which
+    load_complete_system takes shared, so a loader never sees half an
+    update; a second lock serializes concurrent writers
+  * metadata["timestamp"] is bumped, so answer caches keyed on the
+    checkpoint id drop stale answers when the checkpoint is reloaded
+
+Readers see changes after they reload the checkpoint.
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from medical_qa_bm25 import bm25_exists, build_bm25
+from medical_qa_build import EMBED_FIELDS, EMBED_MODEL, embed_text, iter_csv_rows
+from medical_qa_dedup import refresh_clusters
+from medical_qa_sentences import appended_sentences, compacted_sentences, save_sentence_index
+from medical_qa_docstore import (
+    DocStore,
+    DocStoreWriter,
+    append_docstore,
+    checkpoint_lock,
+    convert_pickle_docs,
+    docstore_exists,
+    docstore_tombstones_path,
+    load_docs,
+    write_tombstones,
+)
+
+
+WRITER_LOCK = ".ingest.lock"
+DEFAULT_MIN_DELETED_FRACTION = 0.1
+
+
+def _read_metadata(checkpoint_path):
+    with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+        return json.load(f)
+
+
+def _write_metadata(checkpoint_path, metadata):
+    from medical_qa_indexes import _write_metadata as write
+
+    if "unified_index" in metadata:
+        # built from the old documents; rebuild with `medical_qa_indexes.py build-unified`
+        metadata["unified_index"]["stale"] = True
+    write(checkpoint_path, metadata)
+
+
+def _domain_index_files(faiss_dir, domain, domain_stats):
+    """The baseline flat index plus the selected index, if it is a different file"""
+    files = [f"{domain}_index.faiss"]
+    if domain_stats.get("index_file") and domain_stats["index_file"] not in files:
+        files.append(domain_stats["index_file"])
+    return [os.path.join(faiss_dir, name) for name in files]
+
+
+def _write_index_tmp(index, path):
+    """Write next to `path`; os.replace(path + ".tmp", path) swaps it in"""
+    import faiss
+
+    faiss.write_index(index, path + ".tmp")
+    return path
+
+
+def _uses_bm25(faiss_dir, metadata, domain):
+    return bm25_exists(faiss_dir, domain) or any(bm25_exists(faiss_dir, d) for d in metadata['domain_list'])
+
+
+# ============================================================================
+# INGEST
+# ============================================================================
+
+def read_documents(path):
+    """Question/answer dicts from a JSONL or DataSets-style CSV file"""
+    if path.endswith(".csv"):
+        return [{"question": d["question"], "answer": d["answer"]} for d in iter_csv_rows([path])]
+    docs = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                docs.append({"question": record["question"], "answer": record["answer"]})
+    return docs
+
+
+def embed_documents(docs, embedder=None, model_name=EMBED_MODEL, batch_size=64):
+    """Embed docs the way medical_qa_build does (normalized, EMBED_FIELDS joined)"""
+    if embedder is None:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(model_name, device='cpu')
+    return embedder.encode(
+        [embed_text(doc, EMBED_FIELDS) for doc in docs],
+        batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True,
+    ).astype(np.float32)
+
+
+def ingest_documents(checkpoint_path, domain, docs, embedder=None, batch_size=64):
+    """
+    Embed `docs` and append them to `domain`; returns the new document ids
+
+    Only the new documents are embedded. Every index file of the domain
+    (flat baseline and the selected IVF/HNSW index) gets the new vectors,
+    the DocStore is appended to, the domain's sentence index (if it has
+    one) gets the new documents' sentences and, if the checkpoint uses
+    BM25, the domain's BM25 index is rebuilt from its documents. A domain
+    with no files yet is created.
+    """
+    import faiss
+
+    docs = [{"question": d["question"], "answer": d["answer"]} for d in docs]
+    if not docs:
+        return []
+
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with checkpoint_lock(checkpoint_path, exclusive=True, name=WRITER_LOCK):
+        metadata = _read_metadata(checkpoint_path)
+        if domain not in metadata['domain_list']:
+            raise ValueError(f"❌ Unknown domain {domain!r}: the router only knows {metadata['domain_list']}")
+        domain_stats = metadata.setdefault('vector_db_stats', {}).setdefault(domain, {})
+
+        # The slow part, outside the reader lock
+        if embedder is None:
+            from sentence_transformers import SentenceTransformer
+            embedder = SentenceTransformer(metadata.get('embedder_model', EMBED_MODEL), device='cpu')
+        vectors = embed_documents(docs, embedder, batch_size=batch_size)
+        sentences = None
+        if "sentences" in domain_stats:
+            existing = load_docs(faiss_dir, domain)
+            num_existing = len(existing)
+            if isinstance(existing, DocStore):
+                existing.close()
+            sentences = appended_sentences(faiss_dir, domain, docs, num_existing, embedder, batch_size)
+
+        index_paths = _domain_index_files(faiss_dir, domain, domain_stats)
+        new_domain = not os.path.exists(index_paths[0])
+        replaced = []
+        for path in index_paths:
+            index = faiss.IndexFlatL2(vectors.shape[1]) if new_domain else faiss.read_index(path)
+            index.add(vectors)
+            replaced.append(_write_index_tmp(index, path))
+
+        with checkpoint_lock(checkpoint_path, exclusive=True):
+            for path in replaced:
+                os.replace(path + ".tmp", path)
+            if new_domain:
+                with DocStoreWriter(faiss_dir, domain) as writer:
+                    for doc in docs:
+                        writer.add(doc)
+                first_id = 0
+            else:
+                if not docstore_exists(faiss_dir, domain):
+                    convert_pickle_docs(faiss_dir, domain)
+                first_id, _ = append_docstore(faiss_dir, domain, docs)
+            if sentences is not None:
+                domain_stats["sentences"] = save_sentence_index(faiss_dir, domain, sentences,
+                                                                first_id + len(docs))
+
+            store = DocStore(faiss_dir, domain)
+            if _uses_bm25(faiss_dir, metadata, domain):
+                build_bm25(faiss_dir, domain, store)
+            refresh_clusters(faiss_dir, domain, store, domain_stats)
+
+            domain_stats["num_docs"] = store.num_docs
+            domain_stats["num_deleted"] = len(store.deleted)
+            domain_stats.setdefault("index_type", "IndexFlatL2")
+            store.close()
+            _write_metadata(checkpoint_path, metadata)
+
+    return list(range(first_id, first_id + len(docs)))
+
+
+# ============================================================================
+# DELETE + COMPACT
+# ============================================================================
+
+def delete_documents(checkpoint_path, domain, doc_ids, min_deleted_fraction=None):
+    """
+    Tombstone documents of `domain`; returns how many were newly deleted
+
+    Search skips them immediately (after a reload). With
+    min_deleted_fraction set, the domain is compacted once its share of
+    deleted documents reaches it.
+    """
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with checkpoint_lock(checkpoint_path, exclusive=True, name=WRITER_LOCK):
+        metadata = _read_metadata(checkpoint_path)
+        if not docstore_exists(faiss_dir, domain):
+            convert_pickle_docs(faiss_dir, domain)
+
+        with checkpoint_lock(checkpoint_path, exclusive=True):
+            newly_deleted = write_tombstones(faiss_dir, domain, doc_ids)
+            store = DocStore(faiss_dir, domain)
+            domain_stats = metadata.setdefault('vector_db_stats', {}).setdefault(domain, {})
+            domain_stats["num_deleted"] = len(store.deleted)
+            fraction = len(store.deleted) / max(store.num_docs, 1)
+            store.close()
+            _write_metadata(checkpoint_path, metadata)
+
+    if min_deleted_fraction is not None and fraction >= min_deleted_fraction:
+        compact_domain(checkpoint_path, domain)
+    return newly_deleted
+
+
+def compact_domain(checkpoint_path, domain):
+    """
+    Drop tombstoned documents for good; returns the number removed
+
+    Surviving documents are renumbered (the DocStore id_epoch goes up).
+    Vectors are taken from the flat baseline index, so nothing is
+    re-embedded; the selected IVF/HNSW index is rebuilt from them with
+    its recorded build parameters, and the sentence index keeps the
+    surviving documents' sentences.
+    """
+    import faiss
+    from medical_qa_indexes import FLAT_INDEX_TYPE, build_index, flat_vectors
+
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    with checkpoint_lock(checkpoint_path, exclusive=True, name=WRITER_LOCK):
+        metadata = _read_metadata(checkpoint_path)
+        domain_stats = metadata.setdefault('vector_db_stats', {}).setdefault(domain, {})
+        store = DocStore(faiss_dir, domain)
+        if not len(store.deleted):
+            store.close()
+            return 0
+
+        keep = np.setdiff1d(np.arange(store.num_docs), store.deleted)
+        index_paths = _domain_index_files(faiss_dir, domain, domain_stats)
+        vectors = flat_vectors(faiss.read_index(index_paths[0]))[keep]
+
+        flat = faiss.IndexFlatL2(vectors.shape[1])
+        flat.add(vectors)
+        replaced = [_write_index_tmp(flat, index_paths[0])]
+        if len(index_paths) > 1:
+            index_type = domain_stats.get("index_type", FLAT_INDEX_TYPE)
+            index, used_params = build_index(vectors, index_type, domain_stats.get("build_params"))
+            domain_stats["build_params"] = used_params
+            replaced.append(_write_index_tmp(index, index_paths[1]))
+
+        writer = DocStoreWriter(faiss_dir, domain, store.fields, id_epoch=store.id_epoch + 1)
+        try:
+            for doc_idx in keep:
+                writer.add(store[int(doc_idx)])
+        except BaseException:
+            writer.abort()
+            raise
+        removed = len(store.deleted)
+        sentences = None
+        if "sentences" in domain_stats:
+            sentences = compacted_sentences(faiss_dir, domain, keep, store.id_epoch + 1)
+        store.close()
+
+        with checkpoint_lock(checkpoint_path, exclusive=True):
+            for path in replaced:
+                os.replace(path + ".tmp", path)
+            writer.close()
+            os.remove(docstore_tombstones_path(faiss_dir, domain))
+            if sentences is not None:
+                domain_stats["sentences"] = save_sentence_index(faiss_dir, domain, sentences, len(keep))
+
+            store = DocStore(faiss_dir, domain)
+            if _uses_bm25(faiss_dir, metadata, domain):
+                build_bm25(faiss_dir, domain, store)
+            refresh_clusters(faiss_dir, domain, store, domain_stats)
+            domain_stats["num_docs"] = store.num_docs
+            domain_stats["num_deleted"] = 0
+            domain_stats["compacted_at"] = datetime.now().strftime("%Y%m%d_%H%M%S")
+            store.close()
+            _write_metadata(checkpoint_path, metadata)
+
+    return removed
+
+
+def compact_checkpoint(checkpoint_path, min_deleted_fraction=DEFAULT_MIN_DELETED_FRACTION):
+    """Compact every domain whose share of deleted documents reached min_deleted_fraction"""
+    compacted = {}
+    for domain, fraction in deleted_fractions(checkpoint_path).items():
+        if fraction > 0 and fraction >= min_deleted_fraction:
+            compacted[domain] = compact_domain(checkpoint_path, domain)
+    return compacted
+
+
+def deleted_fractions(checkpoint_path):
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    fractions = {}
+    for domain in _read_metadata(checkpoint_path)['domain_list']:
+        if docstore_exists(faiss_dir, domain):
+            store = DocStore(faiss_dir, domain)
+            fractions[domain] = len(store.deleted) / max(store.num_docs, 1)
+            store.close()
+    return fractions
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally update a checkpoint's domains")
+    parser.add_argument("checkpoint_path", help="e.g. medical_qa_checkpoints/medical_qa_v1.0")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add", help="embed and append new documents")
+    add.add_argument("--domain", required=True)
+    add.add_argument("--file", required=True, help="JSONL (question/answer) or CSV (Question/Answer)")
+    add.add_argument("--batch-size", type=int, default=64)
+
+    delete = sub.add_parser("delete", help="tombstone documents by id")
+    delete.add_argument("--domain", required=True)
+    delete.add_argument("--ids", type=int, nargs="+", required=True)
+    delete.add_argument("--auto-compact", type=float, metavar="FRACTION",
+                        help="compact the domain once this share of it is deleted")
+
+    compact = sub.add_parser("compact", help="drop tombstoned documents")
+    compact.add_argument("--domain", help="compact this domain regardless of its deleted share")
+    compact.add_argument("--min-deleted-fraction", type=float, default=DEFAULT_MIN_DELETED_FRACTION)
+
+    sub.add_parser("status", help="documents and deletions per domain")
+
+    args = parser.parse_args()
+
+    if args.command == "add":
+        docs = read_documents(args.file)
+        start = time.perf_counter()
+        ids = ingest_documents(args.checkpoint_path, args.domain, docs, batch_size=args.batch_size)
+        print(f"✅ {args.domain}: added {len(ids)} documents (ids {ids[0]}..{ids[-1]}) "
+              f"in {time.perf_counter() - start:.1f}s" if ids else "⚠️ Nothing to add")
+    elif args.command == "delete":
+        deleted = delete_documents(args.checkpoint_path, args.domain, args.ids, args.auto_compact)
+        print(f"✅ {args.domain}: {deleted} documents tombstoned")
+    elif args.command == "compact":
+        if args.domain:
+            compacted = {args.domain: compact_domain(args.checkpoint_path, args.domain)}
+        else:
+            compacted = compact_checkpoint(args.checkpoint_path, args.min_deleted_fraction)
+        for domain, removed in compacted.items():
+            print(f"  🧹 {domain}: removed {removed} documents")
+        print("✅ Done" if compacted else "✅ Nothing to compact")
+    elif args.command == "status":
+        stats = _read_metadata(args.checkpoint_path).get('vector_db_stats', {})
+        for domain, fraction in deleted_fractions(args.checkpoint_path).items():
+            print(f"  {domain:<28} {stats.get(domain, {}).get('num_docs', '?'):>7} docs   {fraction:6.1%} deleted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Medical QA System - Keyword matching
+One compiled regex per keyword set instead of one substring test per
+keyword: the keywords are merged into a trie and written out as nested
+alternations, so the regex engine follows a single branch per character
+whatever the number of keywords.
+
+KeywordMatcher keeps the semantics of the loops it replaces
+(`keyword in text` for every keyword of every category): a keyword
+counts once however often it occurs, overlapping and nested keywords
+("blood", "blood sugar", "sugar") all count, and a keyword listed twice
+in a category counts twice for it.
+
+Matchers are built once at import by the modules that own the keyword
+lists (medical_qa_conversation); text is matched as given, so callers
+lowercase it as before.
+"""
+
+import re
+
+
+# matches() below this many keywords: plain `in` tests beat a regex scan
+# over long texts (answers), since each is a C-level substring search
+MAX_SUBSTRING_TESTS = 8
+
+
+def _trie_pattern(keywords):
+    """Regex matching the longest of `keywords` at a position (greedy optional tails)"""
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1:
+            body = branches[0]
+        else:
+            body = "(?:" + "|".join(branches) + ")"
+        if "" not in node:
+            return body
+        return f"(?:{body})?" if len(body) > 1 else body + "?"
+
+    return build(trie)
+
+
+def scan_categories(categories, text):
+    """Reference implementation: one `in` test per keyword (used to check and benchmark KeywordMatcher)"""
+    hits = {}
+    for category, keywords in categories.items():
+        count = sum(1 for keyword in keywords if keyword in text)
+        if count:
+            hits[category] = count
+    return hits
+
+
+class KeywordMatcher:
+    """All keywords of a {category: [keywords]} dict found in a text, in one regex pass"""
+
+    def __init__(self, categories):
+        self.categories = {category: tuple(keywords) for category, keywords in categories.items()}
+        keywords = sorted({keyword for words in self.categories.values() for keyword in words})
+        if not keywords or not all(keywords):
+            raise ValueError("KeywordMatcher needs non-empty keywords")
+        self._keywords = tuple(keywords)
+        pattern = _trie_pattern(keywords)
+        # zero-width lookahead: the longest keyword starting at every position
+        self._starts = re.compile(f"(?=({pattern}))")
+        self._any = re.compile(pattern)
+
+        known = set(keywords)
+        # keyword -> the keywords it starts with (they match wherever it does)
+        self._prefixes = {keyword: tuple(keyword[:i] for i in range(1, len(keyword) + 1) if keyword[:i] in known)
+                          for keyword in keywords}
+        self._weights = {keyword: [] for keyword in keywords}
+        for category, words in self.categories.items():
+            counts = {}
+            for keyword in words:
+                counts[keyword] = counts.get(keyword, 0) + 1
+            for keyword, count in counts.items():
+                self._weights[keyword].append((category, count))
+
+    def keywords(self, text):
+        """Set of the keywords occurring in `text`"""
+        found = set()
+        for match in self._starts.finditer(text):
+            longest = match.group(1)
+            if longest:
+                found.update(self._prefixes[longest])
+        return found
+
+    def category_hits(self, text):
+        """{category: number of its keywords in `text`} for the categories with any, in definition order"""
+        counts = {}
+        for keyword in self.keywords(text):
+            for category, count in self._weights[keyword]:
+                counts[category] = counts.get(category, 0) + count
+        return {category: counts[category] for category in self.categories if category in counts}
+
+    def first_category(self, text):
+        """The first category (definition order) with a keyword in `text`, or None"""
+        return next(iter(self.category_hits(text)), None)
+
+    def matches(self, text):
+        """Whether any keyword occurs in `text` (stops at the first)"""
+        if len(self._keywords) <= MAX_SUBSTRING_TESTS:
+            return any(keyword in text for keyword in self._keywords)
+        return self._any.search(text) is not None
@@ -0,0 +1,198 @@
+"""
+Medical QA System - Load test for medical_qa_server.py
+Fires concurrent POST /answer requests and reports throughput and latency
+
+Usage (server already running locally):
+    python src/medical_qa_loadtest.py --url http://127.0.0.1:8000 \\
+        --concurrency 32 --requests 2000 --queries queries.txt
+
+--queries accepts plain text (one question per line) or JSONL with a
+"query" field; without it a built-in list of sample questions is cycled.
+--stream uses POST /answer/stream and also reports time to first answer
+chunk (TTFT) as seen by the client.
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+
+SAMPLE_QUERIES = [
+    "What are the symptoms of diabetes?",
+    "How is lung cancer treated?",
+    "What causes kidney stones?",
+    "What are the early signs of Parkinson's disease?",
+    "How can I treat eczema on my hands?",
+    "What is the treatment for migraine?",
+    "What are the risk factors for stroke?",
+    "How is melanoma diagnosed?",
+    "What causes acid reflux?",
+    "What are the symptoms of multiple sclerosis?",
+]
+
+
+def load_queries(path):
+    queries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                line = record.get("query") or record.get("title") or ""
+            if line:
+                queries.append(line)
+    return queries
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def read_stream(response, start):
+    """Read an NDJSON event stream; returns (seconds to first answer chunk, error or None)"""
+    first_token = None
+    error = None
+    while True:
+        line = response.readline()
+        if not line:
+            break
+        event = json.loads(line)
+        if event["event"] == "answer" and first_token is None:
+            first_token = time.perf_counter() - start
+        elif event["event"] == "error":
+            error = event["error"]
+    return first_token, error
+
+
+def run_load_test(url, queries, concurrency=16, total_requests=1000, k=5, timeout=60.0, stream=False):
+    """Send `total_requests` POST /answer (or /answer/stream) calls from `concurrency` keep-alive clients"""
+    target = urlparse(url)
+    path = "/answer/stream" if stream else "/answer"
+    local = threading.local()
+    counter = iter(range(total_requests))
+    counter_lock = threading.Lock()
+    latencies = []
+    first_tokens = []
+    errors = []
+    results_lock = threading.Lock()
+
+    def connection():
+        if getattr(local, "conn", None) is None:
+            local.conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=timeout)
+        return local.conn
+
+    def worker():
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            body = json.dumps({"query": queries[i % len(queries)], "k": k})
+            start = time.perf_counter()
+            try:
+                conn = connection()
+                conn.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                first_token, stream_error = None, None
+                if stream and response.status == 200:
+                    first_token, stream_error = read_stream(response, start)
+                    payload = b""
+                else:
+                    payload = response.read()
+                elapsed = time.perf_counter() - start
+                with results_lock:
+                    if stream_error:
+                        errors.append(stream_error)
+                    elif response.status == 200:
+                        latencies.append(elapsed)
+                        if first_token is not None:
+                            first_tokens.append(first_token)
+                    else:
+                        errors.append(f"HTTP {response.status}: {payload[:200]!r}")
+            except (OSError, http.client.HTTPException) as e:
+                local.conn = None
+                with results_lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    first_tokens.sort()
+    return {
+        "requests": total_requests,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "concurrency": concurrency,
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] * 1000) if latencies else 0.0,
+        "ttft_p50_ms": percentile(first_tokens, 50) * 1000,
+        "ttft_p95_ms": percentile(first_tokens, 95) * 1000,
+    }
+
+
+def fetch_health(url):
+    target = urlparse(url)
+    conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=10)
+    conn.request("GET", "/health")
+    return json.loads(conn.getresponse().read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Medical QA HTTP server")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", help="text or JSONL file of questions")
+    parser.add_argument("--stream", action="store_true", help="use POST /answer/stream and report TTFT")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries) if args.queries else SAMPLE_QUERIES
+
+    print("="*70)
+    print(f"🔥 LOAD TEST: {args.url} ({len(queries)} distinct queries)")
+    print("="*70)
+
+    for concurrency in args.concurrency:
+        report = run_load_test(args.url, queries, concurrency, args.requests, args.k, stream=args.stream)
+        print(f"  concurrency={concurrency:<4} {report['throughput_rps']:8.1f} req/s   "
+              f"p50={report['p50_ms']:7.1f} ms  p95={report['p95_ms']:7.1f} ms  "
+              f"p99={report['p99_ms']:7.1f} ms  errors={report['errors']}")
+        if args.stream:
+            print(f"     first token: p50={report['ttft_p50_ms']:7.1f} ms  p95={report['ttft_p95_ms']:7.1f} ms")
+        if report["first_error"]:
+            print(f"     first error: {report['first_error']}")
+
+    health = fetch_health(args.url)
+    if args.stream:
+        streaming = health.get("streaming", {})
+        print(f"\n📊 Server streaming: {streaming.get('streams', 0)} streams, "
+              f"TTFT p50 {streaming.get('ttft_p50_ms', 0.0):.1f} ms, "
+              f"total p50 {streaming.get('total_p50_ms', 0.0):.1f} ms")
+        return
+    batching = health.get("batching", {})
+    print(f"\n📊 Server batching: {batching.get('batches', 0)} batches, "
+          f"mean size {batching.get('mean_batch_size', 0.0):.1f}, "
+          f"max {batching.get('max_batch_size_seen', 0)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Medical QA System - Router model
+MedicalMoE (gating network + experts) used to pick domains for a query
+
+Kept apart from medical_qa_inference so that importing the retrieval
+pipeline does not import torch until a router is actually loaded.
+"""
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+device = torch.device('cpu')
+
+
+# ============================================================================
+# MODEL CLASSES
+# ============================================================================
+
+class MedicalExpert(nn.Module):
+    """Single expert neural network"""
+    def __init__(self, input_dim=384, hidden_dim=512, output_dim=384):
+        super().__init__()
+        self.network = nn.Sequential(
+            nn.Linear(input_dim, hidden_dim),
+            nn.Tanh(),
+            nn.Linear(hidden_dim, output_dim)
+        )
+    def forward(self, x):
+        return self.network(x)
+
+
+class GatingNetwork(nn.Module):
+    """Gating network for routing"""
+    def __init__(self, input_dim=384, num_experts=3, hidden_dim=256):
+        super().__init__()
+        self.fc1 = nn.Linear(input_dim, hidden_dim)
+        self.relu = nn.ReLU()
+        self.dropout = nn.Dropout(0.1)
+        self.fc2 = nn.Linear(hidden_dim, num_experts)
+    def forward(self, x):
+        x = self.fc1(x)
+        x = self.relu(x)
+        x = self.dropout(x)
+        return self.fc2(x)
+
+
+class MedicalMoE(nn.Module):
+    """Mixture of Experts"""
+    def __init__(self, input_dim=384, hidden_dim=512, output_dim=384, num_experts=3, top_k=2,
+                 vectorized=True):
+        super().__init__()
+        self.num_experts = num_experts
+        self.top_k = min(top_k, num_experts)
+        self.experts = nn.ModuleList([
+            MedicalExpert(input_dim, hidden_dim, output_dim) for _ in range(num_experts)
+        ])
+        self.gating = GatingNetwork(input_dim, num_experts)
+        self.expert_names = None
+        # True: each expert runs once on all rows routed to it
+        # False: original per-row loop (kept for benchmarking)
+        self.vectorized = vectorized
+
+    def forward(self, x, return_router_logits=False):
+        router_logits = self.gating(x)
+        if return_router_logits:
+            return router_logits
+        router_probs = F.softmax(router_logits, dim=-1)
+        topk_probs, topk_indices = torch.topk(router_probs, self.top_k, dim=1)
+        topk_probs = topk_probs / topk_probs.sum(dim=1, keepdim=True)
+        if self.vectorized:
+            out = self._mix_vectorized(x, topk_probs, topk_indices)
+        else:
+            out = self._mix_loop(x, topk_probs, topk_indices)
+        return out, topk_indices
+
+    def _mix_loop(self, x, topk_probs, topk_indices):
+        batch_size = x.size(0)
+        out = torch.zeros(batch_size, x.size(1), device=x.device)
+        for i in range(self.top_k):
+            expert_idx_col = topk_indices[:, i]
+            weights = topk_probs[:, i]
+            for b in range(batch_size):
+                eidx = expert_idx_col[b].item()
+                out[b] += weights[b] * self.experts[eidx](x[b].unsqueeze(0)).squeeze(0)
+        return out
+
+    def _mix_vectorized(self, x, topk_probs, topk_indices):
+        # Same accumulation order as _mix_loop (slot 0 first, then slot 1, ...),
+        # but rows are gathered per expert so there is no per-row Python loop
+        out = torch.zeros(x.size(0), x.size(1), device=x.device)
+        for i in range(self.top_k):
+            expert_idx_col = topk_indices[:, i]
+            weights = topk_probs[:, i]
+            for eidx in range(self.num_experts):
+                rows = (expert_idx_col == eidx).nonzero(as_tuple=True)[0]
+                if rows.numel() == 0:
+                    continue
+                expert_out = self.experts[eidx](x[rows])
+                out.index_add_(0, rows, weights[rows].unsqueeze(1) * expert_out)
+        return out
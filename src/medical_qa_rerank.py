@@ -0,0 +1,164 @@
+"""
+Medical QA System - Cross-encoder reranking
+Optional rerank stage in place of llm_rerank's distance + keyword
+heuristic: a local cross-encoder (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+saved to a directory) scores every (query, candidate answer) pair of a
+query in one batched forward.
+
+Models differ in their output activation (sigmoid or raw logits,
+depending on their config), so the reranker always takes the raw logit
+and reports sigmoid(logit) as final_score: the answer's confidence is in
+[0, 1] like the heuristic's, which hyde_threshold and the conversation's
+thresholds assume.
+
+Scores are cached per (query, document) in a PairScoreCache, so a
+repeated query only scores candidates it has not seen. Each query has a
+time budget: when the forward does not finish in time the heuristic
+ranking is used instead, and the late scores still land in the cache.
+
+Usage (from the repository root):
+    python src/medical_qa_server.py --cross-encoder models/ms-marco-MiniLM-L-6-v2 --rerank-budget-ms 200
+    python src/medical_qa_benchmarks.py rerank --cross-encoder models/ms-marco-MiniLM-L-6-v2
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import numpy as np
+
+from medical_qa_cache import PairScoreCache
+
+
+DEFAULT_BUDGET_MS = 200.0
+DEFAULT_BATCH_SIZE = 32
+MAX_LENGTH = 256
+
+
+def load_cross_encoder(path, max_length=MAX_LENGTH):
+    """sentence_transformers.CrossEncoder from a local directory (never downloads)"""
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"❌ Cross-encoder not found at {path}")
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(path, max_length=max_length, device="cpu", local_files_only=True)
+
+
+def sigmoid(logit):
+    return float(1.0 / (1.0 + np.exp(-np.clip(logit, -60.0, 60.0))))
+
+
+def candidate_doc_id(candidate):
+    """Pair cache key of a candidate, or None if it has no document id"""
+    if candidate.get("doc_id") is None:
+        return None
+    if candidate.get("sentence") is not None:
+        # sentence-window candidates: each sentence of a document is its own passage
+        return (candidate["domain"], candidate["doc_id"], candidate["sentence"])
+    return (candidate["domain"], candidate["doc_id"])
+
+
+class CrossEncoderReranker:
+    """
+    Batched cross-encoder scoring with a pair cache and a per-query budget
+
+    Forwards run on one background thread (torch already uses every core
+    for a batch); a query that times out waiting for it gets None from
+    rerank() and its queued forward is cancelled if it has not started.
+    """
+
+    def __init__(self, model, cache=None, budget_ms=DEFAULT_BUDGET_MS, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.cache = cache if cache is not None else PairScoreCache()
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="medqa-rerank")
+
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.fallbacks = 0
+        self.pairs_scored = 0
+        self.forward_seconds = 0.0
+
+    def _predict(self, query, query_hash, answers, doc_ids):
+        import torch
+
+        start = time.perf_counter()
+        # raw logits whatever activation the model's config names
+        scores = np.asarray(self.model.predict([(query, a) for a in answers], batch_size=self.batch_size,
+                                               show_progress_bar=False, activation_fn=torch.nn.Identity()),
+                            dtype=np.float32)
+        if scores.ndim == 2:
+            scores = scores[:, -1]
+        self.cache.put_many(query_hash, {d: float(s) for d, s in zip(doc_ids, scores) if d is not None})
+        with self._lock:
+            self.pairs_scored += len(answers)
+            self.forward_seconds += time.perf_counter() - start
+        return scores.tolist()
+
+    def score(self, query, candidates, budget_ms=None):
+        """Cross-encoder logit of each candidate, or None if the budget ran out first"""
+        started = time.perf_counter()
+        query_hash = self.cache.query_hash(query)
+        doc_ids = [candidate_doc_id(c) for c in candidates]
+        scores = self.cache.get_many(query_hash, [d for d in doc_ids if d is not None])
+
+        missing = [i for i, d in enumerate(doc_ids) if d is None or d not in scores]
+        new_scores = {}
+        if missing:
+            future = self._executor.submit(self._predict, query, query_hash,
+                                           [candidates[i]["answer"] for i in missing],
+                                           [doc_ids[i] for i in missing])
+            budget_ms = self.budget_ms if budget_ms is None else budget_ms
+            timeout = None
+            if budget_ms:
+                timeout = max(0.0, budget_ms / 1000 - (time.perf_counter() - started))
+            try:
+                new_scores = dict(zip(missing, future.result(timeout=timeout)))
+            except TimeoutError:
+                future.cancel()
+                return None
+        return [new_scores[i] if i in new_scores else scores[doc_ids[i]] for i in range(len(candidates))]
+
+    def rerank(self, query, candidates, top_n=None, budget_ms=None):
+        """
+        The first `top_n` candidates (None = all) sorted by cross-encoder score
+
+        Returns llm_rerank-shaped dicts ("answer", "final_score", ...), or
+        None when the budget ran out, so the caller can fall back to
+        llm_rerank.
+        """
+        candidates = list(candidates[:top_n] if top_n else candidates)
+        if not candidates:
+            return []
+        scores = self.score(query, candidates, budget_ms)
+        with self._lock:
+            self.queries += 1
+            if scores is None:
+                self.fallbacks += 1
+        if scores is None:
+            return None
+        reranked = [{"answer": c["answer"], "cross_encoder_score": s, "final_score": sigmoid(s)}
+                    for c, s in zip(candidates, scores)]
+        return sorted(reranked, key=lambda x: x["final_score"], reverse=True)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "queries": self.queries,
+                "fallbacks": self.fallbacks,
+                "fallback_rate": self.fallbacks / self.queries if self.queries else 0.0,
+                "pairs_scored": self.pairs_scored,
+                "ms_per_pair": 1000 * self.forward_seconds / self.pairs_scored if self.pairs_scored else 0.0,
+                "budget_ms": self.budget_ms,
+            }
+        stats["pair_cache"] = self.cache.stats()
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def load_reranker(path, budget_ms=DEFAULT_BUDGET_MS, cache=None):
+    return CrossEncoderReranker(load_cross_encoder(path), cache=cache, budget_ms=budget_ms)
@@ -0,0 +1,199 @@
+"""
+Medical QA System - NumPy router fast path
+Routing only needs the MoE gating network (fc1 -> ReLU -> fc2), not the
+experts, so its weights are exported to router_gating.npz and applied
+with two NumPy matmuls: no torch import, autograd or module dispatch.
+
+router_gating.npz records a digest of the moe_router.pt it came from; a
+stale export (router retrained since) is ignored and the gating weights
+are taken from the torch checkpoint instead.
+
+Routing policy (select_routes): domains are taken in probability order
+until their cumulative probability reaches fanout_mass, bounded by
+min_fanout and max_fanout. Without fanout_mass every query gets
+max_fanout domains (2, as before); fanout_mass=0.9 with the default
+bounds sends a query whose top domain has >= 0.9 to that domain alone,
+and raising max_fanout lets flat distributions search more domains.
+
+Usage (from the repository root):
+    python src/medical_qa_router.py medical_qa_checkpoints/medical_qa_v1.0
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+
+ROUTER_CHECKPOINT_NAME = "moe_router.pt"
+ROUTER_EXPORT_NAME = "router_gating.npz"
+ROUTER_BACKENDS = ("numpy", "torch")
+DEFAULT_MIN_FANOUT = 1
+DEFAULT_MAX_FANOUT = 2
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def select_routes(probs, label_to_domain, fanout_mass=None, min_fanout=DEFAULT_MIN_FANOUT,
+                 max_fanout=DEFAULT_MAX_FANOUT):
+    """
+    One (selected_domains, selected_probs) pair per row of router probabilities
+
+    Highest probability first; as many domains as it takes for their
+    probabilities to add up to fanout_mass, within [min_fanout, max_fanout]
+    (always max_fanout without fanout_mass).
+    """
+    max_fanout = max(1, min(max_fanout, probs.shape[1]))
+    min_fanout = max(1, min(min_fanout, max_fanout))
+    top_indices = np.argsort(probs, axis=1)[:, ::-1][:, :max_fanout]
+    top_probs = np.take_along_axis(probs, top_indices, axis=1)
+    if fanout_mass is None:
+        fanouts = np.full(len(probs), max_fanout)
+    else:
+        # domains needed before the running sum reaches the mass
+        fanouts = np.clip((np.cumsum(top_probs, axis=1) < fanout_mass).sum(axis=1) + 1, min_fanout, max_fanout)
+    
+    routes = []
+    for indices, row_probs, fanout in zip(top_indices.tolist(), top_probs.tolist(), fanouts.tolist()):
+        routes.append(([label_to_domain[i] for i in indices[:fanout]], row_probs[:fanout]))
+    return routes
+
+
+class FanoutStats:
+    """Thread-safe count of domain searches, against always searching `baseline` domains"""
+
+    def __init__(self, baseline=DEFAULT_MAX_FANOUT):
+        self.baseline = baseline
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.searches = 0
+
+    def record(self, routes):
+        searches = sum(len(domains) for domains, _ in routes)
+        with self._lock:
+            self.queries += len(routes)
+            self.searches += searches
+
+    def stats(self):
+        with self._lock:
+            queries, searches = self.queries, self.searches
+        baseline = queries * self.baseline
+        return {
+            "queries": queries,
+            "domain_searches": searches,
+            "searches_saved": baseline - searches,
+            "saved_fraction": (baseline - searches) / baseline if baseline else 0.0,
+            "mean_fanout": searches / queries if queries else 0.0,
+        }
+
+
+class GatingRouter:
+    """MoE gating network as float32 NumPy arrays (eval mode: dropout is the identity)"""
+
+    def __init__(self, fc1_weight, fc1_bias, fc2_weight, fc2_bias, source_digest=None):
+        # stored transposed so logits are x @ W1 + b1 -> relu -> @ W2 + b2
+        self.w1 = np.ascontiguousarray(np.asarray(fc1_weight, dtype=np.float32).T)
+        self.b1 = np.asarray(fc1_bias, dtype=np.float32)
+        self.w2 = np.ascontiguousarray(np.asarray(fc2_weight, dtype=np.float32).T)
+        self.b2 = np.asarray(fc2_bias, dtype=np.float32)
+        self.source_digest = source_digest
+
+    @property
+    def num_domains(self):
+        return self.w2.shape[1]
+
+    @classmethod
+    def from_moe(cls, moe_model, source_digest=None):
+        gating = moe_model.gating
+        weights = [p.detach().cpu().numpy() for p in
+                   (gating.fc1.weight, gating.fc1.bias, gating.fc2.weight, gating.fc2.bias)]
+        return cls(*weights, source_digest=source_digest)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            digest = str(data["source_digest"]) if "source_digest" in data else None
+            return cls(data["fc1_weight"], data["fc1_bias"], data["fc2_weight"], data["fc2_bias"], digest)
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, fc1_weight=self.w1.T, fc1_bias=self.b1, fc2_weight=self.w2.T, fc2_bias=self.b2,
+                 source_digest=np.array(self.source_digest or ""))
+        os.replace(tmp_path, path)
+
+    def logits(self, query_embs):
+        hidden = np.asarray(query_embs, dtype=np.float32) @ self.w1
+        hidden += self.b1
+        np.maximum(hidden, 0, out=hidden)
+        logits = hidden @ self.w2
+        logits += self.b2
+        return logits
+
+    def probs(self, query_embs):
+        logits = self.logits(query_embs)
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def route(self, query_embs, label_to_domain, **policy):
+        """select_routes over this router's probabilities (policy: fanout_mass, min/max_fanout)"""
+        return select_routes(self.probs(query_embs), label_to_domain, **policy)
+
+
+def load_gating_router(checkpoint_path):
+    """The exported GatingRouter if it matches moe_router.pt, else None"""
+    export_path = os.path.join(checkpoint_path, ROUTER_EXPORT_NAME)
+    router_path = os.path.join(checkpoint_path, ROUTER_CHECKPOINT_NAME)
+    if not os.path.exists(export_path) or not os.path.exists(router_path):
+        return None
+    router = GatingRouter.load(export_path)
+    if router.source_digest != file_digest(router_path):
+        print(f"⚠️ {ROUTER_EXPORT_NAME} is older than {ROUTER_CHECKPOINT_NAME}; "
+              f"re-export it (python src/medical_qa_router.py {checkpoint_path})")
+        return None
+    return router
+
+
+def export_router(checkpoint_path, num_domains):
+    """Write router_gating.npz from the checkpoint's moe_router.pt; returns the GatingRouter"""
+    import torch
+    from medical_qa_models import GatingNetwork
+
+    router_path = os.path.join(checkpoint_path, ROUTER_CHECKPOINT_NAME)
+    state = torch.load(router_path, map_location='cpu')['model_state_dict']
+    gating = GatingNetwork(num_experts=num_domains)
+    gating.load_state_dict({k[len("gating."):]: v for k, v in state.items() if k.startswith("gating.")})
+
+    router = GatingRouter(
+        *(p.detach().numpy() for p in (gating.fc1.weight, gating.fc1.bias, gating.fc2.weight, gating.fc2.bias)),
+        source_digest=file_digest(router_path),
+    )
+    router.save(os.path.join(checkpoint_path, ROUTER_EXPORT_NAME))
+    return router
+
+
+def main():
+    import json
+
+    parser = argparse.ArgumentParser(description="Export the MoE gating network for NumPy routing")
+    parser.add_argument("checkpoint_path", help="e.g. medical_qa_checkpoints/medical_qa_v1.0")
+    args = parser.parse_args()
+
+    with open(os.path.join(args.checkpoint_path, "metadata.json")) as f:
+        num_domains = json.load(f)['num_domains']
+    router = export_router(args.checkpoint_path, num_domains)
+    print(f"✅ Wrote {os.path.join(args.checkpoint_path, ROUTER_EXPORT_NAME)} "
+          f"({router.w1.shape[0]} -> {router.w1.shape[1]} -> {router.num_domains})")
+
+
+if __name__ == "__main__":
+    main()
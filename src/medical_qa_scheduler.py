@@ -0,0 +1,190 @@
+"""
+Medical QA System - In-process micro-batching scheduler
+Lets many threads share batched encoder / router / FAISS passes
+
+Usage:
+    system = load_complete_system("medical_qa_v1.0")
+    with QueryScheduler(system, max_batch_size=32, max_wait_ms=5) as scheduler:
+        future = scheduler.submit("What are the symptoms of diabetes?")
+        result = future.result()          # same dict as retrieve_answer_full
+
+        emb, (domains, probs) = scheduler.submit_encode("migraine treatment").result()
+
+Callers never batch anything themselves: a background worker takes the
+oldest pending request, waits until either max_batch_size requests are
+queued or max_wait_ms has passed since that request arrived, and runs the
+whole group through one embedder.encode and one MedicalMoE gating forward
+(plus, for submit(), one FAISS search per domain).
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from medical_qa_inference import retrieve_answers_batch, route_queries
+
+
+ANSWER = "answer"
+ENCODE = "encode"
+
+
+class SchedulerClosed(RuntimeError):
+    """Raised when submitting to a scheduler that has been closed"""
+
+
+class QueryScheduler:
+    """
+    Coalesces concurrent single-query calls into batches under a latency deadline
+
+    workers: number of batch-processing threads. More than one lets a new
+    batch form and run while the previous one is still in FAISS/rerank.
+    """
+
+    def __init__(self, system, max_batch_size=32, max_wait_ms=5.0, workers=1):
+        self.system = system
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._pending = deque()        # (kind, k, text, future, enqueued_at)
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.requests = 0
+        self.batches = 0
+        self.max_seen_batch = 0
+        self.total_queue_wait = 0.0
+
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"medqa-scheduler-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ------------------------------------------------------------------
+    # public API
+    # ------------------------------------------------------------------
+
+    def submit(self, query, k=5):
+        """Future resolving to the retrieve_answer_full-style result dict"""
+        return self._enqueue(ANSWER, k, query)
+
+    def submit_encode(self, query):
+        """Future resolving to (embedding, (selected_domains, selected_probs))"""
+        return self._enqueue(ENCODE, None, query)
+
+    def answer(self, query, k=5, timeout=None):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(query, k).result(timeout)
+
+    def close(self, wait=True):
+        """Stop accepting work; pending requests are still processed"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "max_batch_size_seen": self.max_seen_batch,
+                "mean_queue_wait_ms": 1000.0 * self.total_queue_wait / self.requests if self.requests else 0.0,
+                "queue_depth": len(self._pending),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "workers": len(self._threads),
+            }
+
+    # ------------------------------------------------------------------
+    # worker
+    # ------------------------------------------------------------------
+
+    def _enqueue(self, kind, k, text):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise SchedulerClosed("scheduler is closed")
+            self._pending.append((kind, k, text, future, time.monotonic()))
+            # wake a worker if this completes a batch or is the first request
+            if len(self._pending) >= self.max_batch_size or len(self._pending) == 1:
+                self._cond.notify()
+        return future
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+            # deadline is measured from the oldest request, not from now
+            deadline = self._pending[0][4] + self.max_wait
+            while len(self._pending) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch_size, len(self._pending)))]
+            if self._pending:
+                # leftovers: let another worker start on them
+                self._cond.notify()
+
+            now = time.monotonic()
+            self.requests += len(batch)
+            self.batches += 1
+            self.max_seen_batch = max(self.max_seen_batch, len(batch))
+            self.total_queue_wait += sum(now - item[4] for item in batch)
+            return batch
+
+    def _worker(self):
+        # single-domain searches run on this thread: same OpenMP cap as the pool's
+        search_pool = self.system.get('search_pool')
+        if search_pool is not None:
+            search_pool.cap_thread()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            groups = {}
+            for item in batch:
+                groups.setdefault((item[0], item[1]), []).append(item)
+
+            for (kind, k), items in groups.items():
+                live = [item for item in items if item[3].set_running_or_notify_cancel()]
+                if not live:
+                    continue
+                texts = [item[2] for item in live]
+                try:
+                    if kind == ANSWER:
+                        results = retrieve_answers_batch(texts, self.system, k, batch_size=len(texts))
+                    else:
+                        results = self._encode_and_route(texts)
+                except BaseException as e:
+                    for item in live:
+                        item[3].set_exception(e)
+                    continue
+                for item, result in zip(live, results):
+                    item[3].set_result(result)
+
+    def _encode_and_route(self, texts):
+        embeddings = self.system['embedder'].encode(
+            texts, batch_size=len(texts), convert_to_numpy=True
+        ).astype(np.float32)
+        routes = route_queries(embeddings, self.system)
+        return [(embeddings[i:i + 1], routes[i]) for i in range(len(texts))]
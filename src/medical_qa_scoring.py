@@ -0,0 +1,186 @@
+"""
+Medical QA System - Answer scoring
+Keyword scoring, reranking and answer validation (no model dependencies,
+so tools that only score text import this module cheaply)
+
+The reranker works on term ids: a term id is a stable 64-bit hash of one
+lowercased whitespace token, and a document's answer terms are the sorted
+unique ids of `answer.lower().split()`. DocStores precompute them at build
+time (see medical_qa_docstore.write_docstore), so a query never re-splits
+candidate answers.
+"""
+
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+
+KEYWORD_STOPWORDS = frozenset({
+    'what', 'is', 'the', 'a', 'how', 'why', 'when', 'where',
+    'in', 'on', 'to', 'for', 'and', 'or', 'but'
+})
+
+
+# ============================================================================
+# TERM IDS
+# ============================================================================
+
+def term_id(word):
+    """Stable (process-independent) 64-bit id of a token"""
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def term_ids(words):
+    return np.fromiter((term_id(w) for w in words), dtype=np.int64)
+
+
+@lru_cache(maxsize=4096)
+def answer_terms(answer):
+    """
+    Sorted unique term ids of an answer's lowercased tokens
+
+    Memoized for stores without precomputed terms (pickled docs), where the
+    same retrieved answers come back query after query. Do not modify the
+    returned array.
+    """
+    return np.unique(term_ids(set(answer.lower().split())))
+
+
+# ============================================================================
+# HELPER FUNCTIONS FOR FULL INFERENCE
+# ============================================================================
+
+def keyword_score(query, answer):
+    """Simple keyword scoring"""
+    query_words = set(query.lower().split()) - KEYWORD_STOPWORDS
+    answer_words = set(answer.lower().split())
+    overlap = len(query_words & answer_words)
+    return min(1.0, overlap / max(len(query_words), 1))
+
+
+def _term_presence(candidate_terms, word_ids):
+    """(num_candidates, len(word_ids)) bool matrix: does candidate i contain word j"""
+    lengths = [len(t) for t in candidate_terms]
+    all_terms = np.concatenate(candidate_terms) if candidate_terms else np.empty(0, dtype=np.int64)
+    owner = np.repeat(np.arange(len(candidate_terms)), lengths)
+
+    unique_ids, inverse = np.unique(word_ids, return_inverse=True)
+    present = np.zeros((len(candidate_terms), len(unique_ids)), dtype=bool)
+    if len(unique_ids) and len(all_terms):
+        pos = np.minimum(np.searchsorted(unique_ids, all_terms), len(unique_ids) - 1)
+        found = unique_ids[pos] == all_terms
+        present[owner[found], pos[found]] = True
+    return present[:, inverse.reshape(-1)]
+
+
+def llm_rerank(query, candidate_answers, candidate_similarities=None, top_n=5, candidate_terms=None):
+    """
+    Rerank candidates - IMPROVED relevance check
+
+    Scores the first `top_n` candidates (None = all) in one vectorized pass
+    over their answer term ids. candidate_terms holds the precomputed ids
+    per candidate (None entries, or no list at all, are computed here).
+    Same scores as scoring each candidate with keyword_score + key-word check.
+    """
+    
+    if not candidate_answers:
+        return []
+    
+    # Normalize similarities
+    if candidate_similarities is not None and len(candidate_similarities) > 0:
+        min_s = min(candidate_similarities)
+        max_s = max(candidate_similarities)
+        
+        if max_s > min_s:
+            candidate_similarities = [(s - min_s) / (max_s - min_s) for s in candidate_similarities]
+        else:
+            candidate_similarities = [0.5] * len(candidate_answers)
+    else:
+        candidate_similarities = [0.5] * len(candidate_answers)
+    
+    answers = list(candidate_answers[:top_n])
+    if candidate_terms is None:
+        candidate_terms = [None] * len(answers)
+    terms = [t if t is not None else answer_terms(a) for t, a in zip(candidate_terms, answers)]
+    
+    query_words = query.lower().split()
+    
+    # Keyword overlap (keyword_score) for every candidate at once
+    keywords = sorted(set(query_words) - KEYWORD_STOPWORDS)
+    overlap = _term_presence(terms, term_ids(keywords)).sum(axis=1)
+    reranker_scores = np.minimum(1.0, overlap / max(len(keywords), 1))
+    
+    # IMPROVED: Penalize answers that don't address key query terms.
+    # A key word is matched if it occurs anywhere in the answer text; being
+    # one of the answer's tokens settles that, only the rest need a scan.
+    query_key_words = [w for w in query_words if len(w) > 4]
+    key_present = _term_presence(terms, term_ids(query_key_words))
+    lowered = {}
+    for i, j in zip(*np.nonzero(~key_present)):
+        if i not in lowered:
+            lowered[i] = answers[i].lower()
+        key_present[i, j] = query_key_words[j] in lowered[i]
+    key_word_ratios = key_present.sum(axis=1) / max(len(query_key_words), 1)
+    
+    scored_answers = []
+    for i, ans in enumerate(answers):
+        embedding_score = candidate_similarities[i]
+        reranker_score = float(reranker_scores[i])
+        key_word_ratio = float(key_word_ratios[i])
+        
+        # IMPROVED: Reduce score if key words missing
+        if key_word_ratio < 0.5:
+            reranker_score *= 0.5  # Penalize missing key terms
+        
+        # Combine scores
+        final_score = 0.7 * embedding_score + 0.3 * reranker_score
+        
+        scored_answers.append({
+            "answer": ans,
+            "embedding_score": embedding_score,
+            "reranker_score": reranker_score,
+            "key_word_ratio": key_word_ratio,
+            "final_score": final_score,
+        })
+    
+    # Sort by final score
+    return sorted(scored_answers, key=lambda x: x["final_score"], reverse=True)
+
+
+def validate_medical_answer(query, answer, confidence):
+    """Validate answer quality"""
+    
+    # Check minimum length
+    if len(answer) < 25:
+        return False, "Too short"
+    
+    # Clean answer
+    answer = answer.replace('ï¿½', '').replace('�', '')
+    
+    # Check sentence ending
+    if not answer.strip()[-1] in '.!?':
+        sentences = answer.split('.')
+        if len(sentences) > 1:
+            answer = '. '.join(sentences[:-1]) + '.'
+        else:
+            return False, "Incomplete"
+    
+    # Check query-answer overlap
+    query_core = set(query.lower().split()) - {
+        'what', 'are', 'the', 'is', 'how', 'why', 'when'
+    }
+    answer_words = set(answer.lower().split())
+    overlap_ratio = len(query_core & answer_words) / max(len(query_core), 1)
+    
+    # Check for medical content
+    has_medical_content = any(term in answer.lower() for term in [
+        'disease', 'symptoms', 'treatment', 'condition', 'patient',
+        'diagnosis', 'therapy', 'medicine', 'caused', 'risk'
+    ])
+    
+    # Validate
+    if overlap_ratio < 0.2 and not (len(answer) > 100 and has_medical_content):
+        return False, "Low relevance"
+    
+    return True, answer
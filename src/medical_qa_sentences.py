@@ -0,0 +1,314 @@
+"""
+Medical QA System - Sentence-window index
+Answers are split into sentences and every sentence gets its own vector;
+a query is matched against sentences and answered with the best sentence
+plus `window` sentences either side from the same answer, instead of the
+whole (often very long) answer passage.
+
+Per domain, next to the passage index:
+
+    {domain}_sentences.faiss   IndexFlatL2 over sentence embeddings
+    {domain}_sentences.npz     doc_ids (int32), offsets (int32: sentence
+                               number within its answer), spans (int32
+                               (n, 2): character range in the answer)
+
+Sentence rows are in document order, so a document's sentences are
+contiguous and a window is a slice of rows. metadata
+vector_db_stats[domain]["sentences"] records the counts and the DocStore
+id_epoch the doc_ids belong to; ingest appends the new documents'
+sentences and compaction renumbers them (medical_qa_ingest), without
+re-embedding the rest.
+
+Usage (from the repository root):
+    python src/medical_qa_build.py --version medical_qa_v1.1 --base medical_qa_v1.0 --sentence-index
+    python src/medical_qa_sentences.py medical_qa_checkpoints/medical_qa_v1.0 --workers 2
+"""
+
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+
+from medical_qa_docstore import DocStore, checkpoint_lock, docstore_exists, load_docs
+
+
+MIN_SENTENCE_CHARS = 20     # shorter pieces ("Key Points", "1.") join the next sentence
+SENTENCE_OVERFETCH = 4      # sentences searched per requested document
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+
+
+def sentence_index_paths(faiss_dir, domain):
+    return (os.path.join(faiss_dir, f"{domain}_sentences.faiss"),
+            os.path.join(faiss_dir, f"{domain}_sentences.npz"))
+
+
+def sentence_spans(text):
+    """(start, end) character ranges of the sentences of `text`"""
+    spans = []
+    start = len(text) - len(text.lstrip())
+    end_of_text = len(text.rstrip())
+    for match in _SENTENCE_BREAK.finditer(text, start, end_of_text):
+        if match.start() > start:
+            spans.append([start, match.start()])
+        start = match.end()
+    if start < end_of_text:
+        spans.append([start, end_of_text])
+
+    merged = []
+    for span in spans:
+        if merged and merged[-1][1] - merged[-1][0] < MIN_SENTENCE_CHARS:
+            merged[-1][1] = span[1]
+        else:
+            merged.append(span)
+    return [tuple(span) for span in merged]
+
+
+class SentenceIndex:
+    """A domain's sentence vectors and their (doc_id, offset, span) rows"""
+
+    def __init__(self, index, doc_ids, offsets, spans, id_epoch=0):
+        self.index = index
+        self.doc_ids = doc_ids
+        self.offsets = offsets
+        self.spans = spans
+        self.id_epoch = id_epoch
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def window_rows(self, row, window):
+        """Rows of the sentences within `window` of `row` in the same answer"""
+        first = row - min(window, int(self.offsets[row]))
+        last = row
+        while last + 1 < len(self.doc_ids) and last - row < window and self.doc_ids[last + 1] == self.doc_ids[row]:
+            last += 1
+        return first, last
+
+    def window_text(self, answer, row, window):
+        first, last = self.window_rows(row, window)
+        return answer[int(self.spans[first, 0]):int(self.spans[last, 1])]
+
+    def search(self, docs, query_embs, k, deleted=()):
+        """
+        Best `k` documents per row as (doc_id, dist, sentence row) triples
+
+        A document ranks by its best sentence; tombstoned documents are
+        skipped.
+        """
+        fetch = min(len(self), k * SENTENCE_OVERFETCH + len(deleted))
+        if fetch == 0:
+            return [[] for _ in range(len(query_embs))]
+        D, I = self.index.search(np.ascontiguousarray(query_embs), fetch)
+        deleted = set(int(d) for d in deleted)
+        results = []
+        for D_row, I_row in zip(D, I):
+            hits = []
+            seen = set()
+            for dist, row in zip(D_row, I_row):
+                if row < 0:
+                    continue
+                doc_id = int(self.doc_ids[row])
+                if doc_id in seen or doc_id in deleted or doc_id >= len(docs):
+                    continue
+                seen.add(doc_id)
+                hits.append((doc_id, float(dist), int(row)))
+                if len(hits) == k:
+                    break
+            results.append(hits)
+        return results
+
+
+def _save_rows(path, doc_ids, offsets, spans, id_epoch):
+    with open(path + ".tmp", 'wb') as f:
+        np.savez(f, doc_ids=np.asarray(doc_ids, dtype=np.int32), offsets=np.asarray(offsets, dtype=np.int32),
+                 spans=np.asarray(spans, dtype=np.int32).reshape(-1, 2), id_epoch=np.int64(id_epoch))
+    os.replace(path + ".tmp", path)
+
+
+def save_sentence_index(faiss_dir, domain, sentence_index, num_docs):
+    """Write (by rename) a domain's sentence files; returns the metadata stats"""
+    import faiss
+
+    index_path, rows_path = sentence_index_paths(faiss_dir, domain)
+    faiss.write_index(sentence_index.index, index_path + ".tmp")
+    _save_rows(rows_path, sentence_index.doc_ids, sentence_index.offsets, sentence_index.spans,
+               sentence_index.id_epoch)
+    os.replace(index_path + ".tmp", index_path)
+    return {
+        "num_sentences": len(sentence_index),
+        "num_docs": num_docs,
+        "id_epoch": sentence_index.id_epoch,
+    }
+
+
+def sentence_index_exists(faiss_dir, domain):
+    return all(os.path.exists(p) for p in sentence_index_paths(faiss_dir, domain))
+
+
+def load_sentence_index(faiss_dir, domain):
+    import faiss
+
+    index_path, rows_path = sentence_index_paths(faiss_dir, domain)
+    with np.load(rows_path, allow_pickle=False) as rows:
+        return SentenceIndex(faiss.read_index(index_path), rows["doc_ids"], rows["offsets"], rows["spans"],
+                             int(rows["id_epoch"]))
+
+
+def load_sentence_indexes(faiss_dir, domains):
+    """domain -> SentenceIndex for the domains that have one"""
+    return {domain: load_sentence_index(faiss_dir, domain)
+            for domain in domains if sentence_index_exists(faiss_dir, domain)}
+
+
+# ============================================================================
+# BUILD / UPDATE
+# ============================================================================
+
+class EncoderBatches:
+    """EmbeddingPool's submit/drain interface over an in-process encoder"""
+
+    def __init__(self, embedder, batch_size=64):
+        self.embedder = embedder
+        self.batch_size = batch_size
+
+    def submit(self, tag, texts):
+        vectors = self.embedder.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                       normalize_embeddings=True)
+        return [(tag, np.asarray(vectors, dtype=np.float32))]
+
+    def drain(self):
+        return []
+
+
+def embed_sentences(docs, pool, first_id=0, batch_size=256):
+    """
+    Split and embed the answers of `docs` (ids first_id, first_id + 1, ...)
+
+    pool: an EmbeddingPool (medical_qa_build) or EncoderBatches. Returns
+    (index, doc_ids, offsets, spans); sentences go to the embedder in
+    batches while the answers are read, so only the rows are kept whole.
+    """
+    import faiss
+
+    index = None
+    doc_ids, offsets, spans = [], [], []
+    texts = []
+
+    def add(finished):
+        nonlocal index
+        for _, vectors in finished:
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    for i, doc in enumerate(docs):
+        answer = doc["answer"]
+        for offset, (start, end) in enumerate(sentence_spans(answer)):
+            doc_ids.append(first_id + i)
+            offsets.append(offset)
+            spans.append((start, end))
+            texts.append(answer[start:end])
+            if len(texts) == batch_size:
+                add(pool.submit(None, texts))
+                texts = []
+    if texts:
+        add(pool.submit(None, texts))
+    add(pool.drain())
+    return index, doc_ids, offsets, spans
+
+
+def build_sentence_index(faiss_dir, domain, docs, pool, dim, batch_size=256, id_epoch=0):
+    """Write {domain}_sentences.*; returns the metadata stats"""
+    import faiss
+
+    index, doc_ids, offsets, spans = embed_sentences(docs, pool, batch_size=batch_size)
+    if index is None:
+        index = faiss.IndexFlatL2(dim)
+    return save_sentence_index(faiss_dir, domain, SentenceIndex(index, doc_ids, offsets, spans, id_epoch), len(docs))
+
+
+def appended_sentences(faiss_dir, domain, docs, first_id, embedder, batch_size=64):
+    """The domain's SentenceIndex plus the sentences of documents appended as first_id, ... (ingest)"""
+    current = load_sentence_index(faiss_dir, domain)
+    index, doc_ids, offsets, spans = embed_sentences(docs, EncoderBatches(embedder, batch_size), first_id, batch_size)
+    if index is not None:
+        current.index.add(_all_vectors(index))
+    return SentenceIndex(
+        current.index,
+        np.concatenate([current.doc_ids, np.asarray(doc_ids, dtype=np.int32)]),
+        np.concatenate([current.offsets, np.asarray(offsets, dtype=np.int32)]),
+        np.concatenate([current.spans, np.asarray(spans, dtype=np.int32).reshape(-1, 2)]),
+        current.id_epoch,
+    )
+
+
+def compacted_sentences(faiss_dir, domain, keep, id_epoch):
+    """The domain's SentenceIndex for documents `keep` (sorted old ids) renumbered 0, 1, ... (compaction)"""
+    import faiss
+
+    current = load_sentence_index(faiss_dir, domain)
+    rows = np.flatnonzero(np.isin(current.doc_ids, keep))
+    index = faiss.IndexFlatL2(current.index.d)
+    if len(rows):
+        index.add(_all_vectors(current.index)[rows])
+    return SentenceIndex(index, np.searchsorted(keep, current.doc_ids[rows]).astype(np.int32),
+                         current.offsets[rows], current.spans[rows], id_epoch)
+
+
+def _all_vectors(index):
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# ============================================================================
+# CHECKPOINT
+# ============================================================================
+
+def build_checkpoint_sentences(checkpoint_path, domains=None, workers=2, batch_size=256):
+    """Build the sentence index of every (or the given) domain of an existing checkpoint"""
+    import faiss
+    from medical_qa_build import EmbeddingPool
+    from medical_qa_embedder import load_embedder_config
+    from medical_qa_indexes import _write_metadata
+    from medical_qa_ingest import WRITER_LOCK
+
+    faiss_dir = os.path.join(checkpoint_path, "faiss_indexes")
+    model_name = load_embedder_config(checkpoint_path)["model_name"]
+    report = {}
+    with checkpoint_lock(checkpoint_path, exclusive=True, name=WRITER_LOCK):
+        with open(os.path.join(checkpoint_path, "metadata.json")) as f:
+            metadata = json.load(f)
+        with EmbeddingPool(model_name, workers=workers, batch_size=batch_size) as pool:
+            for domain in domains or metadata['domain_list']:
+                if not docstore_exists(faiss_dir, domain) and not os.path.exists(os.path.join(faiss_dir, f"{domain}_docs.pkl")):
+                    continue
+                docs = load_docs(faiss_dir, domain)
+                id_epoch = docs.id_epoch if isinstance(docs, DocStore) else 0
+                dim = faiss.read_index(os.path.join(faiss_dir, f"{domain}_index.faiss")).d
+                stats = build_sentence_index(faiss_dir, domain, docs, pool, dim, batch_size, id_epoch)
+                metadata['vector_db_stats'].setdefault(domain, {})["sentences"] = stats
+                report[domain] = stats
+                print(f"  ✓ {domain}: {stats['num_sentences']} sentences from {stats['num_docs']} documents")
+        with checkpoint_lock(checkpoint_path, exclusive=True):
+            _write_metadata(checkpoint_path, metadata)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build sentence-window indexes for a checkpoint")
+    parser.add_argument("checkpoint_path", help="e.g. medical_qa_checkpoints/medical_qa_v1.0")
+    parser.add_argument("--domains", nargs="+")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="embedding processes (0 = embed in this process)")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    print(f"✂️ Building sentence indexes for {args.checkpoint_path}")
+    build_checkpoint_sentences(args.checkpoint_path, args.domains, args.workers, args.batch_size)
+    print("✅ Done")
+
+
+if __name__ == "__main__":
+    main()
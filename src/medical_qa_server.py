@@ -0,0 +1,360 @@
+"""
+Medical QA System - HTTP inference server
+Loads the system once and serves answers over HTTP (stdlib asyncio only)
+
+Endpoints:
+    GET  /health          liveness + batching stats
+    POST /answer          {"query": "...", "k": 5}        -> result dict
+    POST /answer/batch    {"queries": ["...", ...], "k": 5} -> {"results": [...]}
+    POST /answer/stream   {"query": "...", "k": 5}        -> NDJSON events (chunked)
+
+Concurrent requests are micro-batched: the front end submits each query
+to a QueryScheduler, whose worker threads hand up to --max-batch-size
+queries (waiting at most --max-wait-ms for more to arrive) to
+retrieve_answers_batch, so encoding and FAISS search happen once per batch.
+
+/answer/stream is not batched: it runs one query's pipeline stage by
+stage (medical_qa_stream.stream_answer) and writes each event as a line
+as soon as it is ready, so clients see the routing decision and the
+first answer chunk early; /health reports its time to first token and
+total time separately.
+
+Usage (from the repository root):
+    python src/medical_qa_server.py --port 8000 --max-batch-size 32 --max-wait-ms 5
+    python src/medical_qa_loadtest.py --url http://127.0.0.1:8000
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from medical_qa_cache import AnswerCache, EmbeddingCache
+from medical_qa_conversation import get_advanced_doctor_recommendation
+from medical_qa_inference import load_complete_system
+from medical_qa_scheduler import QueryScheduler
+from medical_qa_stream import StreamStats, stream_answer
+
+
+MAX_BODY_BYTES = 1 << 20
+MAX_K = 50
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class BadRequest(Exception):
+    """Client error, reported as HTTP 400"""
+
+
+# ============================================================================
+# MICRO-BATCHER
+# ============================================================================
+
+class MicroBatcher:
+    """
+    asyncio adapter over QueryScheduler
+
+    The scheduler's worker threads do the coalescing and the heavy work;
+    this only turns its concurrent futures into awaitables.
+    """
+
+    def __init__(self, system, max_batch_size=32, max_wait_ms=5.0, workers=2):
+        self.scheduler = QueryScheduler(
+            system, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, workers=workers
+        )
+
+    async def submit(self, query, k):
+        return await asyncio.wrap_future(self.scheduler.submit(query, k))
+
+    def stop(self):
+        self.scheduler.close(wait=False)
+
+    def stats(self):
+        return self.scheduler.stats()
+
+
+# ============================================================================
+# HTTP FRONT END
+# ============================================================================
+
+def _parse_k(payload):
+    k = payload.get("k", 5)
+    if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= MAX_K:
+        raise BadRequest(f"'k' must be an integer between 1 and {MAX_K}")
+    return k
+
+
+def _parse_query(query):
+    if not isinstance(query, str) or not query.strip():
+        raise BadRequest("'query' must be a non-empty string")
+    return query.strip()
+
+
+class MedicalQAServer:
+    """Minimal HTTP/1.1 server (keep-alive, JSON bodies) in front of a MicroBatcher"""
+
+    def __init__(self, system, batcher):
+        self.system = system
+        self.batcher = batcher
+        self.stream_stats = StreamStats()
+        # stream stages search FAISS on these threads: cap OpenMP like the search pool's
+        search_pool = system.get('search_pool')
+        self.stream_executor = ThreadPoolExecutor(
+            thread_name_prefix="medqa-stream",
+            initializer=search_pool.cap_thread if search_pool is not None else None,
+        )
+        self.started_at = time.time()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0) or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method, path, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if inspect.isgenerator(payload):
+                    await self._respond_stream(writer, payload, keep_alive)
+                else:
+                    await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=float).encode('utf-8')
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"\r\n"
+        ).encode('latin-1')
+        writer.write(head + body)
+        await writer.drain()
+
+    async def _respond_stream(self, writer, events, keep_alive):
+        """Send a stream's events as chunked NDJSON, each line as soon as it is produced"""
+        head = (
+            f"HTTP/1.1 200 OK\r\n"
+            f"Content-Type: application/x-ndjson\r\n"
+            f"Transfer-Encoding: chunked\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"\r\n"
+        ).encode('latin-1')
+        writer.write(head)
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    # each stage runs off the event loop
+                    event = await loop.run_in_executor(self.stream_executor, next, events, None)
+                except Exception as e:
+                    event = {"event": "error", "error": f"{type(e).__name__}: {e}"}
+                if event is None:
+                    break
+                if event["event"] == "done":
+                    self.stream_stats.record(event["timings"])
+                line = (json.dumps(event, default=float) + "\n").encode('utf-8')
+                writer.write(f"{len(line):X}\r\n".encode('latin-1') + line + b"\r\n")
+                await writer.drain()
+                if event["event"] == "error":
+                    break
+        finally:
+            events.close()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def open_stream(self, query, k):
+        def recommend(result):
+            return get_advanced_doctor_recommendation(
+                result['selected_experts'], result['confidence_score'], result['best_answer'])
+        return stream_answer(query, self.system, k, recommend=recommend)
+
+    async def dispatch(self, method, path, body):
+        path = path.split("?", 1)[0]
+        try:
+            if path == "/health":
+                if method != "GET":
+                    return 405, {"error": "use GET"}
+                return 200, self.health()
+
+            if path in ("/answer", "/answer/batch", "/answer/stream"):
+                if method != "POST":
+                    return 405, {"error": "use POST"}
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    raise BadRequest("body must be JSON")
+                if not isinstance(payload, dict):
+                    raise BadRequest("body must be a JSON object")
+
+                k = _parse_k(payload)
+                if path == "/answer":
+                    return 200, await self.batcher.submit(_parse_query(payload.get("query")), k)
+                if path == "/answer/stream":
+                    return 200, self.open_stream(_parse_query(payload.get("query")), k)
+
+                queries = payload.get("queries")
+                if not isinstance(queries, list) or not queries:
+                    raise BadRequest("'queries' must be a non-empty list of strings")
+                queries = [_parse_query(q) for q in queries]
+                results = await asyncio.gather(*(self.batcher.submit(q, k) for q in queries))
+                return 200, {"results": list(results)}
+
+            return 404, {"error": f"no route for {path}"}
+
+        except BadRequest as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+
+    def health(self):
+        unified_index = self.system.get('unified_index')
+        stats = {
+            "status": "ok",
+            "checkpoint": self.system.get('checkpoint_id'),
+            "domains": unified_index.domains if unified_index is not None else sorted(self.system['vector_dbs']),
+            "retrieval_mode": self.system.get('retrieval_mode', 'dense'),
+            "embedder_backend": self.system.get('embedder_config', {}).get('backend', 'torch'),
+            "collapse_duplicates": self.system.get('collapse_duplicates', False),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "batching": self.batcher.stats(),
+            "streaming": self.stream_stats.stats(),
+        }
+        if self.system.get('search_pool') is not None:
+            stats["search_pool"] = self.system['search_pool'].stats()
+        if self.system.get('fanout_stats') is not None:
+            stats["routing"] = self.system['fanout_stats'].stats()
+        for name in ('embedding_cache', 'answer_cache', 'reranker', 'hyde'):
+            if self.system.get(name) is not None:
+                stats[name] = self.system[name].stats()
+        return stats
+
+
+async def serve(system, host="127.0.0.1", port=8000, max_batch_size=32, max_wait_ms=5.0, workers=2):
+    batcher = MicroBatcher(system, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, workers=workers)
+    app = MedicalQAServer(system, batcher)
+
+    server = await asyncio.start_server(app.handle_connection, host, port)
+    print(f"🚀 Serving on http://{host}:{port} "
+          f"(max batch {max_batch_size}, max wait {max_wait_ms} ms, {workers} workers)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher.stop()
+        app.stream_executor.shutdown(wait=False)
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Medical QA HTTP inference server")
+    parser.add_argument("--checkpoint", default="medical_qa_v1.0")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--index-mode", choices=["per_domain", "unified"])
+    parser.add_argument("--retrieval-mode", choices=["dense", "hybrid"])
+    parser.add_argument("--router-backend", choices=["numpy", "torch"])
+    parser.add_argument("--fanout-mass", type=float,
+                        help="search domains until their router probability adds up to this")
+    parser.add_argument("--cross-encoder", help="local cross-encoder directory used to rerank candidates")
+    parser.add_argument("--rerank-budget-ms", type=float,
+                        help="per-query cross-encoder time before falling back to heuristic reranking (0 = no limit)")
+    parser.add_argument("--hyde-model", help="local seq2seq model directory for HyDE retrieval")
+    parser.add_argument("--hyde-mode", choices=["replace", "fuse"])
+    parser.add_argument("--hyde-threshold", type=float,
+                        help="only use HyDE when the direct answer's confidence is below this")
+    parser.add_argument("--hyde-max-new-tokens", type=int)
+    parser.add_argument("--sentence-window", type=int,
+                        help="answer with the best sentence plus this many either side (needs sentence indexes)")
+    parser.add_argument("--search-workers", type=int,
+                        help="threads searching a query's domains concurrently (1 = one after another)")
+    parser.add_argument("--min-fanout", type=int, help="fewest domains searched per query")
+    parser.add_argument("--max-fanout", type=int, help="most domains searched per query")
+    parser.add_argument("--collapse-duplicates", action="store_true", default=None,
+                        help="rerank one candidate per near-duplicate answer group")
+    parser.add_argument("--embedding-cache-mb", type=float, default=0,
+                        help="in-memory embedding cache size (0 disables)")
+    parser.add_argument("--answer-cache-size", type=int, default=0,
+                        help="answer cache entries (0 disables)")
+    parser.add_argument("--answer-cache-ttl", type=float, default=3600.0)
+    args = parser.parse_args()
+
+    embedding_cache = None
+    if args.embedding_cache_mb > 0:
+        embedding_cache = EmbeddingCache(max_bytes=int(args.embedding_cache_mb * 2**20))
+    answer_cache = None
+    if args.answer_cache_size > 0:
+        answer_cache = AnswerCache(max_entries=args.answer_cache_size, ttl_seconds=args.answer_cache_ttl)
+
+    system = load_complete_system(
+        args.checkpoint,
+        index_mode=args.index_mode,
+        retrieval_mode=args.retrieval_mode,
+        collapse_duplicates=args.collapse_duplicates,
+        router_backend=args.router_backend,
+        fanout_mass=args.fanout_mass,
+        min_fanout=args.min_fanout,
+        max_fanout=args.max_fanout,
+        search_workers=args.search_workers,
+        sentence_window=args.sentence_window,
+        cross_encoder=args.cross_encoder,
+        rerank_budget_ms=args.rerank_budget_ms,
+        hyde_model=args.hyde_model,
+        hyde_mode=args.hyde_mode,
+        hyde_threshold=args.hyde_threshold,
+        hyde_max_new_tokens=args.hyde_max_new_tokens,
+        embedding_cache=embedding_cache,
+        answer_cache=answer_cache,
+    )
+
+    try:
+        asyncio.run(serve(
+            system,
+            host=args.host,
+            port=args.port,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            workers=args.workers,
+        ))
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Medical QA System - Streaming answers
+Generator versions of the answer pipeline that yield staged events as
+each stage finishes, so a client can render the routing decision and
+the first words of the answer before the whole result is ready:
+
+    {"event": "routing", "domains": [...], "probabilities": [...]}
+    {"event": "candidates", "count": n, "top": [{"domain", "doc_id", "similarity"}, ...]}
+    {"event": "answer", "text": "..."}            one per chunk of the answer
+    {"event": "recommendation", "doctor": ..., "urgency": ..., ...}
+    {"event": "done", "result": {...}, "timings": {"ttft_ms", "total_ms", "stages_ms"}}
+
+Joining the "answer" texts gives result["best_answer"] exactly. ttft_ms
+(time to first token) runs from the start of the stream to the first
+answer chunk; total_ms to the done event.
+
+Usage (from the repository root):
+    python src/medical_qa_server.py            # POST /answer/stream
+    python src/medical_qa_loadtest.py --stream
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from medical_qa_inference import (
+    apply_hyde,
+    candidate_similarity,
+    needs_hyde,
+    route_queries,
+    search_candidates,
+    select_best_answer,
+)
+
+
+DEFAULT_CHUNK_CHARS = 80
+
+
+def answer_chunks(text, chunk_chars=DEFAULT_CHUNK_CHARS):
+    """Split `text` into pieces of at most chunk_chars, at whitespace where possible"""
+    start = 0
+    while start < len(text):
+        end = start + chunk_chars
+        if end < len(text):
+            cut = text.rfind(" ", start + 1, end)
+            if cut > start:
+                end = cut + 1
+        yield text[start:end]
+        start = end
+
+
+class StreamTimer:
+    """Stage, first-token and total times of one stream"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.stages = {}
+        self.ttft = None
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = 1000 * (now - self.last)
+        self.last = now
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = 1000 * (time.perf_counter() - self.start)
+
+    def timings(self):
+        total = 1000 * (time.perf_counter() - self.start)
+        return {
+            "ttft_ms": self.ttft if self.ttft is not None else total,
+            "total_ms": total,
+            "stages_ms": dict(self.stages),
+        }
+
+
+def candidate_event(candidates, limit=5):
+    return {
+        "event": "candidates",
+        "count": len(candidates),
+        "top": [{"domain": c["domain"], "doc_id": c.get("doc_id"), "similarity": candidate_similarity(c)}
+                for c in candidates[:limit]],
+    }
+
+
+def answer_events(text, timer, chunk_chars=DEFAULT_CHUNK_CHARS):
+    for chunk in answer_chunks(text, chunk_chars):
+        timer.first_token()
+        yield {"event": "answer", "text": chunk}
+
+
+def final_result(events):
+    """Run a stream to the end; returns its done event"""
+    done = None
+    for event in events:
+        if event["event"] == "done":
+            done = event
+    return done
+
+
+def stream_answer(query, system, k=5, chunk_chars=DEFAULT_CHUNK_CHARS, recommend=None):
+    """
+    retrieve_answer_full as a stream of events (no progress prints)
+
+    recommend: optional callable(result) -> dict, sent as the
+    "recommendation" event after the answer.
+    """
+    timer = StreamTimer()
+    answer_cache = system.get('answer_cache')
+    result = None
+    if answer_cache is not None:
+        result = answer_cache.get(system['checkpoint_id'], query, k)
+        timer.mark("cache")
+
+    if result is not None:
+        yield {"event": "routing", "domains": result["selected_experts"], "probabilities": None, "cached": True}
+    else:
+        query_emb = system['embedder'].encode([query], convert_to_numpy=True).astype(np.float32)
+        timer.mark("embed")
+
+        routes = route_queries(query_emb, system)
+        selected_domains, selected_probs = routes[0]
+        timer.mark("route")
+        yield {"event": "routing", "domains": selected_domains, "probabilities": list(selected_probs)}
+
+        candidates = search_candidates(query_emb, routes, system, k, [query])[0]
+        timer.mark("search")
+        yield candidate_event(candidates, k)
+
+        result = select_best_answer(query, candidates, selected_domains, reranker=system.get('reranker'))
+        if system.get('hyde') is not None and needs_hyde(result, system.get('hyde_threshold')):
+            result = apply_hyde([query], query_emb, [result], system, k)[0]
+        timer.mark("rerank")
+
+        if answer_cache is not None:
+            answer_cache.put(system['checkpoint_id'], query, k, result)
+
+    yield from answer_events(result["best_answer"], timer, chunk_chars)
+    timer.mark("answer")
+
+    if recommend is not None:
+        yield {"event": "recommendation", **recommend(result)}
+        timer.mark("recommendation")
+
+    yield {"event": "done", "result": result, "timings": timer.timings()}
+
+
+class StreamStats:
+    """Thread-safe time-to-first-token and total latency of recent streams"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self._ttft = deque(maxlen=window)
+        self._total = deque(maxlen=window)
+
+    def record(self, timings):
+        with self._lock:
+            self.streams += 1
+            self._ttft.append(timings["ttft_ms"])
+            self._total.append(timings["total_ms"])
+
+    def stats(self):
+        with self._lock:
+            ttft, total = sorted(self._ttft), sorted(self._total)
+            streams = self.streams
+
+        def pct(values, p):
+            return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] if values else 0.0
+
+        return {
+            "streams": streams,
+            "ttft_p50_ms": pct(ttft, 50),
+            "ttft_p95_ms": pct(ttft, 95),
+            "total_p50_ms": pct(total, 50),
+            "total_p95_ms": pct(total, 95),
+        }
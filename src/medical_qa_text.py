@@ -0,0 +1,53 @@
+"""
+Medical QA System - Query text normalization
+Spelling correction and cache-key normalization shared by the pipelines
+"""
+
+import re
+from difflib import get_close_matches
+
+
+MEDICAL_VOCABULARY = [
+    'cure', 'cancer', 'disease', 'treatment', 'symptoms',
+    'diagnosis', 'improve', 'heart', 'diabetes', 'cardiology',
+    'neurology', 'dermatology', 'query', 'consult', 'patient',
+    'infection', 'therapy', 'medication', 'hospital', 'blood',
+    'pressure', 'stroke', 'attack', 'skin', 'pain', 'risk',
+    'factor', 'prevent', 'cause', 'effect', 'health'
+]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def correct_spelling(query):
+    """
+    Lowercase the query and fix close misspellings of medical vocabulary
+
+    Returns (corrected_query, corrections) where corrections is a list of
+    "wrong→right" strings.
+    """
+    corrected_words = []
+    corrections = []
+
+    for word in query.lower().split():
+        matches = get_close_matches(word, MEDICAL_VOCABULARY, n=1, cutoff=0.85)
+
+        if matches and matches[0] != word:
+            corrected_words.append(matches[0])
+            corrections.append(f"{word}→{matches[0]}")
+        else:
+            corrected_words.append(word)
+
+    return ' '.join(corrected_words), corrections
+
+
+def normalize_query(query, spell_correct=True):
+    """
+    Cache key for a query: spell-corrected, lowercased, whitespace-collapsed
+
+    all-MiniLM-L6-v2 is uncased and splits on whitespace, so lowercasing and
+    collapsing whitespace never change the embedding.
+    """
+    if spell_correct:
+        return correct_spelling(query)[0]
+    return _WHITESPACE.sub(' ', query.lower()).strip()